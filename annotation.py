@@ -0,0 +1,233 @@
+import hashlib
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+import thumbnails
+from instrumentation import Instrumentation
+
+# The Vision API accepts at most 16 images in one synchronous "batch_annotate_images" request
+MAX_IMAGES_PER_REQUEST = 16
+
+# Both features are requested for every image in one request. They are given by the names of "vision.Feature.Type", so
+# that the Vision library, which is slow to import, is only loaded with its client
+FEATURES = [
+    {'type_': 'OBJECT_LOCALIZATION'},
+    {'type_': 'TEXT_DETECTION'},
+]
+
+
+class AnnotationCache:
+    """
+    The annotations of the Vision API, kept in a SQLite database keyed by the SHA-256 of the image, so that an image
+    is never annotated twice, even under different URLs.
+    """
+
+    def __init__(self, path: str = 'data/annotations.db'):
+        """
+        :param path: Default "data/annotations.db". The SQLite database of the cache.
+        """
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS annotations (hash TEXT PRIMARY KEY, annotation TEXT NOT NULL)')
+        self._db.commit()
+
+    def get(self, digest: str):
+        """
+        :param digest: The SHA-256 of the image.
+        :return: The annotation of the image, or None if it is not cached.
+        """
+        row = self._db.execute('SELECT annotation FROM annotations WHERE hash = ?', (digest,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, annotations: dict):
+        """
+        :param annotations: A dictionary of the annotations to cache, keyed by the SHA-256 of the images.
+        """
+        self._db.executemany('INSERT OR REPLACE INTO annotations VALUES (?, ?)',
+                             [(digest, json.dumps(annotation)) for digest, annotation in annotations.items()])
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+def _parse_response(response) -> dict:
+    """
+    Keep the parts of an "AnnotateImageResponse" used in the pipeline.
+
+    :return: A dictionary of "objects", a list of dictionaries of "name" and "score", and "text", the full text detected
+      or None, and "error", the error message or None.
+    """
+    objects = response.localized_object_annotations
+    texts = response.text_annotations
+    return {
+        'objects': [{'name': object_.name, 'score': object_.score} for object_ in objects],
+        'text': texts[0].description if texts else None,
+        'error': response.error.message or None,
+    }
+
+
+def _annotate_batch(client, images: list, instrumentation: Instrumentation = None) -> list:
+    """
+    Request object localization and text detection for a batch of images in one request.
+
+    :param client: The Vision API client, i.e. "vision.ImageAnnotatorClient()".
+    :param images: Pairs of (URL, bytes of the image or None). The API downloads the images without bytes itself.
+    :param instrumentation: Default None. If given, count the request as a "vision.batch_annotate_images" call, with
+      one quota unit for each feature of each image, as the API is charged, and the images that failed as errors.
+    :return: A list of the parsed annotations, in the order of the images.
+    """
+    requests = [{'image': {'content': content} if content else {'source': {'image_uri': url}}, 'features': FEATURES}
+                for url, content in images]
+
+    start = perf_counter()
+    try:
+        response = client.batch_annotate_images(requests=requests)
+    except Exception:
+        if instrumentation is not None:
+            instrumentation.count('vision.batch_annotate_images', calls=1, errors=len(images),
+                                  seconds=perf_counter() - start)
+        raise
+
+    annotations = [_parse_response(r) for r in response.responses]
+    if instrumentation is not None:
+        instrumentation.count('vision.batch_annotate_images', calls=1, quota_units=len(images) * len(FEATURES),
+                              errors=sum(1 for annotation in annotations if annotation['error']),
+                              seconds=perf_counter() - start)
+    return annotations
+
+
+def annotate_thumbnails(urls: list, client, cache: AnnotationCache = None,
+                        thumbnail_cache: thumbnails.ThumbnailCache = None, batch_size: int = MAX_IMAGES_PER_REQUEST,
+                        concurrency: int = 4, workers: int = 16, chunk_size: int = 1024,
+                        instrumentation: Instrumentation = None) -> list:
+    """
+    Detect the objects and the texts on the thumbnails with the Google Cloud Vision API. Both features of up to 16
+    thumbnails are requested in one request, a bounded number of requests are sent concurrently, and the annotations
+    are cached by the hash of the image. The thumbnails are downloaded and annotated in chunks, as in
+    "thumbnails.dominant_colors", so that only one chunk of images is held in memory.
+
+    :param urls: The URLs of the thumbnails.
+    :param client: The Vision API client, i.e. "vision.ImageAnnotatorClient()", or a stub with the same
+      "batch_annotate_images" method.
+    :param cache: Default None. If given, look up the images in the cache first, and cache the successful annotations.
+    :param thumbnail_cache: Default None. If given, reuse the thumbnails downloaded in the previous steps.
+    :param batch_size: Default 16. The number of images in each request.
+    :param concurrency: Default 4. How many requests to send concurrently.
+    :param workers: Default 16. How many thumbnails to download concurrently.
+    :param chunk_size: Default 1024. The number of thumbnails in each chunk.
+    :param instrumentation: Default None. If given, count the downloads and the requests, as in "download_thumbnail"
+      and "_annotate_batch".
+    :return: A list of dictionaries of "objects", "text" and "error", as returned by "_parse_response", in the order of
+      the URLs.
+    """
+    annotations = []
+
+    # The annotations requested so far, by the hash of the image, or by the URL if it was not downloaded, so that the
+    # same image is only requested once
+    annotated = {}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for start in tqdm(range(0, len(urls), chunk_size), desc='Scanning thumbnails...'):
+            chunk = urls[start:start + chunk_size]
+            contents = thumbnails.download_thumbnails(chunk, thumbnail_cache, workers, instrumentation)
+            keys = [hashlib.sha256(content).hexdigest() if content else url for url, content in zip(chunk, contents)]
+
+            chunk_annotations = [annotated.get(key) for key in keys]
+            pending = []
+            requested = {}
+            for i, (url, content, key) in enumerate(zip(chunk, contents, keys)):
+                if chunk_annotations[i] is None and content and cache is not None:
+                    chunk_annotations[i] = cache.get(key)
+                if chunk_annotations[i] is None and key not in requested:
+                    requested[key] = len(pending)
+                    pending.append((url, content))
+
+            batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+            results = [annotation
+                       for batch in executor.map(lambda batch: _annotate_batch(client, batch, instrumentation), batches)
+                       for annotation in batch]
+            for key, position in requested.items():
+                annotated[key] = results[position]
+
+            for i, key in enumerate(keys):
+                if chunk_annotations[i] is None:
+                    chunk_annotations[i] = annotated[key]
+
+            # Only the images downloaded are cached, under their hashes
+            if cache is not None:
+                cache.put({key: annotated[key] for key, (url, content) in zip(requested, pending)
+                           if content and not annotated[key]['error']})
+
+            annotations += chunk_annotations
+
+    return annotations
+
+
+def thumbnail_features(annotations: list, index=None, score_threshold: float = 0.5,
+                       sparse: bool = False) -> pd.DataFrame:
+    """
+    Turn the annotations of the thumbnails into the "thumbnail_*" feature columns, all at once.
+
+    The object counts are accumulated as coordinates of (row, label, count) and the text lines as one list per row, and
+    the columns are only built at the end, so the time and memory do not grow with the number of labels seen.
+
+    :param annotations: The annotations, as returned by "annotate_thumbnails".
+    :param index: Default None. The index of the returned DataFrame, e.g. the index of the dataset.
+    :param score_threshold: Default 0.5. The minimum score for an object to be counted in its label column.
+    :param sparse: Default false. If true, the label columns are sparse, which saves memory for large vocabularies.
+    :return: DataFrame of the columns "thumbnail_objects" with the number of objects, "thumbnail_text_length" with the
+      number of text lines, "thumbnail_text_content", "thumbnail_<label>" with the number of objects of each label
+      scored above the threshold, and "thumbnail_text_<n>" with the n-th text line.
+    """
+    n = len(annotations)
+    labels = {}  # Column of each label, in the order they are first seen
+    rows, columns, counts = [], [], []
+    text_lines = []
+    object_counts = np.zeros(n, dtype='int64')
+    text_lengths = np.zeros(n, dtype='int64')
+
+    for i, annotated in enumerate(annotations):
+        object_counts[i] = len(annotated['objects'])
+
+        for object_ in annotated['objects']:
+            column = labels.setdefault('thumbnail_' + object_['name'].replace(' ', '').lower(), len(labels))
+            if object_['score'] > score_threshold:
+                rows.append(i)
+                columns.append(column)
+                counts.append(1)
+
+        lines = annotated['text'].split('\n')[:-1] if annotated['text'] else []
+        text_lengths[i] = len(lines)
+        text_lines.append(lines)
+
+    features = pd.DataFrame({
+        'thumbnail_objects': object_counts,
+        'thumbnail_text_length': text_lengths,
+        'thumbnail_text_content': None,
+    }, index=index)
+
+    # Duplicated coordinates are summed when the matrix is built
+    if sparse:
+        from scipy.sparse import coo_matrix
+
+        matrix = coo_matrix((np.array(counts, dtype='int64'), (rows, columns)), shape=(n, len(labels)))
+        label_columns = pd.DataFrame.sparse.from_spmatrix(matrix, index=features.index, columns=list(labels))
+    else:
+        matrix = np.zeros((n, len(labels)), dtype='int64')
+        np.add.at(matrix, (np.array(rows, dtype='int64'), np.array(columns, dtype='int64')), 1)
+        label_columns = pd.DataFrame(matrix, index=features.index, columns=list(labels))
+
+    max_text_length = int(text_lengths.max()) if n else 0
+    texts = np.full((n, max_text_length), None, dtype=object)
+    for i, lines in enumerate(text_lines):
+        texts[i, :len(lines)] = lines
+    text_columns = pd.DataFrame(texts, index=features.index,
+                                columns=['thumbnail_text_' + str(x) for x in range(max_text_length)])
+
+    return pd.concat([features, label_columns, text_columns], axis=1)
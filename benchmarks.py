@@ -0,0 +1,739 @@
+"""
+Offline benchmarks of the data processing functions and of the whole pipeline, on synthetic data shaped like the
+returns of the Google APIs, with the stand-ins of "fakes" in place of the API clients. No API key or network connection
+is needed.
+
+Run with "python benchmarks.py". The results are appended to data/benchmarks/results.jsonl, and the runs can be
+compared with "compare_results".
+"""
+
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+from glob import glob
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from PIL import Image
+
+import cleaning
+import colors
+import columnar
+import dataset
+import durations
+import fakes
+import fetchers
+import pipeline
+import scraping
+import thumbnails
+import titles
+from instrumentation import Instrumentation
+
+RESULTS_PATH = 'data/benchmarks/results.jsonl'
+
+# The spaCy model of the POS tagging of the title features
+POS_MODEL = 'en_core_web_sm'
+
+
+def legacy_parse_video_details(video_details, scrape_time: datetime):
+    """
+    The row-based parser that "scraping.parse_video_details" replaced, kept as the baseline of the benchmark. It builds
+    a dictionary of dictionaries keyed by video ID, then transposes it into a DataFrame of object columns.
+    """
+    df = {}
+
+    for d in video_details:
+
+        # Skip videos without view counts (Previous YouTube Originals videos)
+        if not d.get('statistics').get('viewCount'):
+            continue
+
+        video_id = d['id']
+        sub = d.get('channel_subscribers')
+        view = int(d.get('statistics').get('viewCount'))
+
+        # Choose certain useful information and append into a list
+        df[video_id] = ({
+            'title': d.get('snippet').get('title'),
+            'view': view,
+            'channel_sub': sub,
+            'view_to_sub': view / sub,
+            'like': d.get('statistics').get('likeCount'),
+            'dislike': d.get('statistics').get('dislikeCount'),
+            'comment': d.get('statistics').get('commentCount'),
+            'length': d.get('contentDetails').get('duration'),
+            'description': d.get('snippet').get('description'),
+            'dimension': d.get('contentDetails').get('dimension'),
+            'definition': d.get('contentDetails').get('definition'),
+            'caption': d.get('contentDetails').get('caption'),
+            'published_at': d.get('snippet').get('publishedAt'),
+            'tags': d.get('snippet').get('tags'),
+            'category': d.get('snippet').get('categoryId'),
+        })
+
+        if d.get('snippet').get('thumbnails').get('maxres'):
+            df[video_id]['thumbnail'] = d.get('snippet').get('thumbnails').get('maxres').get('url')
+        elif d.get('snippet').get('thumbnails').get('standard'):
+            df[video_id]['thumbnail'] = d.get('snippet').get('thumbnails').get('standard').get('url')
+        else:
+            df[video_id]['thumbnail'] = d.get('snippet').get('thumbnails').get('high').get('url')
+
+        try:
+            df[video_id]['localizations'] = d.get('localizations').keys()
+        except AttributeError:
+            df[video_id]['localizations'] = ''
+
+        try:
+            df[video_id]['topic_categories'] = d.get('topicDetails').get('topicCategories')
+        except AttributeError:
+            df[video_id]['topic_categories'] = ''
+
+        try:
+            df[video_id]['default_language'] = d.get('snippet').get('defaultLanguage')
+        except AttributeError:
+            df[video_id]['default_language'] = ''
+
+        if 'liveStreamingDetails' in d:
+            df[video_id]['live'] = 1
+        else:
+            df[video_id]['live'] = 0
+
+    df = DataFrame(df).transpose()
+    df.scrape_time = scrape_time
+
+    return df
+
+
+def synthetic_video_details(n: int, seed: int = 0):
+    """
+    Generate the details of videos in the format returned by the YouTube API, with "channel_subscribers" added as by
+    "get_video_from_channels".
+
+    :param n: How many videos to generate.
+    :param seed: Default 0. The seed of the random generator.
+    :return: A generator of the video details.
+    """
+    rng = random.Random(seed)
+
+    for i in range(n):
+        detail = fakes.synthetic_video_detail(f'v{i:010d}', rng)
+        detail['channel_subscribers'] = rng.randrange(1000, 10 ** 7)
+        yield detail
+
+
+def benchmark_parse_video_details(sizes: tuple = (10_000, 100_000, 1_000_000)) -> list:
+    """
+    Compare the time taken by "scraping.parse_video_details" and the legacy row-based parser.
+
+    :param sizes: Default (10k, 100k, 1M). The numbers of videos to parse.
+    :return: A list of dictionaries of the results, one for each size.
+    """
+    results = []
+    scrape_time = datetime.now().replace(microsecond=0)
+
+    for n in sizes:
+        result = {'benchmark': 'parse_video_details', 'size': n}
+
+        for name, function in [('legacy', legacy_parse_video_details), ('columnar', scraping.parse_video_details)]:
+            start = time.perf_counter()
+            df = function(synthetic_video_details(n), scrape_time)
+            result[name + '_seconds'] = time.perf_counter() - start
+            result[name + '_bytes'] = int(df.memory_usage(deep=True).sum())
+            del df
+
+        result['speedup'] = result['legacy_seconds'] / result['columnar_seconds']
+        print(result)
+        results.append(result)
+
+    return results
+
+
+def legacy_length_parse(length):
+    """
+    The row-based duration parser that "durations.parse_durations" replaced, kept as the baseline of the benchmark. It
+    assumes that the durations with two parts are minutes and seconds, so e.g. "PT1H3S" is wrong.
+    """
+    length = re.split('[HM]', length[2:-1])
+    if len(length) == 3:
+        length = int(length[0]) * 3600 + int(length[1]) * 60 + int(length[2])
+    elif len(length) == 2:
+        length = int(length[0]) * 60 + int(length[1])
+    else:
+        length = int(length[0])
+    return length
+
+
+def synthetic_durations(n: int, seed: int = 0) -> pd.Series:
+    """
+    Generate ISO 8601 durations in the format returned by the YouTube API, with every combination of hours, minutes
+    and seconds.
+
+    :param n: How many durations to generate.
+    :param seed: Default 0. The seed of the random generator.
+    :return: A Series of the durations.
+    """
+    rng = np.random.default_rng(seed)
+    hours, minutes, seconds = rng.integers(0, 3, n), rng.integers(0, 60, n), rng.integers(0, 60, n)
+
+    def part(values, unit):
+        return pd.Series(np.where(values > 0, values.astype(str).astype(object) + unit, ''))
+
+    lengths = 'PT' + part(hours, 'H') + part(minutes, 'M') + part(seconds, 'S')
+    return lengths.where(lengths != 'PT', 'P0D')
+
+
+def benchmark_parse_durations(n: int = 1_000_000) -> dict:
+    """
+    Compare the time taken by "durations.parse_durations" and the legacy row-based parser, and count the durations
+    they disagree on. The conversion of "published_at" into naive datetimes and hours is compared as well.
+
+    :param n: Default 1M. The number of durations and timestamps to parse.
+    :return: A dictionary of the results.
+    """
+    lengths = synthetic_durations(n)
+    published_at = pd.Series(pd.date_range('2020-01-01', periods=n, freq='37s').strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+    start = time.perf_counter()
+    legacy = lengths.apply(lambda length: legacy_length_parse(length) if length != 'P0D' else 0)
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = durations.parse_durations(lengths)
+    vectorized_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pd.to_datetime(published_at).apply(datetime.replace, tzinfo=None).apply(lambda x: x.hour)
+    legacy_published_at_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pd.to_datetime(published_at, utc=True).dt.tz_convert(None).dt.hour
+    vectorized_published_at_seconds = time.perf_counter() - start
+
+    result = {
+        'benchmark': 'parse_durations',
+        'size': n,
+        'legacy_seconds': legacy_seconds,
+        'vectorized_seconds': vectorized_seconds,
+        'speedup': legacy_seconds / vectorized_seconds,
+        'legacy_wrong': int((legacy != vectorized).sum()),
+        'legacy_published_at_seconds': legacy_published_at_seconds,
+        'vectorized_published_at_seconds': vectorized_published_at_seconds,
+        'published_at_speedup': legacy_published_at_seconds / vectorized_published_at_seconds,
+    }
+    print(result)
+    return result
+
+
+def _pos_tagger(nlp, benchmark: str):
+    """
+    The spaCy pipeline of a benchmark of the title features. It must have a tagger, as the POS tagging is what the
+    benchmarks measure, and a blank pipeline would only time the tokenizer.
+
+    :param nlp: The spaCy pipeline, or None to load "en_core_web_sm".
+    :param benchmark: The name of the benchmark.
+    :return: The pipeline, or None if the model is not installed, in which case the benchmark is skipped.
+    """
+    if nlp is None:
+        try:
+            nlp = titles.load_pos_tagger(POS_MODEL)
+        except OSError:
+            print(f'Skipped the benchmark "{benchmark}": the spaCy model "{POS_MODEL}" is not installed, which can be '
+                  f'installed by "python -m spacy download {POS_MODEL}".')
+            return None
+
+    if 'tagger' not in nlp.pipe_names:
+        raise ValueError(f'The spaCy pipeline of the benchmark "{benchmark}" has no tagger, so no POS would be tagged')
+    return nlp
+
+
+def legacy_title_features(df: DataFrame, nlp=None) -> DataFrame:
+    """
+    The row-based title features that "titles.title_features" replaced, kept as the baseline of the benchmark. The
+    first word of every title is tagged separately.
+    """
+    df = df.copy()
+    df['title_length'] = df['title'].apply(len)
+
+    df['any_capitalized_word'] = np.nan
+    titles_tokenized = list(df['title'].apply(str.split))
+    for i, title in enumerate(titles_tokenized):
+        df.iat[i, df.columns.get_loc('any_capitalized_word')] = \
+            any([True if word == word.upper() else False for word in title])
+
+    df['all_capitalized_word'] = df['title'].apply(lambda x: 1 if x == x.upper() else 0)
+
+    if nlp is not None:
+        first_words = df['title'].apply(lambda x: x.split()[0])
+        df['title_first_pos'] = [nlp(word)[0].pos_ for word in first_words]
+    return df
+
+
+def benchmark_title_features(sizes: tuple = (10_000, 100_000), nlp=None) -> list:
+    """
+    Compare the time taken by "titles.title_features" and the legacy row-based features.
+
+    :param sizes: Default (10k, 100k). The numbers of titles.
+    :param nlp: Default None. The spaCy pipeline of the POS tagging, which must have a tagger. "en_core_web_sm" if
+      None.
+    :return: A list of dictionaries of the results, one for each size, empty if the model is not installed.
+    """
+    nlp = _pos_tagger(nlp, 'title_features')
+    if nlp is None:
+        return []
+
+    results = []
+    for n in sizes:
+        df = DataFrame({'title': [detail['snippet']['title'] for detail in synthetic_video_details(n)]})
+
+        start = time.perf_counter()
+        legacy_title_features(df, nlp)
+        legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        titles.title_features(df['title'], nlp)
+        vectorized_seconds = time.perf_counter() - start
+
+        result = {
+            'benchmark': 'title_features',
+            'size': n,
+            'legacy_seconds': legacy_seconds,
+            'vectorized_seconds': vectorized_seconds,
+            'speedup': legacy_seconds / vectorized_seconds,
+        }
+        print(result)
+        results.append(result)
+
+    return results
+
+
+def make_image_fixtures(directory: str, n: int = 200, seed: int = 0):
+    """
+    Write synthetic thumbnails to a directory, made of noisy blocks of a few colours, as JPEG files of 480x360.
+
+    :param directory: The directory of the images.
+    :param n: Default 200. How many images to write.
+    :param seed: Default 0. The seed of the random generator.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    for i in range(n):
+        palette = rng.integers(0, 256, (rng.integers(2, 8), 3))
+        blocks = rng.integers(0, len(palette), (360 // 40 + 1, 480 // 40 + 1)).repeat(40, 0).repeat(40, 1)[:360, :480]
+        pixels = np.clip(palette[blocks] + rng.normal(0, 20, (360, 480, 3)), 0, 255).astype('uint8')
+        Image.fromarray(pixels).save(os.path.join(directory, f'{i:05d}.jpg'), quality=90)
+
+
+def benchmark_dominant_color(directory: str = 'data/fixtures/images', quality: int = 125,
+                             processes: int = None) -> dict:
+    """
+    Compare the time taken and the colours found by "colors.dominant_colors" and ColorThief on the images of a
+    directory. Synthetic images are written first if the directory has none.
+
+    :param directory: Default "data/fixtures/images". The directory of the JPEG images.
+    :param quality: Default 125. The "quality" of ColorThief.
+    :param processes: Default None. The number of processes of the NumPy engine, the number of CPUs if None.
+    :return: A dictionary of the results.
+    """
+    # ColorThief is only needed as the baseline
+    from colorthief import ColorThief
+
+    if not glob(os.path.join(directory, '*.jpg')):
+        make_image_fixtures(directory)
+
+    contents = []
+    for path in sorted(glob(os.path.join(directory, '*.jpg'))):
+        with open(path, 'rb') as file:
+            contents.append(file.read())
+
+    start = time.perf_counter()
+    expected = [ColorThief(BytesIO(content)).get_color(quality=quality) for content in contents]
+    colorthief_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found = colors.dominant_colors(contents, quality, processes=1)
+    numpy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    colors.dominant_colors(contents, quality, processes=processes)
+    parallel_seconds = time.perf_counter() - start
+
+    differences = [max(abs(a - b) for a, b in zip(x, y)) for x, y in zip(expected, found)]
+    result = {
+        'benchmark': 'dominant_color',
+        'size': len(contents),
+        'colorthief_seconds': colorthief_seconds,
+        'numpy_seconds': numpy_seconds,
+        'parallel_seconds': parallel_seconds,
+        'speedup': colorthief_seconds / numpy_seconds,
+        'exact_matches': sum(difference == 0 for difference in differences),
+        'max_difference': max(differences, default=0),
+    }
+    print(result)
+    return result
+
+
+def benchmark_pipeline(sizes: tuple = (1_000, 10_000), directory: str = 'data/benchmarks/pipeline',
+                       images: str = 'data/fixtures/images', processes: int = None) -> list:
+    """
+    Time the whole pipeline offline: the scraping of the videos from "fakes.FakeYouTube" into the master dataset, and
+    the cleaning of "cleaning.build_pipeline" with the stand-ins of the Translate and Vision APIs, first from scratch,
+    then again with every stage cached. The thumbnails are served from a cache filled with the image fixtures.
+
+    :param sizes: Default (1k, 10k). The numbers of videos, scraped from channels of 10 videos.
+    :param directory: Default "data/benchmarks/pipeline". The directory of the files of the runs, which is emptied
+      first.
+    :param images: Default "data/fixtures/images". The directory of the JPEG fixtures of the thumbnails.
+    :param processes: Default None. The number of processes finding the dominant colours, the number of CPUs if None.
+    :return: A list of dictionaries of the results, one for each size, with the time of each stage.
+    """
+    if not glob(os.path.join(images, '*.jpg')):
+        make_image_fixtures(images)
+
+    contents = []
+    for path in sorted(glob(os.path.join(images, '*.jpg'))):
+        with open(path, 'rb') as file:
+            contents.append(file.read())
+
+    results = []
+    for n in sizes:
+        work = os.path.join(directory, str(n))
+        shutil.rmtree(work, ignore_errors=True)
+        os.makedirs(work)
+
+        instruments = Instrumentation(f'benchmark_pipeline_{n}')
+        youtube = fakes.FakeYouTube(videos_per_channel=10)
+        channels = [f'UC{i:022d}' for i in range(-(-n // 10))]
+        path = os.path.join(work, 'videos.db')
+
+        with instruments.stage('collect') as stage:
+            videos = scraping.iter_video_from_channels('offline', channels, how_many_videos=10, batched=True,
+                                                       youtube=youtube, instrumentation=instruments)
+            parsed = scraping.parse_video_details(videos, datetime(2021, 1, 1))
+            store = dataset.DatasetStore(path)
+            stage['rows'] = store.upsert(parsed)
+            store.close()
+
+        thumbnail_cache = thumbnails.ThumbnailCache(os.path.join(work, 'thumbnails'))
+        for i, url in enumerate(parsed['thumbnail']):
+            thumbnail_cache.put(url, contents[i % len(contents)])
+        thumbnail_cache.close()
+
+        translate_client = fakes.FakeTranslateClient()
+        vision_client = fakes.FakeVisionClient()
+        pipeline = cleaning.build_pipeline(path, translate_client, vision_client, fakes.CATEGORIES,
+                                           cache_directory=os.path.join(work, 'pipeline'), language_cache=None,
+                                           thumbnail_cache=os.path.join(work, 'thumbnails'), annotation_cache=None,
+                                           scrape_runs=os.path.join(work, 'scrape_runs.csv'), processes=processes,
+                                           instrumentation=instruments)
+
+        start = time.perf_counter()
+        cleaned = pipeline.run(['cleaned'], instrumentation=instruments)['cleaned']
+        clean_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pipeline.run(['cleaned'])
+        cached_seconds = time.perf_counter() - start
+
+        result = {
+            'benchmark': 'pipeline',
+            'size': n,
+            'rows': len(cleaned),
+            'clean_seconds': clean_seconds,
+            'cached_seconds': cached_seconds,
+            'youtube_requests': youtube.requests,
+            'translate_requests': translate_client.requests,
+            'vision_requests': vision_client.requests,
+            **{stage['name'] + '_seconds': stage['seconds'] for stage in instruments.stages},
+        }
+        print(result)
+        results.append(result)
+
+    return results
+
+
+def benchmark_sharding(sizes: tuple = (100_000, 1_000_000), chunk_size: int = 50_000, workers: int = None,
+                       nlp=None) -> list:
+    """
+    Compare the title features of the cleaning, (5), computed in one process and in chunks across processes by
+    "pipeline.Sharded", as in "cleaning.build_pipeline" with a chunk size, and check that the outputs are the same.
+
+    :param sizes: Default (100k, 1M). The numbers of videos.
+    :param chunk_size: Default 50000. The number of rows of each chunk.
+    :param workers: Default None. The number of processes, the number of CPUs if None.
+    :param nlp: Default None. The spaCy pipeline of the POS tagging, with a tagger. "en_core_web_sm" if None.
+    :return: A list of dictionaries of the results, one for each size, or an empty list if the model is not installed.
+    """
+    nlp = _pos_tagger(nlp, 'sharding')
+    if nlp is None:
+        return []
+
+    sharded_title_features = pipeline.Sharded(cleaning.title_features, chunk_size, workers, columns=['title'])
+
+    results = []
+    for n in sizes:
+        df = scraping.parse_video_details(synthetic_video_details(n), datetime(2021, 1, 1))
+        result = {'benchmark': 'sharding', 'size': n, 'chunk_size': chunk_size,
+                  'workers': sharded_title_features.workers}
+
+        start = time.perf_counter()
+        single = cleaning.title_features(df, nlp=nlp, n_process=1)
+        result['single_seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sharded = sharded_title_features(df, nlp=nlp, n_process=1)
+        result['sharded_seconds'] = time.perf_counter() - start
+
+        result['same'] = single.equals(sharded)
+        result['speedup'] = result['single_seconds'] / result['sharded_seconds']
+        print(result)
+        results.append(result)
+
+    return results
+
+
+def benchmark_storage(sizes: tuple = (100_000, 1_000_000), directory: str = 'data/benchmarks/storage') -> list:
+    """
+    Compare the Parquet files of "columnar" with the CSVs they replace: the time to write them, their sizes, the time
+    to load everything with the dtypes restored, and the time to load three columns of the videos over 5M views.
+
+    :param sizes: Default (100k, 1M). The numbers of videos.
+    :param directory: Default "data/benchmarks/storage". The directory of the files written.
+    :return: A list of dictionaries of the results, one for each size.
+    """
+    os.makedirs(directory, exist_ok=True)
+    results = []
+
+    for n in sizes:
+        df = scraping.parse_video_details(synthetic_video_details(n), datetime(2021, 1, 1)).rename_axis('video_id')
+        rng = np.random.default_rng(n)
+        df['thumbnail_dominant_color'] = list(map(tuple, rng.integers(0, 256, (len(df), 3)).tolist()))
+
+        csv_path = os.path.join(directory, f'videos_{n}.csv')
+        parquet_path = os.path.join(directory, f'videos_{n}.parquet')
+        columns = ['title', 'view', 'view_to_sub']
+        result = {'benchmark': 'storage', 'size': n}
+
+        start = time.perf_counter()
+        df.to_csv(csv_path)
+        result['csv_write_seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columnar.write_table(df, parquet_path)
+        result['parquet_write_seconds'] = time.perf_counter() - start
+
+        result['csv_bytes'] = os.path.getsize(csv_path)
+        result['parquet_bytes'] = os.path.getsize(parquet_path)
+
+        # The CSV needs the lists, the tuples and the datetimes parsed back from their strings
+        start = time.perf_counter()
+        columnar.read_csv(csv_path)
+        result['csv_read_seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columnar.read_table(parquet_path)
+        result['parquet_read_seconds'] = time.perf_counter() - start
+
+        # The CSV has to be scanned in full even for a few columns and rows
+        start = time.perf_counter()
+        selected = pd.read_csv(csv_path, index_col=0, usecols=['video_id'] + columns)
+        selected = selected[selected['view'] > 5_000_000]
+        result['csv_select_seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columnar.read_table(parquet_path, columns=columns, filters=[('view', '>', 5_000_000)])
+        result['parquet_select_seconds'] = time.perf_counter() - start
+
+        result['selected_rows'] = len(selected)
+        result['size_ratio'] = result['csv_bytes'] / result['parquet_bytes']
+        result['speedup'] = result['csv_read_seconds'] / result['parquet_read_seconds']
+        result['select_speedup'] = result['csv_select_seconds'] / result['parquet_select_seconds']
+        print(result)
+        results.append(result)
+
+    return results
+
+
+# The packages that are slow to import, which a subcommand of "cli" should only load if it uses them
+SLOW_IMPORTS = ['pandas', 'googleapiclient.discovery', 'google.cloud.vision', 'google.cloud.translate_v2',
+                'spacy', 'selenium']
+
+
+def benchmark_startup(n: int = 1_000, directory: str = 'data/benchmarks/startup') -> list:
+    """
+    Time the start of the subcommands of "cli", each in a new interpreter as it is run from the command line: the wall
+    time of the process, the time it spent importing, and which of the slow packages it imported. The subcommands run
+    offline, on a raw file of synthetic videos.
+
+    :param n: Default 1000. The number of videos of the raw file.
+    :param directory: Default "data/benchmarks/startup". The working directory of the subcommands, which is emptied
+      first.
+    :return: A list of dictionaries of the results, one for each subcommand.
+    """
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(os.path.join(directory, 'data', 'raw'))
+
+    raw = os.path.join('data', 'raw', '20210101_000000.jsonl')
+    with open(os.path.join(directory, raw), 'w', encoding='utf-8') as file:
+        for detail in synthetic_video_details(n):
+            file.write(json.dumps(detail) + '\n')
+
+    commands = {
+        'help': ['--help'],
+        'parse': ['parse', raw],
+        'clean_raw': ['clean', '--stage', 'raw', '--path', 'data/videos.db'],
+    }
+    cli = os.path.abspath('cli.py')
+
+    results = []
+    for name, arguments in commands.items():
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, '-X', 'importtime', cli] + arguments, cwd=directory,
+                                 capture_output=True, text=True, check=True)
+        seconds = time.perf_counter() - start
+
+        # Each line is "import time: self [us] | cumulative | package", with the packages nested by indentation
+        imports = [line.split('|') for line in process.stderr.splitlines() if line.startswith('import time:')]
+        imports = [(int(cumulative), package) for _, cumulative, package in imports[1:]]
+        imported = {package.strip() for _, package in imports}
+        startup = re.search(r'Started in ([\d.]+)s', process.stdout)
+
+        result = {
+            'benchmark': 'startup_' + name,
+            'size': n,
+            'seconds': seconds,
+            'import_seconds': sum(cumulative for cumulative, package in imports if not package.startswith('  ')) / 1e6,
+            'startup_seconds': float(startup.group(1)) if startup else None,
+            'slow_imports': [package for package in SLOW_IMPORTS if package in imported],
+        }
+        print(result)
+        results.append(result)
+
+    return results
+
+
+def make_channel_fixtures(directory: str, n: int = 1_000, links: int = 5, seed: int = 0) -> str:
+    """
+    Write synthetic "channels" pages to a directory, as read by "fetchers.FileFetcher": every channel links a few random
+    other channels, so a crawl from the first channel reaches most of them in a few levels.
+
+    :param directory: The directory of the HTML files.
+    :param n: Default 1000. How many channels to write.
+    :param links: Default 5. How many channels each channel links.
+    :param seed: Default 0. The seed of the random generator.
+    :return: The ID of the first channel, to start the crawl with.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    channels = [f'UC{i:022d}' for i in range(n)]
+
+    for channel in channels:
+        anchors = ''.join(f'<a id="channel-info" href="/channel/{linked}"><span>{linked}</span></a>'
+                          for linked in rng.sample(channels, links))
+        with open(os.path.join(directory, channel + '.html'), 'w', encoding='utf-8') as file:
+            file.write(f'<!DOCTYPE html><html><body><div id="contents">{anchors}</div></body></html>')
+
+    return channels[0]
+
+
+def benchmark_crawl(workers: tuple = (1, 2, 4, 8), depth: int = 4, delay: float = 0.01,
+                    directory: str = 'data/fixtures/channels') -> list:
+    """
+    Time "scraping.scrape_channel_ids" crawling the synthetic pages of a directory with "fetchers.FileFetcher" by the
+    number of workers, offline and without a browser. Synthetic pages are written first if the directory has none.
+
+    :param workers: Default (1, 2, 4, 8). The numbers of workers.
+    :param depth: Default 4. How many levels to crawl.
+    :param delay: Default 0.01. The seconds every page takes to load, to stand in for the browser.
+    :param directory: Default "data/fixtures/channels". The directory of the HTML files.
+    :return: A list of dictionaries of the results, one for each number of workers, which is also their size.
+    """
+    if not glob(os.path.join(directory, '*.html')):
+        make_channel_fixtures(directory)
+    first = sorted(os.listdir(directory))[0][:-len('.html')]
+
+    results = []
+    baseline = None
+    for n in workers:
+        instrumentation = Instrumentation()
+        start = time.perf_counter()
+        found = scraping.scrape_channel_ids([first], depth, write_to_file=False, workers=n,
+                                            fetcher_factory=lambda: fetchers.FileFetcher(directory, delay),
+                                            instrumentation=instrumentation)
+        seconds = time.perf_counter() - start
+
+        # The crawl must find the same channels whatever the number of workers
+        if baseline is None:
+            baseline = found
+        elif found != baseline:
+            raise AssertionError(f'The crawl with {n} workers found different channels than with {workers[0]}')
+
+        pages = instrumentation.calls['channel_page']['calls']
+        result = {
+            'benchmark': 'crawl',
+            'size': n,
+            'workers': n,
+            'pages': pages,
+            'channels': len(found),
+            'seconds': seconds,
+            'pages_per_second': pages / seconds,
+        }
+        print(result)
+        results.append(result)
+
+    return results
+
+
+def save_results(results: list, path: str = RESULTS_PATH):
+    """
+    Append the results of the benchmarks to a JSONL file, with the time of the run and the commit benchmarked.
+
+    :param results: The dictionaries of the results, as returned by the benchmarks.
+    :param path: Default "data/benchmarks/results.jsonl". The file of the results.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    run = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as file:
+        for result in results:
+            file.write(json.dumps({'run': run, 'commit': commit, **result}) + '\n')
+
+
+def compare_results(column: str = 'speedup', path: str = RESULTS_PATH) -> DataFrame:
+    """
+    Compare a result of the benchmarks across the saved runs.
+
+    :param column: Default "speedup". The result to compare, e.g. "clean_seconds" for the pipeline.
+    :param path: Default "data/benchmarks/results.jsonl". The file of the results.
+    :return: DataFrame of the result, indexed by benchmark and size, with a column for each run.
+    """
+    results = pd.read_json(path, lines=True, dtype={'run': str})
+    results = results[results[column].notna()] if column in results else results.iloc[0:0]
+    results['commit'] = results['commit'].fillna('')
+    return results.pivot_table(index=['benchmark', 'size'], columns=['run', 'commit'], values=column)
+
+
+if __name__ == '__main__':
+    save_results(benchmark_parse_video_details()
+                 + [benchmark_parse_durations()]
+                 + benchmark_title_features()
+                 + [benchmark_dominant_color()]
+                 + benchmark_pipeline()
+                 + benchmark_sharding()
+                 + benchmark_storage()
+                 + benchmark_startup()
+                 + benchmark_crawl())
@@ -0,0 +1,173 @@
+"""
+A compact index of channel IDs: a sorted binary file of fixed-width records, one for the 22 characters following "UC"
+in each ID, which is memory-mapped instead of read into Python strings. Membership is a binary search, any position or
+slice is one read of the file, and the unions and differences of indexes are merged as arrays.
+"""
+
+import os
+from glob import glob
+from itertools import islice
+
+import numpy as np
+
+# Every channel ID is "UC" followed by 22 characters, of which only the 22 characters are stored
+PREFIX = 'UC'
+WIDTH = 22
+DTYPE = f'S{WIDTH}'
+
+
+def _is_channel_id(channel: str) -> bool:
+    return len(channel) == len(PREFIX) + WIDTH and channel.startswith(PREFIX) and channel.isascii()
+
+
+def _write(records: np.ndarray, path: str):
+    """
+    Write sorted unique records to an index file, through a temporary file so that a reader never sees half of it.
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    records.astype(DTYPE).tofile(path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+class ChannelIndex:
+    """
+    A read-only, sorted set of channel IDs kept in a memory-mapped file. It behaves like a sorted list of the IDs for
+    "len", positions, slices and iteration, and like a set for "in". Only the records read are loaded.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The index file, e.g. as written by "build".
+        """
+        size = os.path.getsize(path)
+        if size % WIDTH:
+            raise ValueError(f'"{path}" is not an index of {WIDTH}-byte records')
+
+        self.path = path
+        # A file of zero bytes cannot be mapped
+        self._records = np.memmap(path, dtype=DTYPE, mode='r') if size else np.empty(0, dtype=DTYPE)
+
+    @classmethod
+    def build(cls, channelIds, path: str) -> 'ChannelIndex':
+        """
+        Write an index of channel IDs.
+
+        :param channelIds: The channel IDs, in any order and with duplicates. Lines that are not channel IDs, e.g. the
+          names of channels, are skipped.
+        :param path: The index file to write.
+        :return: The index.
+        """
+        records = np.array([channel[len(PREFIX):].encode('ascii') for channel in map(str.strip, channelIds)
+                            if _is_channel_id(channel)], dtype=DTYPE)
+        _write(np.unique(records), path)
+        return cls(path)
+
+    @classmethod
+    def from_text(cls, text_path: str, path: str = None, lines: int = None) -> 'ChannelIndex':
+        """
+        Index a channel list written by "scrape_channel_ids", one ID per line. The index is only written again when the
+        list is newer than it.
+
+        :param text_path: The channel list, e.g. "data/channels/channels_20201229_182240.txt".
+        :param path: Default None. The index file, the channel list with the extension ".idx" in the subdirectory
+          "index" if None.
+        :param lines: Default None. If given, only index the first lines of the list.
+        :return: The index.
+        """
+        if path is None:
+            name = os.path.splitext(os.path.basename(text_path))[0] + ('' if lines is None else f'-{lines}')
+            path = os.path.join(os.path.dirname(text_path), 'index', name + '.idx')
+
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(text_path):
+            return cls(path)
+
+        with open(text_path, 'r') as file:
+            return cls.build(islice(file, lines), path)
+
+    @classmethod
+    def from_lists(cls, directory: str = 'data/channels', path: str = None) -> 'ChannelIndex':
+        """
+        Index the union of all the channel lists written by "scrape_channel_ids" in a directory. The checkpoints in its
+        subdirectory are not included.
+
+        :param directory: Default "data/channels". The directory of the channel lists.
+        :param path: Default None. The index file, "index/all.idx" in the directory if None.
+        :return: The index.
+        """
+        path = path or os.path.join(directory, 'index', 'all.idx')
+        indexes = [cls.from_text(text_path) for text_path in sorted(glob(directory + '/*.txt'))]
+        _write(np.unique(np.concatenate([index._records for index in indexes] + [np.empty(0, dtype=DTYPE)])), path)
+        return cls(path)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, position):
+        """
+        :param position: A position or a slice of positions in the sorted IDs.
+        :return: The channel ID, or a list of the channel IDs of the slice.
+        """
+        if isinstance(position, slice):
+            return [PREFIX + record.decode('ascii') for record in self._records[position].tolist()]
+        return PREFIX + self._records[position].decode('ascii')
+
+    def __iter__(self):
+        # Decoded in blocks, so that only one block of IDs is held at a time
+        for start in range(0, len(self), 1 << 16):
+            yield from self[start:start + (1 << 16)]
+
+    def __contains__(self, channel) -> bool:
+        if not isinstance(channel, str) or not _is_channel_id(channel):
+            return False
+        position = self.position(channel)
+        return position < len(self) and self[position] == channel
+
+    def position(self, channel: str) -> int:
+        """
+        :param channel: The channel ID.
+        :return: The position of the first ID not smaller than the channel, whether the channel is in the index or not.
+        """
+        return int(np.searchsorted(self._records, channel[len(PREFIX):].encode('ascii')))
+
+    def contains(self, channelIds: list) -> np.ndarray:
+        """
+        Test the membership of many channels at once.
+
+        :param channelIds: The channel IDs.
+        :return: A boolean array, true for the channels in the index.
+        """
+        records = np.array([channel[len(PREFIX):].encode('ascii') if _is_channel_id(channel) else b''
+                            for channel in channelIds], dtype=DTYPE)
+        if not len(self):
+            return np.zeros(len(records), dtype=bool)
+
+        positions = np.minimum(np.searchsorted(self._records, records), len(self) - 1)
+        return (self._records[positions] == records) & (records != b'')
+
+    def union(self, other: 'ChannelIndex', path: str) -> 'ChannelIndex':
+        """
+        :param other: Another index.
+        :param path: The index file of the result.
+        :return: The index of the channels in either index.
+        """
+        _write(np.union1d(self._records, other._records), path)
+        return ChannelIndex(path)
+
+    def difference(self, other: 'ChannelIndex', path: str) -> 'ChannelIndex':
+        """
+        :param other: Another index.
+        :param path: The index file of the result.
+        :return: The index of the channels in this index but not in the other, e.g. the channels not scraped yet.
+        """
+        _write(np.setdiff1d(self._records, other._records, assume_unique=True), path)
+        return ChannelIndex(path)
+
+    def intersection(self, other: 'ChannelIndex', path: str) -> 'ChannelIndex':
+        """
+        :param other: Another index.
+        :param path: The index file of the result.
+        :return: The index of the channels in both indexes.
+        """
+        _write(np.intersect1d(self._records, other._records, assume_unique=True), path)
+        return ChannelIndex(path)
@@ -0,0 +1,512 @@
+"""
+The stages of "data-cleaning-feature-engineering.py", as functions of DataFrames that can be declared as the steps of
+a "pipeline.Pipeline". The API clients are passed in, so the same stages run against the Google APIs or against local
+stand-ins, e.g. those of "fakes".
+"""
+
+import os
+import re
+from contextlib import nullcontext
+from datetime import timedelta
+from math import ceil
+
+import pandas as pd
+import requests
+
+import annotation
+import colors
+import columnar
+import dataset
+import durations
+import language
+import pipeline
+import thumbnails
+import titles
+from instrumentation import Instrumentation
+
+
+def read_videos(path: str, since=None) -> pd.DataFrame:
+    """
+    Read the videos to clean, from the master dataset of "dataset.DatasetStore" if the path is a ".db", from a Parquet
+    file written by "columnar.write_table" if it is a ".parquet", or from a CSV otherwise.
+
+    :param path: The SQLite database, the Parquet file or the CSV.
+    :param since: Default None. For the master dataset and the Parquet files, only read the videos scraped at or after
+      this time, which loads only that period.
+    :return: DataFrame of the videos.
+    """
+    if path.endswith('.db'):
+        store = dataset.DatasetStore(path)
+        df = store.read(since=since)
+        store.close()
+        return df
+    if path.endswith('.parquet'):
+        # The row groups scraped before the period are skipped without being read
+        filters = None if since is None else [('scrape_time', '>=', pd.Timestamp(since))]
+        return columnar.read_table(path, filters=filters)
+    return columnar.read_csv(path)
+
+
+def read_chunks(path: str, chunk_size: int, since=None):
+    """
+    Read the videos to clean in chunks, as "read_videos" reads them whole, so that the whole dataset is never held in
+    memory.
+
+    :param path: The SQLite database, the Parquet file or the CSV.
+    :param chunk_size: The most videos of each chunk.
+    :param since: Default None. For the master dataset and the Parquet files, only read the videos scraped at or after
+      this time.
+    :return: A generator of DataFrames of the videos, in the order "read_videos" gives them.
+    """
+    if path.endswith('.db'):
+        store = dataset.DatasetStore(path)
+        try:
+            yield from store.read_chunks(chunk_size, since=since)
+        finally:
+            store.close()
+    elif path.endswith('.parquet'):
+        filters = None if since is None else [('scrape_time', '>=', pd.Timestamp(since))]
+        yield from columnar.read_table_chunks(path, chunk_size, filters=filters)
+    else:
+        yield from columnar.read_csv_chunks(path, chunk_size)
+
+
+def take_chunk(chunk: pd.DataFrame, **identity) -> pd.DataFrame:
+    """
+    The "raw" stage of a chunk of the videos, which "clean_in_chunks" reads with "read_chunks" and sets as the resource
+    "chunk" of the stage.
+
+    :param identity: What identifies the chunk in the hash of the stage, e.g. the digest of the file, the chunk size
+      and the number of the chunk.
+    """
+    return chunk
+
+
+def fetch_categories(key: str, region: str = 'HK', instrumentation: Instrumentation = None) -> dict:
+    """
+    Request the list of categories from YouTube.
+
+    :param key: The API key.
+    :param region: Default "HK". The region of the categories.
+    :param instrumentation: Default None. If given, count the request.
+    :return: A dictionary of the category names, keyed by category ID.
+    """
+    url = f"https://www.googleapis.com/youtube/v3/videoCategories?part=snippet&regionCode={region}&key={key}"
+    response = requests.request('GET', url).json()
+    if instrumentation is not None:
+        instrumentation.count('youtube.videoCategories.list', calls=1, quota_units=1)
+
+    return {i['id']: i['snippet']['title'] for i in response['items']}
+
+
+# (1) Filter data
+def filter_videos(df: pd.DataFrame, translate_client, language_cache: str = None,
+                  instrumentation: Instrumentation = None) -> pd.DataFrame:
+    """
+    :param translate_client: The Translate API client, i.e. "translate_v2.Client()".
+    :param language_cache: Default None. The SQLite database of the "language.LanguageCache", if any.
+    """
+    print('(1) Data filtering...')
+
+    ## 1a. Filter videos that are live streams
+    df = df[df['live'] == 0].copy()
+
+    # The position of each video, to put the videos back in order after they are split by how their language is found
+    df['_position'] = range(len(df))
+
+    ## 1b. Videos that is not English-based, or consists of English localizations
+
+    # There are multiple versions of English in YouTube Database, change all of them into 'en'
+    english = ['en', 'en-GB', 'en-US', 'en-CA']
+    df['language'] = df.default_language.apply(lambda x: 'en' if x in english else x)
+
+    # Find out those without data about their language and scan their titles through Google Cloud Translate API
+    df_languageless = df.copy()
+    df_languageless = df_languageless[df_languageless.default_language.isna()]
+
+    # The texts are requested in batches under the 400k byte limit, and the results are cached across runs.
+    # The easy cases, e.g. plain English or texts in non-Latin scripts, are resolved locally without the API.
+    # The cache is opened here, as a SQLite connection can only be used by the thread that opened it.
+    cache = language.LanguageCache(language_cache) if language_cache else None
+
+    title_languages = language.detect_languages(list(df_languageless.title), translate_client, cache=cache,
+                                                offline=language.detect_language_offline, desc='Scanning titles...',
+                                                instrumentation=instrumentation)
+
+    # Record the languages if the confidence is over 0.9
+    df_languageless['language'] = [d['language'] if d['confidence'] > 0.9
+                                   else None for d in title_languages]
+
+    # Filter out those with confidence lower than 0.9
+    df_languageless_still = df_languageless.copy()
+    df_languageless_still = df_languageless_still[df_languageless_still.language.isna()]
+
+    # Scan the descriptions of videos that is still unidentified
+    if len(df_languageless_still) > 0:
+        descriptions = df_languageless_still.description
+        descriptions = descriptions.fillna('')
+        descriptions = [des[:500] for des in descriptions]  # Prevent descriptions to be too long
+
+        description_languages = language.detect_languages(descriptions, translate_client, cache=cache,
+                                                          offline=language.detect_language_offline,
+                                                          desc='Scanning descriptions...',
+                                                          instrumentation=instrumentation)
+
+        df_languageless_still['language'] = [d['language'] if d['confidence'] > 0.9
+                                             else None for d in description_languages]
+
+    if cache is not None:
+        cache.close()
+
+    # Only select instances that are identified as English
+    df = pd.concat([df[df['language'] == 'en'],
+                    df_languageless[df_languageless['language'] == 'en'],
+                    df_languageless_still[df_languageless_still['language'] == 'en']])
+
+    # The videos keep the order they are read in, so that the chunks of a dataset are filtered as the whole of it
+    return df.sort_values('_position', kind='stable').drop(columns='_position')
+
+
+# (2) Column: 'published_at'
+# (3) Column: 'length'
+def parse_columns(df: pd.DataFrame, scrape_runs: str = 'data/csv/scrape_runs.csv') -> pd.DataFrame:
+    """
+    :param scrape_runs: Default "data/csv/scrape_runs.csv". The table of the first row of each scrape run, for the
+      CSVs written before the videos carried their scrape times.
+    """
+    print('(2) Column "published_at"...')
+    df = df.copy()
+
+    # Convert into datetime for comparison
+    # Prevent comparison of timezone-aware and timezone-naive datetime objects by providing utc=True, then drop the
+    # timezone of the whole column at once to compare with the scrape times in UTC+0
+    df['published_at'] = pd.to_datetime(df['published_at'], utc=True).dt.tz_convert(None)
+
+    ## 2a. Remove videos that are published in the latest 48 hours as views may have not been accumulated
+    ## Different videos are scraped in different periods, so each video is compared with its own scrape time in UTC+0.
+    ## The CSVs written before the videos carried their scrape times are matched to their runs by row number, from the
+    ## table of the first row of each run, which a new run only needs a line added to.
+    if 'scrape_time' not in df:
+        df['scrape_time'] = dataset.scrape_times_by_row(df.index, pd.read_csv(scrape_runs))
+
+    df['scrape_time'] = pd.to_datetime(df['scrape_time'])
+    df = df[df['published_at'] < df['scrape_time'] - timedelta(hours=47)]  # 1 hour for scraping
+
+    ## 2b. Binning into different hours of publishing
+    ## The bins of 3 hours are given explicitly, rather than as 8 bins over the hours present, so that every chunk of
+    ## the data is binned the same way
+    df['hour_published'] = df['published_at'].dt.hour
+    df['hour_published'] = pd.cut(df['hour_published'], bins=range(0, 25, 3), right=False,
+                                  labels=['0', '3', '6', '9', '12', '15', '18', '21'])
+
+    # (3) Column: 'length'
+    print('(3) Column "length"...')
+
+    ## The ISO 8601 durations, e.g. "PT1H2M3S", "PT5M" or "PT1H3S", are converted into seconds for the whole column at
+    ## once
+    df['length'] = durations.parse_durations(df['length'])
+
+    return df
+
+
+# (4) Column: 'category'
+def categorize(df: pd.DataFrame, categories: dict) -> pd.DataFrame:
+    """
+    :param categories: The category names keyed by category ID, as returned by "fetch_categories".
+    """
+    print('(4) Column "category"...')
+    df = df.copy()
+
+    ## 4a. The list of categories is requested from YouTube by "fetch_categories".
+    ## 4b. It occasionally updates so it is important to run this shortly after scraping. The categories are part of
+    ## the hash of the stage, so the stage reruns when they change.
+    df['category'] = df['category'].apply(str).map(categories)
+
+    # 4c. Filter out music videos because the viewership nature is different from other types of videos
+    return df[df['category'] != 'Music']
+
+
+# (5) Column: 'title'
+def title_features(df: pd.DataFrame, nlp=None, n_process: int = 4) -> pd.DataFrame:
+    """
+    :param nlp: Default None. The spaCy pipeline, as returned by "titles.load_pos_tagger". 5e is skipped if None.
+    :param n_process: Default 4. The number of processes of the POS tagging.
+    """
+    print('(5) Column "title"...')
+
+    ## 5a. Length
+    ## 5b. Are there any all-capital words?
+    ## 5c. Is the whole title capitalized?
+    ## 5d. Sentiment Analysis, non-absolute & absolute
+    ## 5e. What word does the title start with?
+
+    ## The features are computed with vectorized string operations. For 5e, each distinct first word is only tagged
+    ## once, in batches across processes, with the spaCy components not needed for tagging disabled.
+    return titles.title_features(df['title'], nlp, n_process=n_process)
+
+
+# (6) Column: 'thumbnail'
+def thumbnail_features(df: pd.DataFrame, vision_client, thumbnail_cache: str = 'data/thumbnails',
+                       annotation_cache: str = None, processes: int = None,
+                       instrumentation: Instrumentation = None) -> pd.DataFrame:
+    """
+    :param vision_client: The Vision API client, i.e. "vision.ImageAnnotatorClient()".
+    :param thumbnail_cache: Default "data/thumbnails". The directory of the "thumbnails.ThumbnailCache".
+    :param annotation_cache: Default None. The SQLite database of the "annotation.AnnotationCache", if any.
+    :param processes: Default None. The number of processes finding the dominant colours, the number of CPUs if None.
+    """
+    print('(6) Column "thumbnail"...')
+    # TODO: Rearrange the columns after running all thumbnails through Google Vision API
+
+    ## 6a. Dominant Colour
+    ## The thumbnails are downloaded concurrently and decoded in memory. They are kept in a content-addressed cache,
+    ## so repeated runs and the Vision step reuse the same bytes.
+    thumbnail_cache = thumbnails.ThumbnailCache(thumbnail_cache)
+    dominant_colors = pd.Series(thumbnails.dominant_colors(list(df['thumbnail']), thumbnail_cache, processes=processes,
+                                                           instrumentation=instrumentation),
+                                index=df.index, dtype=object, name='thumbnail_dominant_color')
+
+    ## 6b. Are there squares, boxes, circles that highlights things?
+
+    # cv_image = cv2.imread('images/pic.jpg')
+    # cv_image = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
+    # _, threshold = cv2.threshold(cv_image, 240, 255, cv2.THRESH_BINARY)
+    # _, contours, _ = cv2.findContours(threshold, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+
+    ## Google Vision API is used in this section of 6c and 6d.
+    ## Object localization and text detection of up to 16 thumbnails are requested together in one request, reusing
+    ## the thumbnails downloaded in 6a. The annotations are cached by the hash of the image.
+    cache = annotation.AnnotationCache(annotation_cache) if annotation_cache else None
+    annotations = annotation.annotate_thumbnails(list(df['thumbnail']), vision_client, cache=cache,
+                                                 thumbnail_cache=thumbnail_cache, instrumentation=instrumentation)
+    if cache is not None:
+        cache.close()
+    thumbnail_cache.close()
+
+    ## 6c. Object Detection: the number of objects, and the number of objects of each label
+    ## 6d. Are there words? What are they?
+    ## TODO: Some OCR-recognized texts are not words, and they should be separated from clear words
+    ##  on the thumbnail in feature generation.
+
+    ## All the columns are built at once from the annotations, instead of a new column for every new label or text
+    ## line
+    return pd.concat([dominant_colors, annotation.thumbnail_features(annotations, index=df.index)], axis=1)
+
+
+# (7) Column: Description
+def finalize(df: pd.DataFrame, title_columns: pd.DataFrame, thumbnail_columns: pd.DataFrame) -> pd.DataFrame:
+    df = pd.concat([df, title_columns], axis=1)
+    df = df.reset_index().drop('level_0', axis=1, errors='ignore')
+
+    thumbnail_columns = thumbnail_columns.reset_index(drop=True)
+    df = pd.concat([df, thumbnail_columns], axis=1)
+
+    ## Replace \n by space
+    df['description'] = df['description'].apply(lambda desc: str(desc).replace('\n', ' '))
+    return df
+
+
+def build_pipeline(path: str, translate_client, vision_client, categories: dict, nlp=None,
+                   cache_directory: str = 'data/pipeline', language_cache: str = 'data/languages.db',
+                   thumbnail_cache: str = 'data/thumbnails', annotation_cache: str = 'data/annotations.db',
+                   scrape_runs: str = 'data/csv/scrape_runs.csv', since=None, n_process: int = 4,
+                   processes: int = None, chunk_size: int = None, chunk_workers: int = None, chunk: dict = None,
+                   instrumentation: Instrumentation = None) -> pipeline.Pipeline:
+    """
+    Declare the stages of the cleaning as a pipeline. Each stage takes the outputs of its inputs, in order, and the
+    checkpoints are the cached outputs of the stages. The final stage is "cleaned".
+
+    :param path: The CSV of the videos, or the SQLite database of the master dataset, as read by "read_videos".
+    :param translate_client: The Translate API client, or a stand-in with the same "detect_language" method.
+    :param vision_client: The Vision API client, or a stand-in with the same "batch_annotate_images" method.
+    :param categories: The category names keyed by category ID, as returned by "fetch_categories".
+    :param nlp: Default None. The spaCy pipeline of 5e, which is skipped if None.
+    :param cache_directory: Default "data/pipeline". The directory of the cached outputs of the stages.
+    :param language_cache: Default "data/languages.db". The cache of the detected languages, or None for no cache.
+    :param thumbnail_cache: Default "data/thumbnails". The directory of the cached thumbnails.
+    :param annotation_cache: Default "data/annotations.db". The cache of the annotations, or None for no cache.
+    :param scrape_runs: Default "data/csv/scrape_runs.csv". The table of the scrape runs of the old CSVs.
+    :param since: Default None. For the master dataset, only clean the videos scraped at or after this time.
+    :param n_process: Default 4. The number of processes of the POS tagging.
+    :param processes: Default None. The number of processes finding the dominant colours, the number of CPUs if None.
+    :param chunk_size: Default None. If given, the titles of (5) are processed in chunks of this many rows across a pool
+      of processes, and the features merged in order. The output is the same, so the cached outputs are reused either
+      way. It spreads the POS tagging over the CPUs, while "clean_in_chunks" bounds the memory.
+    :param chunk_workers: Default None. The number of processes of the chunks, the number of CPUs if None.
+    :param chunk: Default None. If given, the "raw" stage is "take_chunk", a chunk of the videos set as the resource
+      "chunk" of the stage, instead of the whole path. The dictionary identifies the chunk in the hash of the stage.
+    :param instrumentation: Default None. If given, count the external calls of the stages.
+    :return: The pipeline.
+    """
+    # The modules of each stage are hashed with it, so that a change to them reruns the stage
+    cleaning = pipeline.Pipeline(cache_directory)
+    if chunk is None:
+        cleaning.add('raw', read_videos, files=[path], modules=[columnar, dataset], path=path, since=since)
+    else:
+        cleaning.add('raw', take_chunk, modules=[columnar, dataset], resources={'chunk': None}, **chunk)
+    cleaning.add('filtered', filter_videos, inputs=['raw'], modules=[language],
+                 resources={'translate_client': translate_client, 'language_cache': language_cache,
+                            'instrumentation': instrumentation})
+    cleaning.add('parsed', parse_columns, inputs=['filtered'], files=[scrape_runs], modules=[dataset, durations],
+                 scrape_runs=scrape_runs)
+    cleaning.add('categorized', categorize, inputs=['parsed'], categories=categories)
+    # The output depends on the spaCy model, which is not part of the hash otherwise
+    model = '' if nlp is None else f'{nlp.meta.get("lang")}_{nlp.meta.get("name")}-{nlp.meta.get("version")}'
+    # (2) to (4) are vectorized, and cost more to send to other processes than to run, while the POS tagging of (5) only
+    # needs the titles to be sent. The chunks are tagged in parallel, so each of them is tagged in one process.
+    if chunk_size is None:
+        cleaning.add('titles', title_features, inputs=['categorized'], modules=[titles], version=model,
+                     resources={'nlp': nlp, 'n_process': n_process})
+    else:
+        cleaning.add('titles', pipeline.Sharded(title_features, chunk_size, chunk_workers, columns=['title']),
+                     inputs=['categorized'], modules=[titles], version=model, resources={'nlp': nlp, 'n_process': 1})
+    cleaning.add('thumbnails', thumbnail_features, inputs=['categorized'], modules=[annotation, colors, thumbnails],
+                 resources={'vision_client': vision_client, 'thumbnail_cache': thumbnail_cache,
+                            'annotation_cache': annotation_cache, 'processes': processes,
+                            'instrumentation': instrumentation})
+    cleaning.add('cleaned', finalize, inputs=['categorized', 'titles', 'thumbnails'])
+    return cleaning
+
+
+def clean_in_chunks(path: str, translate_client, vision_client, categories: dict, nlp=None, chunk_size: int = 50_000,
+                    target: str = 'cleaned', workers: int = 2, since=None, chunk_workers: int = None,
+                    instrumentation: Instrumentation = None, **kwargs) -> list:
+    """
+    Run the stages of "build_pipeline" up to a target over chunks of the videos, one chunk at a time, so that the memory
+    held is that of one chunk rather than of the whole dataset. Every stage treats the videos independently, so the
+    outputs of the chunks, concatenated in order by "concat_chunks" or written to one file by "write_chunks", are the
+    output of the whole dataset. The output of every stage of every chunk is cached, so an interrupted run resumes from
+    the chunk it stopped at.
+
+    :param path: The CSV of the videos, the Parquet file, or the SQLite database of the master dataset.
+    :param translate_client: The Translate API client, or a stand-in with the same "detect_language" method.
+    :param vision_client: The Vision API client, or a stand-in with the same "batch_annotate_images" method.
+    :param categories: The category names keyed by category ID, as returned by "fetch_categories".
+    :param nlp: Default None. The spaCy pipeline of 5e, which is skipped if None.
+    :param chunk_size: Default 50000. The most videos of each chunk.
+    :param target: Default "cleaned". The stage whose outputs are returned.
+    :param workers: Default 2. How many stages of a chunk can run at the same time.
+    :param since: Default None. For the master dataset and the Parquet files, only clean the videos scraped at or after
+      this time.
+    :param chunk_workers: Default None. The number of processes the titles of each chunk are tagged across, the number
+      of CPUs if None. The processes are started once for all the chunks.
+    :param instrumentation: Default None. If given, record the stages of every chunk and count their external calls.
+    :param kwargs: The other options of "build_pipeline", e.g. the caches and the processes of the colours.
+    :return: The files of the cached outputs of the target, one for each chunk, in order.
+    """
+    chunk_workers = chunk_workers or os.cpu_count()
+    # The file is hashed once, rather than for the stage of every chunk
+    identity = {'digest': pipeline.file_digest(path), 'since': since, 'chunk_size': chunk_size, 'number': 0}
+    cleaning = build_pipeline(path, translate_client, vision_client, categories, nlp, since=since,
+                              chunk_size=ceil(chunk_size / chunk_workers), chunk_workers=chunk_workers,
+                              chunk=identity, instrumentation=instrumentation, **kwargs)
+    raw = cleaning.stages['raw']
+    titles_function = cleaning.stages['titles'].function
+
+    paths = []
+    with titles_function if isinstance(titles_function, pipeline.Sharded) else nullcontext():
+        for number, chunk in enumerate(read_chunks(path, chunk_size, since)):
+            print(f'Chunk {number} of {len(chunk)} videos...')
+            raw.params['number'] = number
+            raw.resources['chunk'] = chunk
+            cleaning.run([target], workers=workers, instrumentation=instrumentation)
+            paths.append(cleaning.output_path(target))
+    raw.resources['chunk'] = None
+
+    return paths
+
+
+# The columns of the text lines of the thumbnails, whose number depends on the thumbnails of each chunk
+_TEXT_COLUMN = re.compile(r'thumbnail_text_\d+')
+
+# The columns of the thumbnails that every chunk has, unlike those of the labels of the objects found
+_THUMBNAIL_COLUMNS = ['thumbnail', 'thumbnail_dominant_color', 'thumbnail_objects', 'thumbnail_text_length',
+                      'thumbnail_text_content']
+
+
+def _layout(paths: list) -> tuple:
+    """
+    Find the columns of the outputs of the chunks, in the order of the output of the whole dataset, and the categories
+    of their categorical columns.
+
+    :return: Tuple of: (1) The columns; (2) The categories of each categorical column.
+    """
+    columns = {}
+    categories = {}
+    for path in paths:
+        df = pd.read_pickle(path)
+        columns.update(dict.fromkeys(df.columns))
+        # The categories made of the values, e.g. of "astype('category')", are sorted, while those given explicitly,
+        # e.g. the bins of the hours, are the same in every chunk
+        for column in df.columns[df.dtypes == 'category']:
+            values = list(df[column].cat.categories)
+            known = categories.setdefault(column, values)
+            if known != values:
+                categories[column] = sorted(set(known) | set(values))
+
+    # The labels of the objects are kept in the order they are first found, and the text lines go last, in order
+    texts = sorted((column for column in columns if _TEXT_COLUMN.fullmatch(column)), key=lambda c: int(c[15:]))
+    columns = [column for column in columns if not _TEXT_COLUMN.fullmatch(column)] + texts
+    return columns, categories
+
+
+def _aligned(paths: list, columns: list, categories: dict):
+    """
+    Read the outputs of the chunks, each with the columns of the output of the whole dataset.
+
+    :param paths: The files of the outputs of the chunks.
+    :param columns: The columns of the output, as found by "_layout".
+    :param categories: The categories of each categorical column, as found by "_layout".
+    :return: A generator of DataFrames.
+    """
+    rows = 0
+
+    for path in paths:
+        df = pd.read_pickle(path)
+        labels = [column for column in columns if column.startswith('thumbnail_') and column not in df and
+                  column not in _THUMBNAIL_COLUMNS and not _TEXT_COLUMN.fullmatch(column)]
+        # The labels not found in the chunk are counted as 0, and the missing text lines are None
+        df = df.reindex(columns=columns)
+        df[labels] = df[labels].fillna(0).astype('int64')
+        for column, values in categories.items():
+            ordered = df[column].dtype == 'category' and df[column].cat.ordered
+            df[column] = df[column].astype(pd.CategoricalDtype(values, ordered=ordered))
+
+        # The final stage numbers the videos from 0, which continues across the chunks
+        if isinstance(df.index, pd.RangeIndex) and df.index.start == 0:
+            df.index = pd.RangeIndex(rows, rows + len(df))
+        rows += len(df)
+        yield df
+
+
+def concat_chunks(paths: list) -> pd.DataFrame:
+    """
+    Concatenate the outputs of the chunks of "clean_in_chunks" in order, into the output of the whole dataset.
+
+    :param paths: The files of the outputs, as returned by "clean_in_chunks".
+    :return: DataFrame of the output.
+    """
+    return pd.concat(list(_aligned(paths, *_layout(paths))))
+
+
+def write_chunks(paths: list, output: str) -> int:
+    """
+    Write the outputs of the chunks of "clean_in_chunks" to one Parquet file, as "columnar.write_table" writes the
+    output of the whole dataset, holding one chunk in memory at a time.
+
+    :param paths: The files of the outputs, as returned by "clean_in_chunks".
+    :param output: The Parquet file.
+    :return: The number of videos written.
+    """
+    layout = _layout(paths)
+    rows = []
+
+    def chunks():
+        # The chunks are read once to find the types of the columns, and once to be written
+        rows.clear()
+        for df in _aligned(paths, *layout):
+            rows.append(len(df))
+            yield df
+
+    columnar.write_chunks(chunks, output)
+    return sum(rows)
@@ -0,0 +1,395 @@
+"""
+The command line of the project, one subcommand for each step:
+
+    python cli.py crawl                       Find channels through the "channels" pages, from a seed channel
+    python cli.py collect                     Scrape the videos of a channel list, as far as the daily quota allows
+    python cli.py parse data/raw/X.jsonl      Parse the raw details of a scrape into the master dataset
+    python cli.py refresh                     Refresh the statistics of the known videos
+    python cli.py clean --stage parsed        Run the cleaning pipeline up to a stage
+
+Nothing runs when the module is imported, and each subcommand imports the modules it needs when it runs, so that e.g.
+parsing loads neither the Google Cloud clients nor spaCy nor Selenium, and the API keys are only read by the
+subcommands calling the APIs. The time from the start of the command to the start of its work is printed, and recorded
+as the stage "startup" of the report of the run in data/reports.
+"""
+
+import argparse
+import os
+from datetime import datetime, timezone
+from time import perf_counter
+
+from instrumentation import Instrumentation
+
+_START = perf_counter()
+
+# The channel list scraped by default, and the first lines of the channel lists that were scraped by hand before the
+# cursor of the scheduler was kept
+CHANNEL_LIST = 'channels_20201229_182240'
+SCRAPED_BY_HAND = {'channels_20201229_182240': 4400}
+
+# The stages of "cleaning.build_pipeline", in order
+CLEANING_STAGES = ['raw', 'filtered', 'parsed', 'categorized', 'titles', 'thumbnails', 'cleaned']
+
+
+def _started(kind: str) -> tuple:
+    """
+    Record the startup of a subcommand, once it has imported what it needs.
+
+    :param kind: The kind of run, e.g. "collection".
+    :return: Tuple of: (1) The name of the run, the local time, e.g. "20210101_000000"; (2) The instrumentation of the
+      run, with the startup recorded as a stage.
+    """
+    now = datetime.now().strftime('%Y%m%d_%H%M%S')
+    startup = perf_counter() - _START
+    print(f'Started in {startup:.2f}s.')
+
+    instruments = Instrumentation(f'{kind}_{now}')
+    instruments.add_stage('startup', startup)
+    return now, instruments
+
+
+def _scrape_time(path: str, scrape_time: str = None) -> datetime:
+    """
+    :param path: The raw file of a scrape, named by the local time the scrape started, e.g.
+      "data/raw/20201231_133112.jsonl".
+    :param scrape_time: Default None. The scrape time in UTC+0, e.g. "2020-12-31T05:31:12". Told from the name of the
+      file if None.
+    :return: The scrape time, a naive datetime in UTC+0.
+    """
+    if scrape_time is not None:
+        return datetime.fromisoformat(scrape_time)
+
+    try:
+        started = datetime.strptime(os.path.splitext(os.path.basename(path))[0], '%Y%m%d_%H%M%S')
+    except ValueError:
+        raise ValueError(f'The scrape time cannot be told from the name of "{path}", give it by --scrape-time')
+    return started.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class _LazyClient:
+    """
+    An API client that is only created when it is first used, e.g. not at all when the stages calling it are cached.
+    """
+
+    def __init__(self, factory):
+        """
+        :param factory: The function creating the client.
+        """
+        self._factory = factory
+        self._client = None
+
+    def __getattr__(self, name):
+        if self._client is None:
+            self._client = self._factory()
+        return getattr(self._client, name)
+
+
+def crawl(args: argparse.Namespace):
+    """
+    Find channels to scrape videos on, by crawling the "channels" pages from a seed channel. The channels found are
+    written to a new channel list in data/channels.
+    """
+    import scraping
+
+    now, instruments = _started('crawl')
+
+    channels = scraping.scrape_channel_ids([args.seed], depth=args.depth, write_to_file=True,
+                                           frontier_path='data/channels/frontier.db', workers=args.workers,
+                                           instrumentation=instruments)
+    print(f'Found {len(channels)} channels.')
+
+    instruments.write('data/reports/crawl_' + now + '.json')
+
+
+def collect(args: argparse.Namespace):
+    """
+    Scrape the videos of a channel list from where the last run stopped, as many as the daily quota left on the keys
+    allows, and add them to the master dataset.
+    """
+    import channel_index
+    import dataset
+    import scheduler
+    import scraping
+
+    now, instruments = _started('collection')
+
+    # The scrape time is kept in UTC+0, the same as the publishing times of the videos, and carried by every video
+    now_dt = datetime.utcnow().replace(microsecond=0)
+
+    # One key per line, each from its own Google Cloud project, as the quota is counted per project
+    keys = scheduler.read_api_keys(args.keys)
+
+    ## The list is indexed once into a sorted, memory-mapped file of its unique channel IDs, which is sliced by position
+    channel_list = args.channel_list
+    channels = channel_index.ChannelIndex.from_text('data/channels/' + channel_list + '.txt')
+
+    ## The channels scraped by hand are left out of the channels to scrape
+    if SCRAPED_BY_HAND.get(channel_list):
+        scraped = channel_index.ChannelIndex.from_text('data/channels/' + channel_list + '.txt',
+                                                       lines=SCRAPED_BY_HAND[channel_list])
+        channel_list += '-unscraped'
+        channels = channels.difference(scraped, 'data/channels/index/' + channel_list + '.idx')
+
+    # The channels are scraped from where the last run stopped, as many as the daily quota left on the keys allows
+    schedule = scheduler.QuotaScheduler(keys, 'data/channels/schedule.db')
+    for key, start, end, units in schedule.plan(channels, channel_list, how_many_videos=args.videos):
+        print(f'Planned channels {start} to {end} on key ...{key[-4:]}, estimated at {units} quota units.')
+    if args.plan:
+        schedule.close()
+        return
+
+    ## The details of each video are appended to the raw file as soon as they arrive, and parsed as they are streamed.
+    ## The raw file can be parsed again later by the subcommand "parse".
+    videos = schedule.run(channels, channel_list, how_many_videos=args.videos,
+                          subscriber_threshold=args.subscriber_threshold, batched=True, workers=args.workers,
+                          requests_per_second=args.requests_per_second, retries=args.retries,
+                          jsonl_path='data/raw/' + now + '.jsonl', instrumentation=instruments)
+
+    # Parse video formats and add them to the master dataset, keyed by video ID and scrape time
+    ## The videos are scraped while they are parsed, so the stage covers both
+    with instruments.stage('scrape_and_parse') as stage:
+        parsed = scraping.parse_video_details(videos, now_dt)
+        stage['rows'] = len(parsed)
+
+    with instruments.stage('upsert') as stage:
+        store = dataset.DatasetStore(args.database)
+        stage['rows'] = store.upsert(parsed)
+        store.close()
+
+    schedule.close()
+
+    instruments.write('data/reports/collection_' + now + '.json')
+
+
+def parse(args: argparse.Namespace):
+    """
+    Parse the raw details of a scrape, as written by "collect", and add them to the master dataset. No API is called.
+    """
+    import dataset
+    import scraping
+
+    now, instruments = _started('parse')
+
+    with instruments.stage('parse') as stage:
+        parsed = scraping.parse_video_details(scraping.read_jsonl(args.path), _scrape_time(args.path, args.scrape_time))
+        stage['rows'] = len(parsed)
+
+    with instruments.stage('upsert') as stage:
+        store = dataset.DatasetStore(args.database)
+        stage['rows'] = store.upsert(parsed)
+        store.close()
+
+    print(f'Added {len(parsed)} videos to "{args.database}".')
+    instruments.write('data/reports/parse_' + now + '.json')
+
+
+def refresh(args: argparse.Namespace):
+    """
+    Refresh the statistics of the known videos, one quota unit for every 50 of them, and store them as snapshots.
+    """
+    from math import ceil
+
+    import dataset
+    import scheduler
+    import scraping
+
+    now, instruments = _started('refresh')
+
+    # The refresh time is kept in UTC+0, the same as the scrape time of the full scrapes
+    now_dt = datetime.utcnow().replace(microsecond=0)
+
+    keys = scheduler.read_api_keys(args.keys)
+    store = dataset.DatasetStore(args.database)
+    video_ids = store.video_ids()
+
+    ## The refresh is charged to the key with the most quota left today, and shares the usage with the full scrapes
+    schedule = scheduler.QuotaScheduler(keys, 'data/channels/schedule.db')
+    key = max(keys, key=schedule.remaining)
+    if ceil(len(video_ids) / scraping.MAX_IDS_PER_REQUEST) > schedule.remaining(key):
+        video_ids = video_ids[:schedule.remaining(key) * scraping.MAX_IDS_PER_REQUEST]
+        print(f'Only {len(video_ids)} videos fit in the quota left today.')
+
+    report = {}
+    statistics = scraping.iter_video_statistics(key, video_ids, workers=args.workers, requests_per_second=10,
+                                                retries=3, report=report, instrumentation=instruments)
+
+    ## The statistics are requested while they are parsed, so the stage covers both. Every request sent is recorded,
+    ## including the failed ones, even if the refresh fails
+    try:
+        with instruments.stage('refresh_and_parse') as stage:
+            snapshots = scraping.parse_video_statistics(statistics, now_dt)
+            stage['rows'] = len(snapshots)
+    finally:
+        statistics.close()
+        schedule.record(key, report.get('requests_attempted', 0) * scraping.QUOTA_COST['videos'])
+
+    # Only a refusal for the daily quota uses up the key, not a server error that outlasted the retries
+    if report['quota_exceeded']:
+        schedule.exhaust(key)
+    schedule.close()
+
+    # The other fields of each video are reused from its latest full scrape when it is read with
+    # "store.read(refreshed=True)", and "store.read_snapshots()" gives the time series of the statistics
+    with instruments.stage('upsert_snapshots') as stage:
+        stage['rows'] = store.upsert_snapshots(snapshots)
+        store.close()
+
+    instruments.write('data/reports/refresh_' + now + '.json')
+
+
+def _translate_client(credentials: str):
+    from google.cloud import translate_v2
+    if os.path.exists(credentials):
+        return translate_v2.Client.from_service_account_json(credentials)
+    return translate_v2.Client()
+
+
+def _vision_client(credentials: str):
+    from google.cloud import vision
+    if os.path.exists(credentials):
+        return vision.ImageAnnotatorClient.from_service_account_json(credentials)
+    return vision.ImageAnnotatorClient()
+
+
+def clean(args: argparse.Namespace):
+    """
+    Run the stages of the cleaning up to a stage, skipping the cached ones, and write the output to a Parquet file. Only
+    the resources of the stages needed are loaded: the categories are requested for "categorized" onwards, spaCy is
+    loaded for "titles" and "cleaned", and the Translate and Vision clients are created when they are first called, so
+    not at all when their stages are cached. Unless "--chunk-size" is 0, the videos are cleaned chunk by chunk, so the
+    memory follows the size of the chunks rather than of the dataset.
+    """
+    import pandas as pd
+
+    import cleaning
+    import columnar
+
+    now, instruments = _started('cleaning')
+
+    # Turn off "A value is trying to be set on a copy of a slice from a DataFrame" warning
+    pd.options.mode.chained_assignment = None
+
+    ## The Google Cloud APIs are used in (1), for the languages, and in 6c and 6d, for the thumbnails. They are
+    ## authenticated by the service account key, or by the Environment Variable "GOOGLE_APPLICATION_CREDENTIALS" if it
+    ## does not exist. Check https://cloud.google.com/docs/authentication/getting-started for more details.
+    translate_client = _LazyClient(lambda: _translate_client(args.credentials))
+    vision_client = _LazyClient(lambda: _vision_client(args.credentials))
+
+    stages = CLEANING_STAGES[:CLEANING_STAGES.index(args.stage) + 1]
+
+    ## 4a. Request the list of categories from YouTube.
+    categories = None
+    if 'categorized' in stages:
+        import scheduler
+        keys = scheduler.read_api_keys(args.keys)
+        if not keys:
+            raise ValueError(f'No API key is given in "{args.keys}", which is needed to request the categories')
+        categories = cleaning.fetch_categories(keys[0], instrumentation=instruments)
+
+    word_annotator = None
+    if args.stage in ['titles', 'cleaned']:
+        import titles
+        word_annotator = titles.load_pos_tagger(args.model)
+
+    since = None if args.since is None else datetime.fromisoformat(args.since)
+    # The cleaned dataset is stored in Parquet, so the lists, the colours and the dtypes are kept, and the analysis can
+    # load only the columns and rows it needs
+    output = args.output
+    if output is None and args.stage == 'cleaned':
+        output = 'data/cleaned/data_' + now + '_cleaned.parquet'
+
+    if args.chunk_size:
+        # Only one chunk of the videos is held at a time, and the outputs of the chunks are streamed to the file
+        paths = cleaning.clean_in_chunks(args.path, translate_client, vision_client, categories, word_annotator,
+                                         chunk_size=args.chunk_size, target=args.stage, workers=args.workers,
+                                         since=since, cache_directory=args.cache_directory,
+                                         instrumentation=instruments)
+        if output is not None:
+            rows = cleaning.write_chunks(paths, output)
+            print(f'Wrote {rows} rows to "{output}".')
+        else:
+            print(f'Stage "{args.stage}" has {len(paths)} chunks, cached in "{args.cache_directory}".')
+    else:
+        pipeline = cleaning.build_pipeline(args.path, translate_client, vision_client, categories, word_annotator,
+                                           cache_directory=args.cache_directory, since=since,
+                                           instrumentation=instruments)
+        df = pipeline.run([args.stage], workers=args.workers, instrumentation=instruments)[args.stage]
+        if output is not None:
+            columnar.write_table(df, output)
+            print(f'Wrote {len(df)} rows to "{output}".')
+        else:
+            print(f'Stage "{args.stage}" has {len(df)} rows, cached in "{args.cache_directory}".')
+
+    instruments.write('data/reports/cleaning_' + now + '.json')
+
+
+def parser() -> argparse.ArgumentParser:
+    """
+    :return: The parser of the command line, with a subparser for each subcommand.
+    """
+    main_parser = argparse.ArgumentParser(prog='cli.py', description='Scrape, store and clean the YouTube videos.')
+    subparsers = main_parser.add_subparsers(dest='command', required=True)
+
+    crawl_parser = subparsers.add_parser('crawl', help=crawl.__doc__.split('.')[0].strip())
+    crawl_parser.add_argument('--seed', default='UCYO_jab_esuFRV4b17AJtAw', help='the channel the crawl starts from')
+    crawl_parser.add_argument('--depth', type=int, default=6, help='how many pages away from the seed to crawl')
+    crawl_parser.add_argument('--workers', type=int, default=4, help='the number of browsers')
+    crawl_parser.set_defaults(function=crawl)
+
+    collect_parser = subparsers.add_parser('collect', help=collect.__doc__.split('.')[0].strip())
+    collect_parser.add_argument('--channel-list', default=CHANNEL_LIST, help='the name of the channel list to scrape')
+    collect_parser.add_argument('--videos', type=int, default=10, help='the most videos scraped from a channel')
+    collect_parser.add_argument('--subscriber-threshold', type=int, default=1000,
+                                help='the fewest subscribers of a channel whose videos are scraped')
+    collect_parser.add_argument('--workers', type=int, default=8, help='the number of threads sending requests')
+    collect_parser.add_argument('--requests-per-second', type=float, default=10, help='the rate limit of the requests')
+    collect_parser.add_argument('--retries', type=int, default=3, help='how many times to retry a failed request')
+    collect_parser.add_argument('--plan', action='store_true', help="only print today's plan of the keys")
+    collect_parser.set_defaults(function=collect)
+
+    parse_parser = subparsers.add_parser('parse', help=parse.__doc__.split('.')[0].strip())
+    parse_parser.add_argument('path', help='the raw file of the scrape, e.g. data/raw/20201231_133112.jsonl')
+    parse_parser.add_argument('--scrape-time', help='the scrape time in UTC+0, told from the name of the file if not '
+                                                    'given, e.g. 2020-12-31T05:31:12')
+    parse_parser.set_defaults(function=parse)
+
+    refresh_parser = subparsers.add_parser('refresh', help=refresh.__doc__.split('.')[0].strip())
+    refresh_parser.add_argument('--workers', type=int, default=4, help='the number of threads sending requests')
+    refresh_parser.set_defaults(function=refresh)
+
+    clean_parser = subparsers.add_parser('clean', help=clean.__doc__.split('.')[0].strip())
+    clean_parser.add_argument('--stage', choices=CLEANING_STAGES, default='cleaned', help='the last stage to run')
+    clean_parser.add_argument('--path', default='data/csv/data_20210109_213012.csv',
+                              help='the videos to clean: a CSV, a Parquet file, or the master dataset data/videos.db')
+    clean_parser.add_argument('--since', help='only clean the videos scraped at or after this time, e.g. 2021-01-01')
+    clean_parser.add_argument('--output', help='the Parquet file of the output, '
+                                               'data/cleaned/data_<now>_cleaned.parquet for "cleaned" if not given')
+    clean_parser.add_argument('--cache-directory', default='data/pipeline', help='the cached outputs of the stages')
+    clean_parser.add_argument('--chunk-size', type=int, default=50_000,
+                              help='the most videos cleaned at a time, which bounds the memory, or 0 to clean '
+                                   'all the videos at once')
+    clean_parser.add_argument('--workers', type=int, default=2, help='how many stages can run at the same time')
+    clean_parser.add_argument('--model', default='en_core_web_sm', help='the spaCy model of the POS tagging')
+    clean_parser.add_argument('--credentials', default='google-cloud/service-account.json',
+                              help='the service account key of Google Cloud')
+    clean_parser.set_defaults(function=clean)
+
+    for subparser in [collect_parser, parse_parser, refresh_parser]:
+        subparser.add_argument('--database', default='data/videos.db', help='the master dataset')
+    for subparser in [collect_parser, refresh_parser, clean_parser]:
+        subparser.add_argument('--keys', default='api-key.txt', help='the API keys, one per line')
+
+    return main_parser
+
+
+def main(argv: list = None):
+    """
+    :param argv: Default None. The arguments of the command line, e.g. ["clean", "--stage", "parsed"]. Those of the
+      process if None.
+    """
+    args = parser().parse_args(argv)
+    args.function(args)
+
+
+if __name__ == '__main__':
+    main()
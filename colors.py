@@ -0,0 +1,249 @@
+"""
+A NumPy implementation of the dominant colour of ColorThief, i.e. the modified median cut quantization (MMCQ) of
+Leptonica, for batches of images.
+
+ColorThief builds the colour histogram and sums the colour boxes one pixel at a time in pure Python. Here the sampled
+pixels of a whole batch of images are stacked into one array and binned with a single "bincount", and the median cuts
+run on slices of the 32x32x32 histogram of each image. The result is the same tuple as "ColorThief.get_color".
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# The same constants as ColorThief
+SIGBITS = 5
+RSHIFT = 8 - SIGBITS
+HISTOGRAM_SIZE = 1 << SIGBITS
+MAX_ITERATION = 1000
+FRACT_BY_POPULATIONS = 0.75
+
+# The images of each task sent to the processes
+BATCH_SIZE = 64
+
+
+def sample_pixels(content: bytes, quality: int = 125):
+    """
+    Decode an image from memory and sample its pixels as ColorThief does: one of every "quality" pixels, skipping the
+    transparent and the white pixels.
+
+    :param content: The bytes of the image.
+    :param quality: Default 125. Only one of every this many pixels is sampled.
+    :return: An array of the quantized (r, g, b) of the sampled pixels, or None if the image cannot be decoded.
+    """
+    try:
+        pixels = np.asarray(Image.open(BytesIO(content)).convert('RGBA')).reshape(-1, 4)[::quality]
+    except (OSError, ValueError):
+        return None
+
+    valid = (pixels[:, 3] >= 125) & ~((pixels[:, 0] > 250) & (pixels[:, 1] > 250) & (pixels[:, 2] > 250))
+    return pixels[valid, :3] >> RSHIFT
+
+
+def histograms(samples: list) -> np.ndarray:
+    """
+    Bin the sampled pixels of a batch of images into one colour histogram per image, in one pass over the stacked
+    pixels.
+
+    :param samples: The quantized pixels of each image, as returned by "sample_pixels".
+    :return: An array of shape (images, 32, 32, 32) of the pixel counts.
+    """
+    size = HISTOGRAM_SIZE ** 3
+    lengths = [len(sample) for sample in samples]
+    if not sum(lengths):
+        return np.zeros((len(samples), HISTOGRAM_SIZE, HISTOGRAM_SIZE, HISTOGRAM_SIZE), dtype=np.int64)
+
+    stacked = np.concatenate(samples).astype(np.int64)
+    image = np.repeat(np.arange(len(samples)), lengths)
+    index = image * size + (stacked[:, 0] << (2 * SIGBITS)) + (stacked[:, 1] << SIGBITS) + stacked[:, 2]
+
+    return np.bincount(index, minlength=len(samples) * size).reshape(
+        len(samples), HISTOGRAM_SIZE, HISTOGRAM_SIZE, HISTOGRAM_SIZE)
+
+
+class _Box:
+    """
+    A box in the quantized colour space, with the bounds (r1, r2, g1, g2, b1, b2) included.
+    """
+
+    def __init__(self, bounds: list, histogram: np.ndarray):
+        self.bounds = bounds
+        self.histogram = histogram
+        r1, r2, g1, g2, b1, b2 = bounds
+        self.view = histogram[r1:r2 + 1, g1:g2 + 1, b1:b2 + 1]
+        self.count = int(self.view.sum())
+        self.volume = (r2 - r1 + 1) * (g2 - g1 + 1) * (b2 - b1 + 1)
+
+    def average(self) -> tuple:
+        r1, r2, g1, g2, b1, b2 = self.bounds
+        mult = 1 << RSHIFT
+
+        if not self.count:
+            return (int(mult * (r1 + r2 + 1) / 2), int(mult * (g1 + g2 + 1) / 2), int(mult * (b1 + b2 + 1) / 2))
+
+        color = []
+        for axis, (low, high) in enumerate([(r1, r2), (g1, g2), (b1, b2)]):
+            totals = self.view.sum(axis=tuple(a for a in range(3) if a != axis))
+            color.append(int(float((totals * ((np.arange(low, high + 1) + 0.5) * mult)).sum()) / self.count))
+        return tuple(color)
+
+
+def _median_cut(box: _Box):
+    """
+    Split a box in two along its widest side, as "MMCQ.median_cut_apply" of ColorThief.
+    """
+    if not box.count:
+        return None, None
+
+    widths = [box.bounds[1] - box.bounds[0] + 1, box.bounds[3] - box.bounds[2] + 1, box.bounds[5] - box.bounds[4] + 1]
+
+    if box.count == 1:
+        return _Box(list(box.bounds), box.histogram), None
+
+    # The first of r, g, b with the largest width
+    axis = widths.index(max(widths))
+    low, high = box.bounds[2 * axis], box.bounds[2 * axis + 1]
+
+    partial = np.cumsum(box.view.sum(axis=tuple(a for a in range(3) if a != axis)))
+    total = int(partial[-1])
+
+    def partial_sum(i):
+        return int(partial[i - low]) if low <= i <= high else 0
+
+    for i in range(low, high + 1):
+        if partial_sum(i) > total / 2:
+            left = i - low
+            right = high - i
+            if left <= right:
+                cut = min(high - 1, int(i + right / 2))
+            else:
+                cut = max(low, int(i - 1 - left / 2))
+
+            # Avoid boxes without any pixels
+            while not partial_sum(cut):
+                cut += 1
+            while not (total - partial_sum(cut) if low <= cut <= high else None) and partial_sum(cut - 1):
+                cut -= 1
+
+            bounds1 = list(box.bounds)
+            bounds2 = list(box.bounds)
+            bounds1[2 * axis + 1] = cut
+            bounds2[2 * axis] = cut + 1
+            return _Box(bounds1, box.histogram), _Box(bounds2, box.histogram)
+
+    return None, None
+
+
+def _iterate(boxes: list, key, target: float):
+    """
+    Split the boxes until there are as many colours as the target, as "MMCQ.quantize" of ColorThief. The boxes are a
+    list kept in the order of the priority queue of ColorThief, which pops the last of the stably sorted boxes.
+    """
+    colors = 1
+    iterations = 0
+    while iterations < MAX_ITERATION:
+        boxes.sort(key=key)
+        box = boxes.pop()
+        if not box.count:
+            boxes.append(box)
+            iterations += 1
+            continue
+
+        box1, box2 = _median_cut(box)
+        boxes.append(box1)
+        if box2 is not None:
+            boxes.append(box2)
+            colors += 1
+        if colors >= target:
+            return
+        iterations += 1
+
+
+def dominant_color_from_histogram(histogram: np.ndarray, color_count: int = 5) -> tuple:
+    """
+    Find the dominant colour from the colour histogram of an image, as "ColorThief.get_color".
+
+    :param histogram: The 32x32x32 histogram of the image.
+    :param color_count: Default 5. The size of the palette the dominant colour is taken from, 5 in ColorThief.
+    :return: The RGB tuple of the dominant colour, or an empty tuple if the histogram is empty.
+    """
+    nonzero = np.nonzero(histogram)
+    if not len(nonzero[0]):
+        return ()
+
+    bounds = []
+    for axis in nonzero:
+        bounds += [int(axis.min()), int(axis.max())]
+
+    boxes = [_Box(bounds, histogram)]
+    _iterate(boxes, lambda box: box.count, FRACT_BY_POPULATIONS * color_count)
+
+    # Re-sort by the product of pixel occupancy times the size in colour space
+    def key(box):
+        return box.count * box.volume
+
+    boxes.sort(key=lambda box: box.count)
+    boxes = boxes[::-1]
+    _iterate(boxes, key, color_count - len(boxes))
+
+    # The dominant colour is the first box popped from the queue, i.e. the last after a stable sort
+    boxes.sort(key=key)
+    return boxes[-1].average()
+
+
+def dominant_colors_batch(contents: list, quality: int = 125) -> list:
+    """
+    Find the dominant colours of a batch of images.
+
+    :param contents: The bytes of the images. Missing images are None.
+    :param quality: Default 125. Only one of every this many pixels is sampled.
+    :return: A list of RGB tuples, or empty tuples for the images that are missing or cannot be decoded.
+    """
+    samples = [sample_pixels(content, quality) if content else None for content in contents]
+    valid = [i for i, sample in enumerate(samples) if sample is not None and len(sample)]
+
+    colors = [()] * len(contents)
+    for i, histogram in zip(valid, histograms([samples[i] for i in valid])):
+        colors[i] = dominant_color_from_histogram(histogram)
+    return colors
+
+
+def make_executor(processes: int = None) -> ProcessPoolExecutor:
+    """
+    Create a pool of processes for "dominant_colors", to be reused across calls, as starting the processes and
+    importing NumPy in each of them takes longer than finding the colours of a small batch.
+
+    :param processes: Default None. The number of processes, the number of CPUs if None.
+    :return: The pool, which the caller shuts down.
+    """
+    # Spawned rather than forked, as the pipeline calls this from one of its threads while others hold locks
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+
+
+def dominant_colors(contents: list, quality: int = 125, processes: int = None, batch_size: int = BATCH_SIZE,
+                    executor: ProcessPoolExecutor = None) -> list:
+    """
+    Find the dominant colours of the images in batches, across a pool of processes.
+
+    :param contents: The bytes of the images. Missing images are None.
+    :param quality: Default 125. Only one of every this many pixels is sampled.
+    :param processes: Default None. The number of processes, the number of CPUs if None. If 1, run in this process.
+    :param batch_size: Default 64. The number of images in each batch.
+    :param executor: Default None. A pool from "make_executor" to run the batches in, which is left open. If None, a
+      pool is started for this call.
+    :return: A list of RGB tuples, or empty tuples for the images that are missing or cannot be decoded.
+    """
+    batches = [contents[i:i + batch_size] for i in range(0, len(contents), batch_size)]
+
+    if processes == 1 or len(batches) <= 1:
+        results = [dominant_colors_batch(batch, quality) for batch in batches]
+    elif executor is not None:
+        results = list(executor.map(dominant_colors_batch, batches, [quality] * len(batches)))
+    else:
+        with make_executor(processes) as executor:
+            results = list(executor.map(dominant_colors_batch, batches, [quality] * len(batches)))
+
+    return [color for batch in results for color in batch]
@@ -0,0 +1,275 @@
+"""
+Typed columnar storage of the datasets in Parquet, replacing the CSVs of data/csv and data/cleaned_csv. Unlike a CSV,
+a Parquet file keeps the dtypes: the lists of tags, localizations and topic categories are list columns, the dominant
+colours of the thumbnails are structs of their RGB values, the datetimes keep their time zones, and the repetitive
+fields are dictionary encoded as categoricals. Only the requested columns are read, and the row groups whose statistics
+rule out the filters are skipped without being decoded.
+
+Parquet needs pyarrow, which is imported when a file is written or read, so the rest of the project does not depend on
+it.
+"""
+
+import ast
+import os
+import re
+
+import pandas as pd
+
+import dataset
+
+# The columns holding RGB tuples, stored as structs of "r", "g" and "b"
+COLOR_COLUMNS = ['thumbnail_dominant_color']
+
+# The repetitive text columns, stored as dictionaries of their distinct values
+CATEGORICAL_COLUMNS = dataset.CATEGORICAL_COLUMNS + ['category', 'default_language', 'language']
+
+# The keys of a dictionary as written by "str", e.g. "dict_keys(['en', 'zh-TW'])"
+_DICT_KEYS = re.compile(r'dict_keys\((.*)\)', re.DOTALL)
+
+# The number of rows of each row group, the unit skipped by the filters
+ROW_GROUP_SIZE = 64 * 1024
+
+
+def _pyarrow():
+    """
+    Import pyarrow when it is needed, with a hint if it is not installed.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError('The Parquet storage needs pyarrow, which can be installed by "pip install pyarrow"') from e
+    return pyarrow
+
+
+def _missing(value) -> bool:
+    return value is None or (not hasattr(value, '__len__') and pd.isna(value))
+
+
+def _to_struct(value):
+    """
+    Convert an RGB tuple into a dictionary, which pyarrow stores as a struct. Missing values are kept as None.
+    """
+    return None if _missing(value) else dict(zip('rgb', map(int, value)))
+
+
+def _prepare(df: pd.DataFrame, categories: dict = None) -> pd.DataFrame:
+    """
+    Convert the RGB tuples into structs and the repetitive text columns into categoricals, as they are stored.
+
+    :param categories: Default None. The categories of each categorical column, the values of the DataFrame if None.
+    """
+    df = df.copy()
+    for column in COLOR_COLUMNS:
+        if column in df:
+            df[column] = df[column].map(_to_struct)
+    for column in CATEGORICAL_COLUMNS:
+        if column in df and (df[column].dtype == object or categories is not None):
+            df[column] = df[column].astype('category' if categories is None else
+                                           pd.CategoricalDtype(categories.get(column, [])))
+    return df
+
+
+def write_table(df: pd.DataFrame, path: str, compression: str = 'zstd', row_group_size: int = ROW_GROUP_SIZE) -> int:
+    """
+    Write a DataFrame to a Parquet file, keeping its index and dtypes.
+
+    :param df: The DataFrame, e.g. as returned by "scraping.parse_video_details" or by the cleaning pipeline.
+    :param path: The Parquet file.
+    :param compression: Default "zstd". The compression codec of the file.
+    :param row_group_size: Default 65536. The number of rows of each row group.
+    :return: The size of the file in bytes.
+    """
+    pa = _pyarrow()
+    df = _prepare(df)
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Written to a temporary name first, so that an interrupted write never leaves a broken file
+    pa.parquet.write_table(pa.Table.from_pandas(df, preserve_index=True), path + '.tmp', compression=compression,
+                           row_group_size=row_group_size)
+    os.replace(path + '.tmp', path)
+    return os.path.getsize(path)
+
+
+def write_chunks(chunks, path: str, compression: str = 'zstd', row_group_size: int = ROW_GROUP_SIZE) -> int:
+    """
+    Write DataFrames to one Parquet file as if they were concatenated, holding one of them in memory at a time. The
+    file is the same as the one "write_table" writes of their concatenation: the types of the columns are those that
+    fit every chunk, e.g. float if a column has missing values in any chunk, and the categoricals have the categories of
+    all the chunks.
+
+    :param chunks: A function returning an iterable of the DataFrames, with the same columns in the same order. It is
+      called twice, to find the types of the columns and then to write the chunks, and must give the same chunks.
+    :param path: The Parquet file.
+    :param compression: Default "zstd". The compression codec of the file.
+    :param row_group_size: Default 65536. The number of rows of each row group.
+    :return: The size of the file in bytes.
+    """
+    pa = _pyarrow()
+
+    ## The categories and the types of the columns of all the chunks are found first
+    categories = {}
+    schemas = []
+    for df in chunks():
+        for column in CATEGORICAL_COLUMNS:
+            if column in df:
+                values = df[column].cat.categories if df[column].dtype == 'category' else df[column].dropna().unique()
+                categories.setdefault(column, set()).update(values)
+        schemas.append(pa.Table.from_pandas(_prepare(df), preserve_index=True).schema.remove_metadata())
+
+    if not schemas:
+        raise ValueError('No chunk to write')
+
+    categories = {column: sorted(values) for column, values in categories.items()}
+    schema = pa.unify_schemas(schemas, promote_options='permissive')
+    # The indices of the categories are as wide as needed for the categories of all the chunks
+    for i, field in enumerate(schema):
+        if field.name in categories:
+            schema = schema.set(i, field.with_type(pa.dictionary(pa.int32(), pa.string())))
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    ## Then every chunk is cast to the types and written as row groups of the same file
+    writer = None
+    try:
+        for df in chunks():
+            table = pa.Table.from_pandas(_prepare(df, categories), preserve_index=True)
+            if writer is None:
+                # The pandas metadata of the first chunk, e.g. the index and the time zones, stands for the whole file
+                schema = schema.with_metadata(table.schema.metadata)
+                writer = pa.parquet.ParquetWriter(path + '.tmp', schema, compression=compression)
+            writer.write_table(table.cast(schema), row_group_size=row_group_size)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    # Written to a temporary name first, so that an interrupted write never leaves a broken file
+    os.replace(path + '.tmp', path)
+    return os.path.getsize(path)
+
+
+def _to_pandas(table) -> pd.DataFrame:
+    """
+    Convert a table read from a file written by "write_table" into a DataFrame, restoring the lists and the tuples.
+    """
+    df = table.to_pandas()
+
+    # pyarrow gives numpy arrays for the lists and dictionaries for the structs
+    for field in table.schema:
+        if field.name not in df:
+            continue
+        if field.name in COLOR_COLUMNS:
+            # The tuples are zipped from the channels as whole columns, which is much faster than one struct at a time
+            struct = table.column(field.name)
+            channels = {field.type.field(i).name: channel for i, channel in enumerate(struct.flatten())}
+            rgb = zip(*(channels[channel].fill_null(0).to_numpy().tolist() for channel in 'rgb'))
+            df[field.name] = pd.Series([None if missing else color for missing, color in
+                                        zip(struct.is_null().to_numpy(zero_copy_only=False), rgb)],
+                                       index=df.index, dtype=object)
+        elif str(field.type).startswith(('list', 'large_list')):
+            df[field.name] = df[field.name].map(lambda value: None if _missing(value) else list(value))
+    return df
+
+
+def read_table(path: str, columns: list = None, filters: list = None) -> pd.DataFrame:
+    """
+    Read a DataFrame written by "write_table". Only the requested columns are decoded, and only the row groups that
+    can hold rows matching the filters.
+
+    :param path: The Parquet file.
+    :param columns: Default None. The columns to read besides the index. All if None.
+    :param filters: Default None. If given, only read the rows matching the filters, e.g.
+      [("view", ">", 1000), ("category", "in", ["Gaming", "Education"])]. A list of lists of filters is read as an OR of
+      ANDs.
+    :return: DataFrame with the index and dtypes it was written with, the lists as lists, and the RGB values as
+      tuples.
+    """
+    return _to_pandas(_pyarrow().parquet.read_table(path, columns=columns, filters=filters, use_pandas_metadata=True))
+
+
+def read_table_chunks(path: str, chunksize: int, filters: list = None):
+    """
+    Read a DataFrame written by "write_table" in chunks, so that the whole file is never held in memory.
+
+    :param path: The Parquet file.
+    :param chunksize: The most rows of each chunk. A chunk does not span two row groups, so it can be smaller.
+    :param filters: Default None. If given, only read the rows matching the filters, as in "read_table".
+    :return: A generator of DataFrames, the same as "read_table" gives in parts.
+    """
+    pa = _pyarrow()
+    import pyarrow.dataset
+
+    videos = pa.dataset.dataset(path, format='parquet')
+    expression = None if filters is None else pa.parquet.filters_to_expression(filters)
+    for batch in videos.to_batches(filter=expression, batch_size=chunksize):
+        if batch.num_rows:
+            yield _to_pandas(pa.Table.from_batches([batch], schema=videos.schema))
+
+
+def read_columns(path: str) -> list:
+    """
+    :param path: The Parquet file.
+    :return: The names of the columns, without reading the file.
+    """
+    schema = _pyarrow().parquet.read_schema(path)
+    index = schema.pandas_metadata.get('index_columns', []) if schema.pandas_metadata else []
+    return [name for name in schema.names if name not in index]
+
+
+def _literal(value):
+    """
+    Parse a list or a tuple written to a CSV by pandas, e.g. "['a', 'b']" or "(1, 2, 3)". The localizations of the
+    earlier scripts were written as the keys of a dictionary, e.g. "dict_keys(['en', 'zh-TW'])", which are read as a
+    list. Missing values are kept as None, and a value that cannot be parsed is kept as its string.
+    """
+    if _missing(value) or value == '':
+        return None
+
+    match = _DICT_KEYS.fullmatch(value)
+    try:
+        return list(ast.literal_eval(match.group(1))) if match else ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+def read_csv(path: str) -> pd.DataFrame:
+    """
+    Read a CSV written by the earlier versions of the scripts, restoring the lists, the RGB tuples and the datetimes
+    that the CSV turned into strings, e.g. to convert it by "write_table".
+
+    :param path: The CSV, e.g. "data/csv/data_20210109_213012.csv".
+    :return: DataFrame of the videos.
+    """
+    return _decode_csv(pd.read_csv(path, index_col=0))
+
+
+def read_csv_chunks(path: str, chunksize: int):
+    """
+    Read a CSV as "read_csv" does, in chunks, so that the whole file is never held in memory.
+
+    :param path: The CSV.
+    :param chunksize: The number of rows of each chunk.
+    :return: A generator of DataFrames, indexed by the row numbers of the CSV.
+    """
+    with pd.read_csv(path, index_col=0, chunksize=chunksize) as reader:
+        for df in reader:
+            yield _decode_csv(df)
+
+
+def _decode_csv(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Restore the lists, the RGB tuples and the datetimes of the videos read from a CSV.
+    """
+    for column in dataset.LIST_COLUMNS + COLOR_COLUMNS:
+        if column in df:
+            df[column] = df[column].map(_literal)
+    for column in ['published_at', 'scrape_time']:
+        if column in df:
+            df[column] = pd.to_datetime(df[column])
+    for column in ['like', 'dislike', 'comment']:
+        if column in df:
+            df[column] = df[column].astype('Int64')
+    return df
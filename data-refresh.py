@@ -0,0 +1,10 @@
+"""
+Refresh the statistics of the known videos, as "python cli.py refresh", with the same options.
+"""
+
+import sys
+
+import cli
+
+if __name__ == '__main__':
+    cli.main(['refresh'] + sys.argv[1:])
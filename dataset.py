@@ -0,0 +1,309 @@
+import json
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# The columns of the parsed video details, as returned by "scraping.parse_video_details", and their SQLite types
+COLUMNS = {
+    'title': 'TEXT',
+    'view': 'INTEGER',
+    'channel_sub': 'INTEGER',
+    'view_to_sub': 'REAL',
+    'like': 'INTEGER',
+    'dislike': 'INTEGER',
+    'comment': 'INTEGER',
+    'length': 'TEXT',
+    'description': 'TEXT',
+    'dimension': 'TEXT',
+    'definition': 'TEXT',
+    'caption': 'TEXT',
+    'published_at': 'TEXT',
+    'tags': 'TEXT',
+    'category': 'TEXT',
+    'thumbnail': 'TEXT',
+    'localizations': 'TEXT',
+    'topic_categories': 'TEXT',
+    'default_language': 'TEXT',
+    'live': 'INTEGER',
+}
+
+# Columns holding lists, stored as JSON
+LIST_COLUMNS = ['tags', 'localizations', 'topic_categories']
+
+CATEGORICAL_COLUMNS = ['dimension', 'definition', 'caption']
+
+# The columns that change between scrapes, which are all a refresh of the statistics requests
+STATISTICS_COLUMNS = {'view': 'INTEGER', 'like': 'INTEGER', 'dislike': 'INTEGER', 'comment': 'INTEGER'}
+
+
+def _to_json(value):
+    """
+    Encode a list as JSON, keeping missing values as None.
+    """
+    if value is None or (not isinstance(value, (list, tuple)) and pd.isna(value)):
+        return None
+    return json.dumps(list(value) if isinstance(value, (list, tuple)) else value)
+
+
+class DatasetStore:
+    """
+    The master dataset of scraped videos, kept in a SQLite database. Every scrape of a video is one record keyed by
+    the video ID and the scrape time, so new runs are appended without rewriting the history, a video scraped again in
+    the same run replaces its record, and a video scraped in several runs keeps a record for each of them.
+
+    The statistics refreshed between the full scrapes are kept as snapshots of their own, so a refresh stores only the
+    statistics, and the other fields of each video are reused from its latest full record.
+    """
+
+    def __init__(self, path: str = 'data/videos.db'):
+        """
+        :param path: Default "data/videos.db". The SQLite database of the dataset.
+        """
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS videos (video_id TEXT NOT NULL, scrape_time TEXT NOT NULL, ' +
+                         ', '.join(f'"{column}" {type_}' for column, type_ in COLUMNS.items()) +
+                         ', PRIMARY KEY (video_id, scrape_time))')
+        self._db.execute('CREATE INDEX IF NOT EXISTS videos_scrape_time ON videos (scrape_time)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS snapshots (video_id TEXT NOT NULL, scrape_time TEXT NOT NULL, ' +
+                         ', '.join(f'"{column}" {type_}' for column, type_ in STATISTICS_COLUMNS.items()) +
+                         ', PRIMARY KEY (video_id, scrape_time))')
+        self._db.commit()
+
+    def upsert(self, df: pd.DataFrame, scrape_time: datetime = None) -> int:
+        """
+        Add the parsed video details to the dataset, replacing the records of the same videos and scrape times.
+
+        :param df: The DataFrame indexed by video ID, as returned by "scraping.parse_video_details".
+        :param scrape_time: Default None. The time videos are scraped. If None, the "scrape_time" column of each video
+          is used, so that the videos of several scrapes can be written at once.
+        :return: The number of records written.
+        """
+        if scrape_time is None:
+            scrape_times = pd.to_datetime(df['scrape_time']).map(lambda time: time.isoformat(sep=' '))
+        else:
+            scrape_times = scrape_time.isoformat(sep=' ')
+
+        df = df.reindex(columns=list(COLUMNS)).copy()
+
+        for column in LIST_COLUMNS:
+            df[column] = df[column].map(_to_json)
+        df['published_at'] = pd.to_datetime(df['published_at'], utc=True).dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        df.insert(0, 'scrape_time', scrape_times)
+        df = df.astype(object).where(df.notna(), None)
+
+        self._db.executemany(f'INSERT OR REPLACE INTO videos VALUES ({", ".join("?" * (len(COLUMNS) + 2))})',
+                             df.itertuples(index=True, name=None))
+        self._db.commit()
+        return len(df)
+
+    def upsert_snapshots(self, df: pd.DataFrame, scrape_time: datetime = None) -> int:
+        """
+        Add refreshed statistics to the dataset, replacing the snapshots of the same videos and scrape times.
+
+        :param df: The DataFrame indexed by video ID, as returned by "scraping.parse_video_statistics".
+        :param scrape_time: Default None. The time the statistics are refreshed. If None, the "scrape_time" column of
+          each video is used.
+        :return: The number of snapshots written.
+        """
+        if scrape_time is None:
+            scrape_times = pd.to_datetime(df['scrape_time']).map(lambda time: time.isoformat(sep=' '))
+        else:
+            scrape_times = scrape_time.isoformat(sep=' ')
+
+        df = df.reindex(columns=list(STATISTICS_COLUMNS)).copy()
+        df.insert(0, 'scrape_time', scrape_times)
+        df = df.astype(object).where(df.notna(), None)
+
+        placeholders = ', '.join('?' * (len(STATISTICS_COLUMNS) + 2))
+        self._db.executemany(f'INSERT OR REPLACE INTO snapshots VALUES ({placeholders})',
+                             df.itertuples(index=True, name=None))
+        self._db.commit()
+        return len(df)
+
+    def video_ids(self) -> list:
+        """
+        :return: The IDs of all the videos in the dataset, in the order they are first scraped.
+        """
+        return [row[0] for row in self._db.execute('SELECT video_id FROM videos GROUP BY video_id '
+                                                   'ORDER BY MIN(scrape_time), MIN(rowid)')]
+
+    def read_snapshots(self, video_ids: list = None, since: datetime = None, until: datetime = None) -> pd.DataFrame:
+        """
+        Read the time series of the statistics of the videos, from both the full scrapes and the refreshes.
+
+        :param video_ids: Default None. If given, only read the snapshots of these videos.
+        :param since: Default None. If given, only read the snapshots at or after this time.
+        :param until: Default None. If given, only read the snapshots before this time.
+        :return: DataFrame indexed by video ID, with the columns "scrape_time", "view", "like", "dislike" and
+          "comment", sorted by video and time.
+        """
+        conditions = []
+        params = []
+
+        if video_ids is not None:
+            # A temporary table, as the number of parameters of a query is limited
+            self._db.execute('CREATE TEMP TABLE IF NOT EXISTS selected (video_id TEXT PRIMARY KEY)')
+            self._db.execute('DELETE FROM selected')
+            self._db.executemany('INSERT OR IGNORE INTO selected VALUES (?)', ((video_id,) for video_id in video_ids))
+            conditions.append('video_id IN (SELECT video_id FROM selected)')
+        if since is not None:
+            conditions.append('scrape_time >= ?')
+            params.append(since.isoformat(sep=' '))
+        if until is not None:
+            conditions.append('scrape_time < ?')
+            params.append(until.isoformat(sep=' '))
+
+        selected = ', '.join(f'"{column}"' for column in ['video_id', 'scrape_time'] + list(STATISTICS_COLUMNS))
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        query = (f'SELECT {selected} FROM videos{where} UNION ALL SELECT {selected} FROM snapshots{where} '
+                 'ORDER BY video_id, scrape_time')
+
+        return self._decode(pd.read_sql_query(query, self._db, params=params * 2))
+
+    def _query(self, columns: list = None, since: datetime = None, until: datetime = None, latest: bool = True):
+        """
+        Build the SQL query and its parameters for "read" and "read_chunks".
+        """
+        selected = ', '.join(f'"{column}"' for column in ['video_id', 'scrape_time'] + (columns or list(COLUMNS)))
+        conditions = []
+        params = []
+
+        if since is not None:
+            conditions.append('scrape_time >= ?')
+            params.append(since.isoformat(sep=' '))
+        if until is not None:
+            conditions.append('scrape_time < ?')
+            params.append(until.isoformat(sep=' '))
+        if latest:
+            # Only the latest record of each video among the selected scrapes
+            conditions.append('scrape_time = (SELECT MAX(scrape_time) FROM videos AS later '
+                              'WHERE later.video_id = videos.video_id' +
+                              ''.join(' AND later.' + condition for condition in conditions) + ')')
+            params = params * 2
+
+        query = f'SELECT {selected} FROM videos'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        return query + ' ORDER BY scrape_time, rowid', params
+
+    @staticmethod
+    def _decode(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Restore the dtypes of the columns read from the database.
+        """
+        df['scrape_time'] = pd.to_datetime(df['scrape_time'])
+        for column in LIST_COLUMNS:
+            if column in df:
+                df[column] = df[column].map(lambda value: None if value is None else json.loads(value))
+        for column in ['like', 'dislike', 'comment']:
+            if column in df:
+                df[column] = df[column].astype('Int64')
+        for column in CATEGORICAL_COLUMNS:
+            if column in df:
+                df[column] = df[column].astype('category')
+        if 'published_at' in df:
+            df['published_at'] = pd.to_datetime(df['published_at'], utc=True)
+        return df.set_index('video_id')
+
+    def read(self, columns: list = None, since: datetime = None, until: datetime = None,
+             latest: bool = True, refreshed: bool = False) -> pd.DataFrame:
+        """
+        Read the videos from the dataset. Only the requested columns and the scrapes in the requested period are
+        loaded.
+
+        :param columns: Default None. The columns to read besides the video ID and the scrape time. All if None.
+        :param since: Default None. If given, only read the scrapes at or after this time.
+        :param until: Default None. If given, only read the scrapes before this time.
+        :param latest: Default true. If true, only read the latest record of each video, otherwise read every record.
+        :param refreshed: Default false. If true, the statistics and the scrape time of each record are replaced by
+          those of the latest snapshot refreshed after it and before "until", as in "apply_snapshots".
+        :return: DataFrame indexed by video ID, in the order the videos are scraped.
+        """
+        query, params = self._query(columns, since, until, latest)
+        df = self._decode(pd.read_sql_query(query, self._db, params=params))
+
+        if refreshed:
+            snapshots = self._db.execute('SELECT COUNT(*) FROM snapshots').fetchone()[0]
+            if snapshots:
+                df = apply_snapshots(df, self.read_snapshots(list(df.index.unique()), until=until))
+        return df
+
+    def read_chunks(self, chunksize: int, columns: list = None, since: datetime = None, until: datetime = None,
+                    latest: bool = True):
+        """
+        Read the videos from the dataset in chunks, so that the whole dataset is never held in memory.
+
+        :param chunksize: The number of videos in each chunk.
+        :return: A generator of DataFrames. The other parameters and the DataFrames are the same as in "read".
+        """
+        query, params = self._query(columns, since, until, latest)
+        for df in pd.read_sql_query(query, self._db, params=params, chunksize=chunksize):
+            yield self._decode(df)
+
+    def scrape_times(self) -> list:
+        """
+        :return: The times of all the scrapes in the dataset, in order.
+        """
+        return [datetime.fromisoformat(row[0])
+                for row in self._db.execute('SELECT DISTINCT scrape_time FROM videos ORDER BY scrape_time')]
+
+    def close(self):
+        self._db.close()
+
+
+def scrape_times_by_row(rows, runs: pd.DataFrame) -> pd.Series:
+    """
+    Find the scrape times of the videos in the CSVs written before each video carried its scrape time. The rows of
+    those CSVs were appended one scrape run after another, so each row belongs to the latest run starting at or before
+    it.
+
+    :param rows: The row numbers of the videos, i.e. the index of the CSV.
+    :param runs: DataFrame of "first_row", the row number of the first video of each run, and "scrape_time", e.g. read
+      from "data/csv/scrape_runs.csv".
+    :return: Series of the scrape times, indexed by the row numbers, with NaT for the rows before the first run.
+    """
+    runs = runs.sort_values('first_row')
+    rows = pd.Index(rows)
+    scrape_times = pd.to_datetime(runs['scrape_time']).to_numpy()
+
+    # The position of the run of each row, -1 for the rows before the first run
+    positions = runs['first_row'].searchsorted(rows.to_numpy(), side='right') - 1
+    return pd.Series(np.where(positions >= 0, scrape_times[positions], np.datetime64('NaT')), index=rows,
+                     name='scrape_time')
+
+
+def apply_snapshots(df: pd.DataFrame, snapshots: pd.DataFrame) -> pd.DataFrame:
+    """
+    Bring the statistics of the videos up to date with their refreshed snapshots, reusing the other fields, which do
+    not change between scrapes. The subscribers of the channels are not refreshed, so "view_to_sub" is recomputed with
+    the subscribers of the full scrape.
+
+    :param df: DataFrame indexed by video ID, with "scrape_time" and any of the statistics, e.g. as read by
+      "DatasetStore.read".
+    :param snapshots: DataFrame indexed by video ID, with "scrape_time" and the statistics, e.g. as read by
+      "DatasetStore.read_snapshots".
+    :return: A copy of the DataFrame, where the statistics and the scrape time of each video are replaced by those of
+      its latest snapshot, if it is later than the video's scrape time.
+    """
+    latest = snapshots.sort_values('scrape_time', kind='stable')
+    latest = latest[~latest.index.duplicated(keep='last')].reindex(df.index)
+
+    # Missing snapshots have NaT scrape times, which are never later
+    newer = (latest['scrape_time'] > df['scrape_time']).to_numpy()
+
+    # Aligned by position, as a video can have several records
+    index = df.index
+    df = df.reset_index(drop=True)
+    latest = latest.reset_index(drop=True)
+
+    for column in list(STATISTICS_COLUMNS) + ['scrape_time']:
+        if column in df:
+            df[column] = df[column].mask(newer, latest[column]).astype(df[column].dtype)
+    if {'view_to_sub', 'view', 'channel_sub'} <= set(df.columns):
+        df['view_to_sub'] = df['view'] / df['channel_sub']
+
+    df.index = index
+    return df
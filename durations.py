@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+# ISO 8601 durations as returned by the YouTube API, e.g. "PT1H2M3S", "PT5M", "PT1H3S" or "P1DT2H". Every part is
+# optional, and YouTube uses "P0D" for live streams.
+DURATION_PATTERN = (r'^P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?'
+                    r'(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$')
+
+SECONDS = {'weeks': 604800, 'days': 86400, 'hours': 3600, 'minutes': 60, 'seconds': 1}
+
+
+def parse_durations(lengths: pd.Series) -> pd.Series:
+    """
+    Convert the ISO 8601 durations of a whole column into seconds at once, with any combination of weeks, days, hours,
+    minutes and seconds. Videos share a small number of distinct durations, so each distinct string is only parsed once
+    and the seconds are spread back by position.
+
+    :param lengths: The durations, e.g. "PT1H2M3S".
+    :return: The durations in seconds as nullable integers, with the same index, and missing values for the strings
+      that are not durations.
+    """
+    codes, uniques = pd.factorize(lengths)
+    parts = pd.Series(uniques, dtype='string').str.extract(DURATION_PATTERN)
+
+    # A duration has at least one part, so the strings without any are not durations
+    matched = parts.notna().any(axis=1)
+
+    seconds = sum(parts[unit].astype('float64').fillna(0) * factor for unit, factor in SECONDS.items())
+    seconds = seconds.where(matched).to_numpy()
+
+    # Missing values are coded as -1, which points at the appended NaN
+    return pd.Series(np.append(seconds, np.nan)[codes], index=lengths.index, name=lengths.name).astype('Int64')
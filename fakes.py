@@ -0,0 +1,357 @@
+"""
+Local stand-ins for the clients of the Google APIs, so that the scraping and the cleaning can be run and measured
+without credentials or a network connection. The responses are synthetic but deterministic, and have the shapes of the
+real ones. Responses recorded from the real APIs can be replayed instead: the YouTube responses recorded by
+"RecordingYouTube", and the languages and annotations kept by "language.LanguageCache" and "annotation.AnnotationCache".
+"""
+
+import copy
+import hashlib
+import json
+import random
+from datetime import datetime, timedelta
+from threading import Lock
+from time import sleep
+from types import SimpleNamespace
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+import language
+
+# Values the synthetic videos are made of
+DURATIONS = ['PT4M13S', 'PT1H2M3S', 'PT45S', 'PT10M', 'PT1H5S', 'PT2H', 'PT5M', 'PT1H3S', 'P0D']
+CATEGORIES = {'1': 'Film & Animation', '10': 'Music', '20': 'Gaming', '22': 'People & Blogs', '24': 'Entertainment',
+              '27': 'Education', '28': 'Science & Technology'}
+WORDS = ['How', 'I', 'Made', 'The', 'BEST', 'Video', 'Ever', 'why', 'you', 'should', 'NEVER', 'do', 'this', 'Minecraft',
+         'Challenge', '100', 'Days', 'Review', 'Tutorial', 'Cooking', 'Science', 'EXPLAINED']
+LABELS = ['Person', 'Clothing', 'Car', 'Food', 'Animal', 'Building', 'Toy', 'Packaged goods']
+
+
+def _rng(*seed) -> random.Random:
+    """
+    A random generator seeded by a string, so that the same ID always gives the same values on every platform.
+    """
+    return random.Random(hashlib.sha256('-'.join(map(str, seed)).encode('utf-8')).hexdigest())
+
+
+def synthetic_video_detail(video_id: str, rng: random.Random) -> dict:
+    """
+    Generate the details of a video in the format returned by the "videos.list" request of the YouTube API.
+
+    :param video_id: The ID of the video.
+    :param rng: The random generator.
+    :return: The video details.
+    """
+    published_at = datetime(2020, 1, 1) + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+    quality = rng.choice(['maxres', 'standard', 'high'])
+    detail = {
+        'id': video_id,
+        'snippet': {
+            'title': ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(2, 10))),
+            'description': 'A synthetic description.\nWith a second line.',
+            'publishedAt': published_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'tags': ['synthetic', 'benchmark'],
+            'categoryId': rng.choice(list(CATEGORIES)),
+            'thumbnails': {quality: {'url': f'https://i.ytimg.com/vi/{video_id}/{quality}default.jpg'}},
+            'defaultLanguage': rng.choice(['en', 'en-US', None]),
+        },
+        'statistics': {
+            'viewCount': str(rng.randrange(100, 10 ** 7)),
+            'likeCount': str(rng.randrange(10 ** 5)),
+            'dislikeCount': str(rng.randrange(10 ** 4)),
+            'commentCount': str(rng.randrange(10 ** 4)),
+        },
+        'contentDetails': {
+            'duration': rng.choice(DURATIONS),
+            'dimension': '2d',
+            'definition': rng.choice(['hd', 'sd']),
+            'caption': rng.choice(['true', 'false']),
+        },
+    }
+    if rng.random() < 0.5:
+        detail['topicDetails'] = {'topicCategories': ['https://en.wikipedia.org/wiki/Entertainment']}
+    if rng.random() < 0.1:
+        detail['localizations'] = {'en': {}, 'fr': {}}
+    if rng.random() < 0.02:
+        detail['liveStreamingDetails'] = {}
+    return detail
+
+
+def _request_key(resource: str, kwargs: dict) -> str:
+    """
+    The key of a request in a recording, e.g. for "videos" and {"id": "a,b", "part": [...]}.
+    """
+    return json.dumps([resource, kwargs], sort_keys=True, default=str)
+
+
+class _Request:
+    """
+    A stand-in for "googleapiclient.http.HttpRequest", which sends the request when executed.
+    """
+
+    def __init__(self, method_id: str, send):
+        self.methodId = method_id
+        self._send = send
+
+    def execute(self):
+        return self._send()
+
+
+class _Resource:
+    """
+    A stand-in for a resource of the YouTube API client, e.g. "youtube.videos()".
+    """
+
+    def __init__(self, client, name: str):
+        self._client = client
+        self._name = name
+
+    def list(self, **kwargs) -> _Request:
+        return _Request(f'youtube.{self._name}.list', lambda: self._client.respond(self._name, kwargs))
+
+
+def _http_error(status: int, reason: str, message: str) -> HttpError:
+    """
+    An HttpError with the JSON content of the errors of the Google APIs.
+    """
+    content = {'error': {'code': status, 'message': message, 'errors': [{'reason': reason}]}}
+    return HttpError(httplib2.Response({'status': status}), json.dumps(content).encode('utf-8'))
+
+
+class FakeYouTube:
+    """
+    A stand-in for the client returned by "build('youtube', 'v3', developerKey=...)", answering the "channels",
+    "playlistItems" and "videos" list requests used by "scraping". Every channel exists, with a synthetic number of
+    subscribers and videos derived from its ID, and every video has synthetic details derived from its ID. It can be
+    shared by several threads.
+    """
+
+    def __init__(self, seed: int = 0, videos_per_channel: int = 10, latency: float = 0, quota: int = None,
+                 errors: dict = None, recording: str = None):
+        """
+        :param seed: Default 0. The seed of the synthetic responses.
+        :param videos_per_channel: Default 10. The number of videos of every channel.
+        :param latency: Default 0. The seconds every request takes, to simulate the network.
+        :param quota: Default None. If given, the number of requests answered before every other request fails with
+          the HttpError "quotaExceeded" of the real API.
+        :param errors: Default None. If given, the requests, numbered from 1, that fail with the HttpError of a status,
+          e.g. {53: 503} for a transient "backendError".
+        :param recording: Default None. If given, the JSON file written by "RecordingYouTube", whose responses are
+          replayed for the requests recorded in it.
+        """
+        self.seed = seed
+        self.videos_per_channel = videos_per_channel
+        self.latency = latency
+        self.quota = quota
+        self.errors = errors or {}
+        self.requests = 0
+        self._lock = Lock()
+
+        self.recording = {}
+        if recording:
+            with open(recording, 'r', encoding='utf-8') as file:
+                self.recording = json.load(file)
+
+    def channels(self) -> _Resource:
+        return _Resource(self, 'channels')
+
+    def playlistItems(self) -> _Resource:
+        return _Resource(self, 'playlistItems')
+
+    def videos(self) -> _Resource:
+        return _Resource(self, 'videos')
+
+    def respond(self, resource: str, kwargs: dict) -> dict:
+        """
+        :param resource: The resource requested, e.g. "videos".
+        :param kwargs: The parameters of the request.
+        :return: The response, from the recording if it is recorded.
+        """
+        with self._lock:
+            self.requests += 1
+            number = self.requests
+        if self.quota is not None and number > self.quota:
+            raise _http_error(403, 'quotaExceeded', 'The request cannot be completed because you have exceeded your '
+                                                    'quota.')
+        if number in self.errors:
+            raise _http_error(self.errors[number], 'backendError', 'Backend Error')
+        if self.latency:
+            sleep(self.latency)
+
+        key = _request_key(resource, kwargs)
+        if key in self.recording:
+            return copy.deepcopy(self.recording[key])
+        return getattr(self, '_' + resource)(**kwargs)
+
+    def _channels(self, id: str, **kwargs) -> dict:
+        items = [{'id': channel, 'statistics': {'subscriberCount': str(_rng(self.seed, channel).randrange(10 ** 7))}}
+                 for channel in id.split(',')]
+        return {'pageInfo': {'totalResults': len(items)}, 'items': items}
+
+    def _playlistItems(self, playlistId: str, maxResults: int = 5, **kwargs) -> dict:
+        # Video IDs of 11 characters, like the real ones, derived from the channel of the uploads playlist
+        channel = hashlib.sha256((playlistId[0] + 'C' + playlistId[2:]).encode('utf-8')).hexdigest()
+        videos = [f'{channel[:7]}{i:04d}' for i in range(min(maxResults, self.videos_per_channel))]
+        return {'items': [{'snippet': {'resourceId': {'videoId': video}}} for video in videos]}
+
+    def _videos(self, id: str, part: list = None, **kwargs) -> dict:
+        items = [synthetic_video_detail(video, _rng(self.seed, video)) for video in id.split(',')]
+        if part is not None:
+            # Only the requested parts, e.g. the statistics of a refresh
+            items = [{key: value for key, value in item.items() if key == 'id' or key in part} for item in items]
+        return {'items': items}
+
+
+class RecordingYouTube:
+    """
+    A wrapper of a real YouTube API client that records its responses, so that a crawl can be replayed offline by
+    "FakeYouTube". Each worker of "scraping.iter_video_from_channels" should be given its own wrapper, as the client is
+    not thread-safe.
+    """
+
+    def __init__(self, youtube, recording: dict = None):
+        """
+        :param youtube: The client returned by "build('youtube', 'v3', developerKey=...)".
+        :param recording: Default None. The dictionary to record the responses in, which can be shared by several
+          wrappers.
+        """
+        self._youtube = youtube
+        self.recording = {} if recording is None else recording
+
+    def __getattr__(self, name: str):
+        resource = getattr(self._youtube, name)
+
+        def list_(**kwargs):
+            request = resource().list(**kwargs)
+
+            def send():
+                response = request.execute()
+                self.recording[_request_key(name, kwargs)] = response
+                return response
+
+            return _Request(request.methodId, send)
+
+        return lambda: SimpleNamespace(list=list_)
+
+    def save(self, path: str):
+        """
+        :param path: The JSON file to write the recording to.
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.recording, file)
+
+
+class FakeTranslateClient:
+    """
+    A stand-in for "translate_v2.Client()", answering "detect_language" with the offline detector of "language", or
+    English for the texts it is unsure of, or with the results recorded in a "language.LanguageCache".
+    """
+
+    def __init__(self, confidence: float = 0.95, latency: float = 0, recording: str = None):
+        """
+        :param confidence: Default 0.95. The confidence of the synthetic results.
+        :param latency: Default 0. The seconds every request takes, to simulate the network.
+        :param recording: Default None. If given, the SQLite database of a "language.LanguageCache" filled by the real
+          API, whose results are replayed for the texts in it.
+        """
+        self.confidence = confidence
+        self.latency = latency
+        self.requests = 0
+        self.recording = recording
+
+    def detect_language(self, values):
+        self.requests += 1
+        if self.latency:
+            sleep(self.latency)
+
+        single = isinstance(values, str)
+        values = [values] if single else list(values)
+
+        recorded = {}
+        if self.recording:
+            cache = language.LanguageCache(self.recording)
+            recorded = cache.get(values)
+            cache.close()
+
+        results = []
+        for text in values:
+            result = recorded.get(text) or language.detect_language_offline(text) or \
+                {'language': 'en', 'confidence': self.confidence}
+            results.append({'language': result['language'], 'confidence': result['confidence'], 'input': text})
+        return results[0] if single else results
+
+
+class FakeVisionClient:
+    """
+    A stand-in for "vision.ImageAnnotatorClient()", answering "batch_annotate_images" with synthetic objects and texts
+    derived from the hash of each image, or with the annotations recorded in an "annotation.AnnotationCache". It can
+    be shared by several threads.
+    """
+
+    def __init__(self, seed: int = 0, latency: float = 0, recording: str = None, errors: set = None):
+        """
+        :param seed: Default 0. The seed of the synthetic annotations.
+        :param latency: Default 0. The seconds every request takes, to simulate the network.
+        :param recording: Default None. If given, the SQLite database of an "annotation.AnnotationCache" filled by the
+          real API, whose annotations are replayed for the images in it.
+        :param errors: Default None. The SHA-256 of the images, or the URIs of the images sent without bytes, that are
+          answered with an error, as the API does for an image it cannot process, while the other images of the same
+          request are annotated.
+        """
+        self.seed = seed
+        self.latency = latency
+        self.requests = 0
+        self.recording = recording
+        self.errors = errors or set()
+        self._lock = Lock()
+
+    def _annotate(self, image: dict, cache) -> SimpleNamespace:
+        content = image.get('content')
+        digest = hashlib.sha256(content).hexdigest() if content else None
+
+        if (digest or image['source']['image_uri']) in self.errors:
+            return SimpleNamespace(localized_object_annotations=[], text_annotations=[],
+                                   error=SimpleNamespace(message='Bad image data.'))
+
+        recorded = cache.get(digest) if cache is not None and digest else None
+        if recorded is None:
+            rng = _rng(self.seed, digest or image['source']['image_uri'])
+            recorded = {
+                'objects': [{'name': rng.choice(LABELS), 'score': rng.random()} for _ in range(rng.randrange(5))],
+                'text': ''.join(rng.choice(WORDS).upper() + '\n' for _ in range(rng.randrange(4))) or None,
+                'error': None,
+            }
+
+        return SimpleNamespace(
+            localized_object_annotations=[SimpleNamespace(**object_) for object_ in recorded['objects']],
+            text_annotations=[SimpleNamespace(description=recorded['text'])] if recorded['text'] else [],
+            error=SimpleNamespace(message=recorded['error'] or ''),
+        )
+
+    def batch_annotate_images(self, requests: list) -> SimpleNamespace:
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            sleep(self.latency)
+
+        # Imported here so that the other stand-ins do not need the Vision client library
+        import annotation
+
+        # The connection is opened by each call, as the calls can come from different threads
+        cache = annotation.AnnotationCache(self.recording) if self.recording else None
+        responses = [self._annotate(request['image'], cache) for request in requests]
+        if cache is not None:
+            cache.close()
+        return SimpleNamespace(responses=responses)
+
+
+def build(serviceName: str, version: str, developerKey: str = None, **kwargs) -> FakeYouTube:
+    """
+    A stand-in for "googleapiclient.discovery.build", e.g. to replace "scraping.build" in a benchmark.
+
+    :return: A "FakeYouTube" with the default settings.
+    """
+    if serviceName != 'youtube':
+        raise ValueError(f'No stand-in for the "{serviceName}" API')
+    return FakeYouTube()
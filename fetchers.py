@@ -0,0 +1,112 @@
+"""
+Page-fetch backends for "scrape_channel_ids". A backend finds the links to other channels on the "channels" page of a
+YouTube channel, i.e. the "href" of every element with the ID "channel-info". Each worker of the crawl owns one backend.
+"""
+
+import os
+from html.parser import HTMLParser
+from time import sleep
+from urllib.parse import urljoin
+
+YOUTUBE_URL = 'https://www.youtube.com'
+
+
+class ChromeFetcher:
+    """
+    Fetch the pages with a Chrome browser driven by Selenium.
+    """
+
+    def __init__(self, headless: bool = True, executable_path: str = 'chromedriver.exe'):
+        """
+        :param headless: Default true. If true, run Chrome without a window.
+        :param executable_path: Default "chromedriver.exe". The path to the Chrome driver.
+        """
+        # Imported here so that the other backends can be used without Selenium
+        from selenium import webdriver
+        from selenium.webdriver import ChromeOptions
+
+        options = ChromeOptions()
+        options.add_experimental_option('prefs', {
+            'download.prompt_for_download': False,
+            'download.directory_upgrade': True,
+        })
+        if headless:
+            options.add_argument('--headless')
+
+        self.driver = webdriver.Chrome(executable_path, chrome_options=options)
+
+    def __call__(self, channel: str) -> list:
+        """
+        :param channel: The URL of the channel.
+        :return: The URLs of the channels linked on its "channels" page.
+        """
+        # Navigate to the "channels" page of the YouTube channel
+        self.driver.get(channel + '/channels')
+
+        # Identify all linked channels
+        elements = self.driver.find_elements_by_id('channel-info')
+        return [elem.get_attribute('href') for elem in elements]
+
+    def close(self):
+        self.driver.close()
+
+
+class _ChannelInfoParser(HTMLParser):
+    """
+    Collect the "href" of every element with the ID "channel-info", resolved into absolute URLs as a browser does.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if attrs.get('id') == 'channel-info' and attrs.get('href'):
+            self.links.append(urljoin(YOUTUBE_URL, attrs['href']))
+
+
+def extract_channel_links(html: str) -> list:
+    """
+    Find the links to other channels in the HTML of a "channels" page.
+
+    :param html: The HTML of the page.
+    :return: The URLs of the linked channels, in the order they appear.
+    """
+    parser = _ChannelInfoParser()
+    parser.feed(html)
+    parser.close()
+    return parser.links
+
+
+class FileFetcher:
+    """
+    Fetch the pages from HTML files saved on disk, without a browser. The page of a channel is the file named after
+    the last part of its URL, e.g. "UCYO_jab_esuFRV4b17AJtAw.html", and a channel without a file links no channels.
+    """
+
+    def __init__(self, directory: str, delay: float = 0):
+        """
+        :param directory: The directory of the HTML files.
+        :param delay: Default 0. The seconds to wait for every page, to simulate the loading time of a browser.
+        """
+        self.directory = directory
+        self.delay = delay
+
+    def __call__(self, channel: str) -> list:
+        """
+        :param channel: The URL of the channel.
+        :return: The URLs of the channels linked on its "channels" page.
+        """
+        if self.delay:
+            sleep(self.delay)
+
+        path = os.path.join(self.directory, channel.rstrip('/').split('/')[-1] + '.html')
+        if not os.path.exists(path):
+            return []
+
+        with open(path, 'r', encoding='utf-8') as file:
+            return extract_channel_links(file.read())
+
+    def close(self):
+        pass
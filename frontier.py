@@ -0,0 +1,113 @@
+import sqlite3
+from collections import deque
+
+# Every URL of a channel with an ID is this prefix followed by the 24-character ID starting with "UC"
+CHANNEL_URL_PREFIX = 'https://www.youtube.com/channel/'
+
+
+class CrawlFrontier:
+    """
+    The state of a breadth-first crawl over the "channels" pages of YouTube channels. The channels seen and the
+    channels found are kept in hash sets, the channels waiting to be processed in a deque, and every change is
+    persisted to a SQLite database so that an interrupted crawl can be resumed from where it stopped.
+
+    A channel is only marked as processed together with the links found on its page, in one transaction, so a channel
+    interrupted while being processed is simply processed again on resume.
+    """
+
+    def __init__(self, path: str = ':memory:', known: set = None):
+        """
+        :param path: Default ":memory:". The SQLite database to persist the crawl in. If it already contains a crawl,
+          the crawl is resumed.
+        :param known: Default None. Channel IDs found previously, e.g. a set or a "channel_index.ChannelIndex" of the
+          channel lists, that should not be returned again. The crawl still passes through these channels.
+        """
+        self.known = known or set()
+
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS frontier ('
+                         'url TEXT PRIMARY KEY, depth INTEGER NOT NULL, processed INTEGER NOT NULL DEFAULT 0)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS results (channel_id TEXT PRIMARY KEY)')
+        self._db.commit()
+
+        # Channels seen, whether processed or not, to prevent duplicated retrieval
+        self.seen = set()
+        # Channels waiting to be processed, as pairs of (URL, depth), in the order they are found
+        self.queue = deque()
+        # Channel IDs found, in the order they are found
+        self.results = []
+        self._result_set = set()
+
+        for url, depth, processed in self._db.execute('SELECT url, depth, processed FROM frontier ORDER BY rowid'):
+            self.seen.add(url)
+            if not processed:
+                self.queue.append((url, depth))
+
+        for (channel_id,) in self._db.execute('SELECT channel_id FROM results ORDER BY rowid'):
+            self.results.append(channel_id)
+            self._result_set.add(channel_id)
+
+    def __len__(self):
+        return len(self.queue)
+
+    def _add(self, links: list, depth: int):
+        """
+        Add the links not seen before to the frontier and the results, without committing.
+        """
+        new_links = []
+        new_results = []
+
+        for link in links:
+            if link in self.seen:
+                continue
+            self.seen.add(link)
+            self.queue.append((link, depth))
+            new_links.append((link, depth))
+
+            if 'channel/UC' in link:
+                channel_id = link[len(CHANNEL_URL_PREFIX):]
+                if channel_id not in self._result_set and channel_id not in self.known:
+                    self._result_set.add(channel_id)
+                    self.results.append(channel_id)
+                    new_results.append((channel_id,))
+
+        self._db.executemany('INSERT INTO frontier (url, depth) VALUES (?, ?)', new_links)
+        self._db.executemany('INSERT INTO results (channel_id) VALUES (?)', new_results)
+
+    def add_initial(self, channelIds: list):
+        """
+        Add the channels to start the crawl with. Channels already in a resumed crawl are ignored.
+
+        :param channelIds: The IDs of the channels.
+        """
+        self._add([CHANNEL_URL_PREFIX + channel for channel in channelIds], 0)
+        self._db.commit()
+
+    def next_level(self, max_depth: int) -> list:
+        """
+        Take all the channels of the next depth to process, if the depth is smaller than the maximum depth.
+
+        :param max_depth: The depth the crawl should stop at.
+        :return: A list of pairs of (URL, depth), empty if there are no more channels to process.
+        """
+        level = []
+        if self.queue:
+            depth = self.queue[0][1]
+            while self.queue and self.queue[0][1] == depth and depth < max_depth:
+                level.append(self.queue.popleft())
+        return level
+
+    def expand(self, url: str, depth: int, links: list):
+        """
+        Mark a channel as processed and add the links found on its page at the next depth, in one transaction.
+
+        :param url: The URL of the processed channel.
+        :param depth: The depth of the processed channel.
+        :param links: The URLs of the channels linked by the processed channel.
+        """
+        self._add(links, depth + 1)
+        self._db.execute('UPDATE frontier SET processed = 1 WHERE url = ?', (url,))
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
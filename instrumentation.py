@@ -0,0 +1,259 @@
+import csv
+import json
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Event, Lock, Thread
+from time import perf_counter
+
+# The columns of the CSV reports
+REPORT_COLUMNS = ['run', 'kind', 'name', 'seconds', 'rows', 'rows_per_second', 'start_rss_mb', 'peak_rss_mb',
+                  'peak_rss_delta_mb', 'children_peak_rss_mb', 'calls', 'quota_units', 'retries', 'errors']
+
+# The seconds between two samples of the memory during a stage
+SAMPLE_INTERVAL = 0.02
+
+
+def peak_rss(children: bool = False) -> float:
+    """
+    :param children: Default false. If true, the peak of the largest child process that ended and was waited for,
+      instead of the peak of the process itself.
+    :return: The peak resident memory so far in MB, or None if it cannot be measured on this platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windows has no "resource" module, but psutil reports the peak working set if it is installed
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return None if children else psutil.Process().memory_info().peak_wset / 2 ** 20
+
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # In bytes on macOS and in KB elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def current_rss() -> float:
+    """
+    :return: The current resident memory of the process in MB, or None if it cannot be measured on this platform.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        # Not on Linux, where psutil reports the resident memory if it is installed
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().rss / 2 ** 20
+
+
+def _children_rss() -> float:
+    """
+    :return: The current resident memory of all the child processes in MB, or None if psutil is not installed.
+    """
+    try:
+        import psutil
+    except ImportError:
+        return None
+
+    total = 0
+    for child in psutil.Process().children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            # The child ended in between
+            pass
+    return total / 2 ** 20
+
+
+class MemorySampler:
+    """
+    Measures the memory used over a stage, rather than over the whole life of the process: the resident memory of the
+    process is sampled by a background thread from the start to the stop of the sampler, and its peak is exact
+    whenever it is above every earlier peak of the process.
+
+    The child processes, e.g. of a process pool, are sampled as a total if psutil is installed. Otherwise only the
+    children that ended during the stage are measured, by the peak of the largest of them, and only if it is above the
+    peak of the children of the earlier stages.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        """
+        :param interval: Default 0.02. The seconds between two samples.
+        """
+        self.interval = interval
+        self._stop = Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._sample_once()
+
+    def _sample_once(self):
+        rss = current_rss()
+        if rss is not None:
+            self._peak = max(self._peak, rss)
+        children = _children_rss()
+        if children is not None:
+            self._children_peak = max(self._children_peak or 0, children)
+
+    def start(self) -> 'MemorySampler':
+        self._start = current_rss()
+        self._peak = self._start or 0
+        self._children_peak = None
+        self._lifetime_peak = peak_rss()
+        self._children_lifetime_peak = peak_rss(children=True)
+
+        self._stop.clear()
+        self._thread = Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> dict:
+        """
+        :return: A dictionary of the resident memory in MB at the start of the stage, its peak over the stage, the
+          difference of the two, and the peak of the child processes over the stage, each None if not measured.
+        """
+        self._stop.set()
+        self._thread.join()
+        self._sample_once()
+
+        # A peak of the process above its earlier peaks was reached during the stage, and is exact
+        lifetime_peak = peak_rss()
+        peak = self._peak if self._start is not None else None
+        if lifetime_peak is not None and self._lifetime_peak is not None and lifetime_peak > self._lifetime_peak:
+            peak = max(peak or 0, lifetime_peak)
+
+        children_peak = self._children_peak
+        children_lifetime_peak = peak_rss(children=True)
+        if children_lifetime_peak is not None and children_lifetime_peak > (self._children_lifetime_peak or 0):
+            children_peak = max(children_peak or 0, children_lifetime_peak)
+
+        return {
+            'start_rss_mb': self._start,
+            'peak_rss_mb': peak,
+            'peak_rss_delta_mb': peak - self._start if peak is not None and self._start is not None else None,
+            'children_peak_rss_mb': children_peak,
+        }
+
+
+class Instrumentation:
+    """
+    Records where the time, memory and API quota of a run go: the wall time, rows per second and memory of each stage,
+    and the calls, estimated quota units, retries, errors and time of each kind of external call. It can be shared by
+    several threads, and is written as one JSON or CSV report per run.
+    """
+
+    def __init__(self, run: str = None):
+        """
+        :param run: Default None. The name of the run in the report, the current time if None.
+        """
+        self.run = run or datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.stages = []
+        self.calls = {}
+        self._lock = Lock()
+
+    @contextmanager
+    def stage(self, name: str, rows: int = None):
+        """
+        Time a stage of the run.
+
+        :param name: The name of the stage.
+        :param rows: Default None. The number of rows processed by the stage, if known in advance.
+        :return: A context manager giving the dictionary of the stage, whose "rows" can be set inside the stage.
+        """
+        record = {'rows': rows, 'error': None}
+        sampler = MemorySampler().start()
+        start = perf_counter()
+
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = repr(e)
+            raise
+        finally:
+            seconds = perf_counter() - start
+            self.add_stage(name, seconds, record['rows'], record['error'], sampler.stop())
+
+    def add_stage(self, name: str, seconds: float, rows: int = None, error: str = None, memory: dict = None):
+        """
+        Record a stage timed by the caller.
+
+        :param name: The name of the stage.
+        :param seconds: The wall time of the stage.
+        :param rows: Default None. The number of rows processed by the stage.
+        :param error: Default None. The error that stopped the stage.
+        :param memory: Default None. The memory of the stage, as returned by "MemorySampler.stop". If None, only the
+          peak memory of the process so far is recorded, which is the peak of the stage only if the stage started with
+          the process, e.g. its startup.
+        """
+        record = {
+            'name': name,
+            'seconds': seconds,
+            'rows': rows,
+            'rows_per_second': rows / seconds if rows and seconds else None,
+            **(memory or {'start_rss_mb': None, 'peak_rss_mb': peak_rss(), 'peak_rss_delta_mb': None,
+                          'children_peak_rss_mb': None}),
+            'error': error,
+        }
+        with self._lock:
+            self.stages.append(record)
+
+    def count(self, name: str, calls: int = 0, quota_units: float = 0, retries: int = 0, errors: int = 0,
+              seconds: float = 0):
+        """
+        Add to the counters of a kind of external call, e.g. "youtube.videos.list".
+
+        :param name: The kind of call.
+        :param calls: Default 0. The number of calls made.
+        :param quota_units: Default 0. The estimated quota units used by the calls.
+        :param retries: Default 0. The number of retries.
+        :param errors: Default 0. The number of calls that failed.
+        :param seconds: Default 0. The time spent in the calls.
+        """
+        with self._lock:
+            counters = self.calls.setdefault(name, {'calls': 0, 'quota_units': 0, 'retries': 0, 'errors': 0,
+                                                    'seconds': 0})
+            counters['calls'] += calls
+            counters['quota_units'] += quota_units
+            counters['retries'] += retries
+            counters['errors'] += errors
+            counters['seconds'] += seconds
+
+    def report(self) -> list:
+        """
+        :return: A list of dictionaries, one for each stage and one for each kind of call, with the keys of
+          "REPORT_COLUMNS".
+        """
+        with self._lock:
+            rows = [{'run': self.run, 'kind': 'stage', **stage, 'errors': int(stage['error'] is not None)}
+                    for stage in self.stages]
+            rows += [{'run': self.run, 'kind': 'call', 'name': name, **counters}
+                     for name, counters in self.calls.items()]
+        return [{column: row.get(column) for column in REPORT_COLUMNS} for row in rows]
+
+    def write(self, path: str):
+        """
+        Write the report of the run, as JSON or CSV by the extension of the path.
+
+        :param path: The file, e.g. "data/reports/collection_20210101_000000.json".
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.DictWriter(file, fieldnames=REPORT_COLUMNS)
+                writer.writeheader()
+                writer.writerows(self.report())
+        else:
+            with self._lock:
+                report = {'run': self.run, 'stages': list(self.stages),
+                          'calls': [{'name': name, **counters} for name, counters in self.calls.items()]}
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2)
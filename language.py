@@ -0,0 +1,205 @@
+import hashlib
+import re
+import sqlite3
+from time import perf_counter
+
+from tqdm import tqdm
+
+from instrumentation import Instrumentation
+
+# The Google Cloud Translate API limits the size of a request, and the number of strings in it
+MAX_REQUEST_BYTES = 400_000
+MAX_REQUEST_SEGMENTS = 128
+
+# Unicode ranges of the scripts that are used by one language, or by languages other than English
+SCRIPT_LANGUAGES = [
+    (0x3040, 0x30FF, 'ja'),  # Hiragana and Katakana
+    (0xAC00, 0xD7AF, 'ko'),  # Hangul syllables
+    (0x1100, 0x11FF, 'ko'),  # Hangul jamo
+    (0x0E00, 0x0E7F, 'th'),  # Thai
+    (0x0600, 0x06FF, 'ar'),  # Arabic
+    (0x0900, 0x097F, 'hi'),  # Devanagari
+    (0x0590, 0x05FF, 'iw'),  # Hebrew
+    (0x0370, 0x03FF, 'el'),  # Greek
+    (0x4E00, 0x9FFF, 'zh'),  # CJK unified ideographs, checked after Kana so that Japanese is not taken as Chinese
+]
+
+# Common English words that are rarely words of other languages
+ENGLISH_WORDS = {
+    'the', 'and', 'of', 'to', 'is', 'in', 'it', 'you', 'that', 'was', 'for', 'on', 'are', 'with', 'they', 'be', 'at',
+    'this', 'have', 'from', 'or', 'by', 'what', 'how', 'why', 'when', 'your', 'my', 'we', 'can', 'will', 'not', 'all',
+    'about', 'out', 'up', 'just', 'do', 'does', 'did', 'its', 'it\'s', 'i\'m', 'don\'t', 'new', 'best', 'first',
+    'every', 'ever', 'should', 'could', 'would', 'get', 'make', 'made', 'into', 'than', 'then', 'them', 'these',
+    'those', 'which', 'who', 'our', 'their', 'there', 'here', 'because', 'most', 'more', 'after', 'before', 'world',
+}
+
+_WORD = re.compile(r"[a-z']+")
+
+
+def detect_language_offline(text: str):
+    """
+    A heuristic language detector resolving the easy cases without the Translate API: texts written mostly in a script
+    used by a single language, or by languages other than English, and texts in plain English.
+
+    :param text: The text to detect the language of.
+    :return: A dictionary of "language" and "confidence" as returned by the Translate API, or None if unsure.
+    """
+    letters = [char for char in text if char.isalpha()]
+    if not letters:
+        return None
+
+    # Count the letters of each script, the first matching range wins
+    counts = {}
+    for char in letters:
+        code = ord(char)
+        for low, high, language in SCRIPT_LANGUAGES:
+            if low <= code <= high:
+                counts[language] = counts.get(language, 0) + 1
+                break
+
+    # Any Kana means Japanese, even if Kanji are more
+    if counts.get('ja'):
+        counts['ja'] += counts.pop('zh', 0)
+
+    if counts:
+        language, count = max(counts.items(), key=lambda item: item[1])
+        if count / len(letters) > 0.5:
+            return {'language': language, 'confidence': 1.0}
+
+    if not all(char.isascii() for char in letters):
+        return None
+
+    words = _WORD.findall(text.lower())
+    english = sum(word in ENGLISH_WORDS for word in words)
+    if english >= 2 and english / len(words) >= 0.25:
+        return {'language': 'en', 'confidence': 1.0}
+
+    return None
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class LanguageCache:
+    """
+    The languages detected by the Translate API, kept in a SQLite database keyed by the hash of the text, so that
+    reruns and overlapping datasets never request the same text twice.
+    """
+
+    def __init__(self, path: str = 'data/languages.db'):
+        """
+        :param path: Default "data/languages.db". The SQLite database of the cache.
+        """
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS languages '
+                         '(hash TEXT PRIMARY KEY, language TEXT, confidence REAL)')
+        self._db.commit()
+
+    def get(self, texts: list) -> dict:
+        """
+        :param texts: The texts to look up.
+        :return: A dictionary of the cached results, keyed by text.
+        """
+        hashes = {_hash(text): text for text in texts}
+        results = {}
+        keys = list(hashes)
+
+        # SQLite limits the number of parameters in a query
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            for key, language, confidence in self._db.execute(
+                    f'SELECT hash, language, confidence FROM languages WHERE hash IN ({", ".join("?" * len(chunk))})',
+                    chunk):
+                results[hashes[key]] = {'language': language, 'confidence': confidence}
+        return results
+
+    def put(self, results: dict):
+        """
+        :param results: A dictionary of the results to cache, keyed by text.
+        """
+        self._db.executemany('INSERT OR REPLACE INTO languages VALUES (?, ?, ?)',
+                             [(_hash(text), result['language'], result['confidence'])
+                              for text, result in results.items()])
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+def _batches(texts: list, max_bytes: int, max_segments: int):
+    """
+    Pack the texts into batches that fit in one request.
+    """
+    batch = []
+    size = 0
+    for text in texts:
+        text_size = len(text.encode('utf-8'))
+        if batch and (size + text_size > max_bytes or len(batch) == max_segments):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(text)
+        size += text_size
+    if batch:
+        yield batch
+
+
+def detect_languages(texts: list, client, cache: LanguageCache = None, offline=None,
+                     max_bytes: int = MAX_REQUEST_BYTES, max_segments: int = MAX_REQUEST_SEGMENTS,
+                     desc: str = 'Detecting languages...', instrumentation: Instrumentation = None) -> list:
+    """
+    Detect the languages of the texts with the Google Cloud Translate API, packing as many texts into each request as
+    the limits of the API allow. Each distinct text is only requested once, and never if it is cached or resolved by the
+    offline detector.
+
+    :param texts: The texts to detect the language of.
+    :param client: The Translate API client, i.e. "translate_v2.Client()".
+    :param cache: Default None. If given, look up the texts in the cache first, and cache the results of the API.
+    :param offline: Default None. If given, a function like "detect_language_offline" that detects the language of a
+      text locally, returning None if it is unsure.
+    :param max_bytes: Default 400k. The maximum size of the texts in one request.
+    :param max_segments: Default 128. The maximum number of texts in one request.
+    :param desc: The description of the progress bar.
+    :param instrumentation: Default None. If given, count the requests as "translate.detect_language" calls, with the
+      characters sent as their quota units, since the API is charged by character.
+    :return: A list of dictionaries of "language" and "confidence", in the order of the texts.
+    """
+    results = {}
+
+    # Empty texts have no language
+    for text in texts:
+        if not text.strip():
+            results[text] = {'language': 'und', 'confidence': 0}
+
+    if offline is not None:
+        for text in set(texts) - set(results):
+            result = offline(text)
+            if result is not None:
+                results[text] = result
+
+    if cache is not None:
+        results.update(cache.get(list(set(texts) - set(results))))
+
+    # Keep the order of the texts so that the requests are the same across runs
+    remaining = list(dict.fromkeys(text for text in texts if text not in results))
+
+    for batch in tqdm(list(_batches(remaining, max_bytes, max_segments)), desc=desc):
+        start = perf_counter()
+        try:
+            detected = client.detect_language(batch)
+        except Exception:
+            if instrumentation is not None:
+                instrumentation.count('translate.detect_language', calls=1, errors=1, seconds=perf_counter() - start)
+            raise
+        if instrumentation is not None:
+            instrumentation.count('translate.detect_language', calls=1, quota_units=sum(len(text) for text in batch),
+                                  seconds=perf_counter() - start)
+
+        detected = {text: {'language': d['language'], 'confidence': d['confidence']}
+                    for text, d in zip(batch, detected)}
+        if cache is not None:
+            cache.put(detected)
+        results.update(detected)
+
+    return [results[text] for text in texts]
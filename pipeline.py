@@ -0,0 +1,336 @@
+import functools
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from time import perf_counter
+
+import pandas as pd
+
+from instrumentation import Instrumentation
+
+
+def file_digest(path: str) -> str:
+    """
+    :param path: The file.
+    :return: The SHA-256 of the content of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Stage:
+    """
+    A step of a pipeline: a function that takes the outputs of its input stages, in order, and its parameters as keyword
+    arguments, and returns a DataFrame. The function must not modify its inputs, which can be shared with other stages
+    running at the same time.
+    """
+
+    def __init__(self, name: str, function, inputs: list = (), files: list = (), modules: list = (),
+                 version: str = '', resources: dict = None, **params):
+        """
+        :param name: The name of the stage, which the other stages refer to in their inputs.
+        :param function: The function of the stage.
+        :param inputs: Default none. The names of the stages whose outputs are passed to the function.
+        :param files: Default none. The files read by the function. Their content is part of the hash of the stage, and
+          whether they exist if they are optional.
+        :param modules: Default none. The modules of the project whose functions the stage calls, e.g. "durations".
+          Their source files are part of the hash of the stage, as the code of the function only covers the function.
+        :param version: Default "". Change it to rerun the stage when something the hash does not cover changes, e.g.
+          the spaCy model.
+        :param resources: Default None. Keyword arguments of the function that are not part of the hash, e.g. the API
+          clients, the caches and the instrumentation, which do not change the output.
+        :param params: The keyword arguments of the function. They must be representable as JSON or by "str".
+        """
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.files = list(files)
+        self.modules = list(modules)
+        self.version = version
+        self.resources = resources or {}
+        self.params = params
+
+    def key(self, input_keys: list) -> str:
+        """
+        The content hash of the stage, which changes whenever the code of the function or of the modules it calls, its
+        parameters, the files it reads, or the outputs of its inputs change.
+
+        :param input_keys: The keys of the input stages, in order.
+        :return: The SHA-256 of all of them.
+        """
+        try:
+            source = inspect.getsource(self.function)
+        except (OSError, TypeError):
+            source = getattr(self.function, '__qualname__', repr(self.function))
+
+        content = json.dumps({
+            'name': self.name,
+            'source': source,
+            'version': self.version,
+            'params': self.params,
+            'files': [file_digest(path) if os.path.exists(path) else None for path in self.files],
+            'modules': {module.__name__: file_digest(inspect.getsourcefile(module)) for module in self.modules},
+            'inputs': input_keys,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+# The function and the other arguments of the chunks of a "Sharded" stage, set once in each of its processes
+_shared = {}
+
+
+def _share(function, inputs: tuple, kwargs: dict):
+    _shared.update(function=function, inputs=inputs, kwargs=kwargs)
+
+
+def _run_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    return _shared['function'](chunk, *_shared['inputs'], **_shared['kwargs'])
+
+
+class Sharded:
+    """
+    A stage function whose rows are independent, run over chunks of its first input across a pool of processes. The
+    outputs of the chunks are concatenated in the order of the chunks, so the output is the same as that of the
+    function, and a stage of it keeps the hash of the function. The function, its arguments and its outputs must be
+    picklable, so the API clients and the SQLite caches cannot be passed to it.
+
+    It spreads the work of a stage, not its memory: the input and the output of the stage are whole DataFrames in this
+    process. The memory is bounded by running the whole pipeline over chunks of the dataset, as
+    "cleaning.clean_in_chunks" does, with a "Sharded" stage splitting each chunk across the processes.
+
+    The processes are spawned rather than forked, as the stages of a pipeline run in threads, and a process forked while
+    another thread holds a lock, e.g. of the thumbnail downloads, can deadlock. A spawned process imports the modules of
+    the function again, so the pool is started once for all the calls made inside a "with" block of the stage, e.g. for
+    every chunk of a dataset, and once for each call otherwise.
+    """
+
+    def __init__(self, function, chunk_size: int = 50_000, workers: int = None, columns: list = None):
+        """
+        :param function: The stage function, defined at the top level of a module.
+        :param chunk_size: Default 50000. The number of rows of each chunk.
+        :param workers: Default None. The number of processes, the number of CPUs if None. If 1, run in this process.
+        :param columns: Default None. If given, only these columns of the first input are sent to the processes, which
+          must be all the function reads from it.
+        """
+        if chunk_size < 1:
+            raise ValueError('Chunk size should not be smaller than 1')
+
+        functools.update_wrapper(self, function)
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count()
+        self.columns = columns
+        self._keep = False
+        self._executor = None
+        self._shared = None
+
+    def __enter__(self) -> 'Sharded':
+        self._keep = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self._keep = False
+        self.close()
+
+    def close(self):
+        """
+        Stop the processes of the pool, if any.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+            self._shared = None
+
+    def _pool(self, function, inputs: tuple, kwargs: dict) -> ProcessPoolExecutor:
+        """
+        :return: The pool whose processes share the function and the other arguments, started again only if they
+          changed since the last call.
+        """
+        # The arguments are compared by identity, and kept referenced so that their IDs are not reused
+        signature = (id(function), tuple(map(id, inputs)), tuple((key, id(value)) for key, value in kwargs.items()))
+        if self._executor is not None and self._shared[0] != signature:
+            self.close()
+
+        if self._executor is None:
+            # The other arguments, e.g. a spaCy pipeline, are sent to each process once instead of with every chunk
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_share, initargs=(function, inputs, kwargs))
+            self._shared = (signature, function, inputs, kwargs)
+        return self._executor
+
+    def __call__(self, df: pd.DataFrame, *inputs, **kwargs) -> pd.DataFrame:
+        function = self.__wrapped__
+        if self.workers == 1 or len(df) <= self.chunk_size:
+            return function(df, *inputs, **kwargs)
+
+        # Every chunk is pickled to a process and its output pickled back, so the less is sent the better
+        if self.columns is not None:
+            df = df[self.columns]
+
+        chunks = (df.iloc[start:start + self.chunk_size] for start in range(0, len(df), self.chunk_size))
+        results = []
+
+        executor = self._pool(function, inputs, kwargs)
+        try:
+            # At most two chunks for each process are sent at a time, so the chunks in flight do not add a copy of the
+            # whole input
+            running = deque()
+            for chunk in chunks:
+                running.append(executor.submit(_run_chunk, chunk))
+                if len(running) >= 2 * self.workers:
+                    results.append(running.popleft().result())
+            results += [future.result() for future in running]
+        finally:
+            if not self._keep:
+                self.close()
+
+        return pd.concat(results)
+
+
+class Pipeline:
+    """
+    A DAG of stages whose outputs are cached on disk under their content hashes. A stage is only run when no output
+    with its current hash is cached, so the unchanged stages are skipped, and an interrupted run resumes from the stages
+    that did not complete. The stages whose inputs are ready run concurrently.
+
+    The outputs are pickled, which is a fast binary format that keeps every dtype and the Python objects in the columns,
+    e.g. the lists of tags or the RGB tuples, exactly.
+    """
+
+    def __init__(self, cache_directory: str = 'data/pipeline'):
+        """
+        :param cache_directory: Default "data/pipeline". The directory of the cached outputs.
+        """
+        self.cache_directory = cache_directory
+        self.stages = {}
+        os.makedirs(cache_directory, exist_ok=True)
+
+    def add(self, name: str, function, inputs: list = (), files: list = (), modules: list = (), version: str = '',
+            resources: dict = None, **params) -> Stage:
+        """
+        Declare a stage. The parameters are the same as those of "Stage".
+
+        :return: The stage.
+        """
+        if name in self.stages:
+            raise ValueError(f'Stage "{name}" is already declared')
+        for input_ in inputs:
+            if input_ not in self.stages:
+                raise ValueError(f'Stage "{name}" needs the undeclared stage "{input_}", which must be declared first')
+
+        self.stages[name] = Stage(name, function, inputs, files, modules, version, resources, **params)
+        return self.stages[name]
+
+    def _needed(self, targets: list) -> list:
+        """
+        :return: The names of the targets and all the stages they depend on, with every stage after its inputs.
+        """
+        needed = []
+
+        def visit(name):
+            if name not in needed:
+                for input_ in self.stages[name].inputs:
+                    visit(input_)
+                needed.append(name)
+
+        for target in targets:
+            visit(target)
+        return needed
+
+    def _path(self, name: str, key: str) -> str:
+        return os.path.join(self.cache_directory, f'{name}-{key[:16]}.pkl')
+
+    def output_path(self, name: str) -> str:
+        """
+        :param name: The name of the stage.
+        :return: The file of the cached output of the stage under its current hash, which exists once the stage ran.
+        """
+        return self._path(name, self.keys([name])[name])
+
+    def keys(self, targets: list = None) -> dict:
+        """
+        :param targets: Default None. The stages to hash, with the stages they depend on. All if None.
+        :return: A dictionary of the content hash of each stage.
+        """
+        keys = {}
+        for name in self._needed(targets or list(self.stages)):
+            keys[name] = self.stages[name].key([keys[input_] for input_ in self.stages[name].inputs])
+        return keys
+
+    def run(self, targets: list = None, workers: int = 2, force: list = (),
+            instrumentation: Instrumentation = None) -> dict:
+        """
+        Run the stages needed for the targets, skipping the stages whose outputs are cached.
+
+        :param targets: Default None. The stages whose outputs are returned. All the stages without dependants if None.
+        :param workers: Default 2. How many stages can run at the same time.
+        :param force: Default none. The stages to run even if they are cached.
+        :param instrumentation: Default None. If given, record every stage that runs, with the rows of its output.
+        :return: A dictionary of the outputs of the targets.
+        """
+        if targets is None:
+            used = {input_ for stage in self.stages.values() for input_ in stage.inputs}
+            targets = [name for name in self.stages if name not in used]
+
+        keys = self.keys(targets)
+        outputs = {}
+        pending = [name for name in keys if name in force or not os.path.exists(self._path(name, keys[name]))]
+
+        for name in keys:
+            if name not in pending:
+                print(f'Stage "{name}" is cached, skipped.')
+
+        def output(name):
+            if name not in outputs:
+                outputs[name] = pd.read_pickle(self._path(name, keys[name]))
+            return outputs[name]
+
+        def run_stage(stage):
+            start = perf_counter()
+            with instrumentation.stage(stage.name) if instrumentation is not None else nullcontext({}) as record:
+                result = stage.function(*[output(input_) for input_ in stage.inputs], **stage.params,
+                                        **stage.resources)
+                record['rows'] = len(result)
+
+            # Written to a temporary name first, so that an interrupted stage is never taken as completed
+            path = self._path(stage.name, keys[stage.name])
+            result.to_pickle(path + '.tmp')
+            os.replace(path + '.tmp', path)
+
+            print(f'Stage "{stage.name}" completed in {perf_counter() - start:.1f}s.')
+            return result
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            running = {}
+
+            while pending or running:
+                # The inputs of a ready stage are loaded here, so that only this thread reads the cache
+                for name in [name for name in pending if not any(input_ in pending or input_ in running.values()
+                                                                 for input_ in self.stages[name].inputs)]:
+                    for input_ in self.stages[name].inputs:
+                        output(input_)
+                    running[executor.submit(run_stage, self.stages[name])] = name
+                    pending.remove(name)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    outputs[running.pop(future)] = future.result()
+
+        return {target: output(target) for target in targets}
+
+    def clear(self):
+        """
+        Delete the cached outputs that do not match the current hash of their stage.
+        """
+        current = {os.path.basename(self._path(name, key)) for name, key in self.keys().items()}
+        for file in os.listdir(self.cache_directory):
+            if file.endswith(('.pkl', '.tmp')) and file not in current:
+                os.remove(os.path.join(self.cache_directory, file))
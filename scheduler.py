@@ -0,0 +1,255 @@
+import hashlib
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from math import ceil
+
+import scraping
+
+# The default daily quota of a Google Cloud project on the YouTube Data API
+DAILY_QUOTA = 10_000
+
+# The placeholder of api-key.txt in the repository
+KEY_PLACEHOLDER = 'Insert your API key here'
+
+
+def read_api_keys(path: str = 'api-key.txt') -> list:
+    """
+    Read the API keys, one per line. The quota is counted per Google Cloud project, so the keys should belong to
+    different projects.
+
+    :param path: Default "api-key.txt". The text file of the keys.
+    :return: A list of the keys, without the blank lines and the placeholder.
+    """
+    with open(path, 'r') as file:
+        return [line.strip() for line in file if line.strip() and line.strip() != KEY_PLACEHOLDER]
+
+
+def quota_day(now: datetime = None) -> str:
+    """
+    The day the quota is counted in. The quota of the YouTube API is reset at midnight Pacific Time.
+
+    :param now: Default None. An aware datetime, the current time if None.
+    :return: The date in Pacific Time, e.g. "2021-01-09".
+    """
+    try:
+        from zoneinfo import ZoneInfo
+        pacific = ZoneInfo('America/Los_Angeles')
+    except Exception:
+        # Without the time zone database, e.g. on Windows without tzdata, Pacific Standard Time is close enough
+        pacific = timezone(timedelta(hours=-8))
+    return (now or datetime.now(timezone.utc)).astimezone(pacific).strftime('%Y-%m-%d')
+
+
+def estimate_quota(channels: int, how_many_videos: int, batched: bool = True) -> int:
+    """
+    Estimate the quota units used to scrape the videos of the channels with "scraping.iter_video_from_channels". The
+    estimate is an upper bound: it assumes that every channel exists, passes the subscriber threshold and has enough
+    videos.
+
+    :param channels: The number of channels.
+    :param how_many_videos: The limit to the amount of videos to scrape from a channel.
+    :param batched: Default true. Whether the requests are batched.
+    :return: The quota units of the "channels.list", "playlistItems.list" and "videos.list" requests.
+    """
+    if not batched:
+        return channels * (scraping.QUOTA_COST['channels'] + scraping.QUOTA_COST['playlistItems'] +
+                           how_many_videos * scraping.QUOTA_COST['videos'])
+
+    units = 0
+    for size in [scraping.MAX_IDS_PER_REQUEST] * (channels // scraping.MAX_IDS_PER_REQUEST) + \
+                [channels % scraping.MAX_IDS_PER_REQUEST]:
+        if size:
+            units += scraping.QUOTA_COST['channels'] + size * scraping.QUOTA_COST['playlistItems'] + \
+                ceil(size * how_many_videos / scraping.MAX_IDS_PER_REQUEST) * scraping.QUOTA_COST['videos']
+    return units
+
+
+class QuotaScheduler:
+    """
+    Plans the scraping of a channel list across API keys and days. The cost of the channels is estimated before they
+    are fetched, so each key is given as many channels as fit in what is left of its daily quota, and the quota used by
+    each key on each day and a cursor over each channel list are kept in a SQLite database. Every run picks up the
+    channel list exactly where the last one stopped.
+    """
+
+    def __init__(self, keys: list, path: str = 'data/channels/schedule.db', daily_quota: int = DAILY_QUOTA,
+                 reserve: int = 0):
+        """
+        :param keys: The API keys, e.g. as returned by "read_api_keys".
+        :param path: Default "data/channels/schedule.db". The SQLite database of the quota used and the cursors.
+        :param daily_quota: Default 10000. The daily quota of each key.
+        :param reserve: Default 0. The quota units of each key to leave unused, e.g. for other requests.
+        """
+        if not keys:
+            raise ValueError('No API key is given')
+
+        self.keys = list(keys)
+        self.daily_quota = daily_quota
+        self.reserve = reserve
+
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS usage (key TEXT NOT NULL, day TEXT NOT NULL, '
+                         'units INTEGER NOT NULL, PRIMARY KEY (key, day))')
+        self._db.execute('CREATE TABLE IF NOT EXISTS cursors (list TEXT PRIMARY KEY, position INTEGER NOT NULL)')
+        self._db.commit()
+
+    @staticmethod
+    def _hash(key: str) -> str:
+        # The keys themselves are never written to disk
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+    def used(self, key: str, day: str = None) -> int:
+        """
+        :param key: The API key.
+        :param day: Default None. The day, as returned by "quota_day", today if None.
+        :return: The quota units used by the key on the day.
+        """
+        row = self._db.execute('SELECT units FROM usage WHERE key = ? AND day = ?',
+                               (self._hash(key), day or quota_day())).fetchone()
+        return row[0] if row else 0
+
+    def remaining(self, key: str, day: str = None) -> int:
+        """
+        :return: The quota units the key can still use on the day. The parameters are the same as in "used".
+        """
+        return max(self.daily_quota - self.reserve - self.used(key, day), 0)
+
+    def record(self, key: str, units: int, day: str = None):
+        """
+        Add to the quota units used by the key on the day. The parameters are the same as in "used".
+        """
+        self._db.execute('INSERT INTO usage VALUES (?, ?, ?) ON CONFLICT (key, day) DO UPDATE SET units = units + ?',
+                         (self._hash(key), day or quota_day(), units, units))
+        self._db.commit()
+
+    def exhaust(self, key: str, day: str = None):
+        """
+        Mark the quota of the key as used up for the day, e.g. when the API refuses its requests.
+        """
+        self.record(key, max(self.daily_quota - self.used(key, day), 0), day)
+
+    def cursor(self, name: str) -> int:
+        """
+        :param name: The name of the channel list, e.g. the name of its file.
+        :return: The position of the first channel of the list not scraped yet.
+        """
+        row = self._db.execute('SELECT position FROM cursors WHERE list = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def advance(self, name: str, position: int):
+        """
+        :param name: The name of the channel list.
+        :param position: The position of the first channel of the list not scraped yet.
+        """
+        self._db.execute('INSERT OR REPLACE INTO cursors VALUES (?, ?)', (name, position))
+        self._db.commit()
+
+    @staticmethod
+    def fit(budget: int, channels: int, how_many_videos: int, batched: bool = True) -> int:
+        """
+        :param budget: The quota units available.
+        :param channels: The number of channels left.
+        :param how_many_videos: The limit to the amount of videos to scrape from a channel.
+        :param batched: Default true. Whether the requests are batched.
+        :return: The largest number of the channels whose estimated cost fits in the budget.
+        """
+        low, high = 0, channels
+        while low < high:
+            middle = (low + high + 1) // 2
+            if estimate_quota(middle, how_many_videos, batched) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def plan(self, channels: list, name: str, how_many_videos: int, batched: bool = True) -> list:
+        """
+        Plan today's scraping of a channel list from its cursor, by the estimated costs, without fetching anything.
+
+        :param channels: The channel list, e.g. a list or a "channel_index.ChannelIndex".
+        :param name: The name of the channel list.
+        :param how_many_videos: The limit to the amount of videos to scrape from a channel.
+        :param batched: Default true. Whether the requests are batched.
+        :return: A list of tuples of (key, start, end, estimated units), the slice of the channel list given to each
+          key.
+        """
+        plan = []
+        start = self.cursor(name)
+
+        for key in sorted(self.keys, key=self.remaining, reverse=True):
+            count = self.fit(self.remaining(key), len(channels) - start, how_many_videos, batched)
+            if count:
+                plan.append((key, start, start + count, estimate_quota(count, how_many_videos, batched)))
+                start += count
+
+        return plan
+
+    def run(self, channels: list, name: str, how_many_videos: int, subscriber_threshold: int = 1000,
+            batched: bool = True, **kwargs):
+        """
+        Scrape a channel list from its cursor with "scraping.iter_video_from_channels", giving each key as many
+        channels as fit in what is left of its quota today, until the list is finished or every key is used up. The
+        quota actually used, every request sent including the failed ones, is recorded after every slice, so what the
+        estimates overstated is given to the next slice, and the cursor is advanced past the channels scraped.
+
+        A key refused for its daily quota is marked as used up for the day and the next key takes over. Any other
+        error that stops a slice stops the run, with the cursor at the first channel not finished.
+
+        :param channels: The channel list, e.g. a list or a "channel_index.ChannelIndex".
+        :param name: The name of the channel list, e.g. the name of its file, under which its cursor is kept.
+        :param how_many_videos: The limit to the amount of videos to scrape from a channel.
+        :param subscriber_threshold: Default 1000. The minimum subscriber needed for a channel's video to be scraped.
+        :param batched: Default true. Whether the requests are batched.
+        :param kwargs: The other options of "iter_video_from_channels", e.g. workers, requests_per_second, retries,
+          jsonl_path and instrumentation.
+        :return: A generator of the video details, in the order of the channels.
+        """
+        exhausted = set()
+
+        while self.cursor(name) < len(channels):
+            start = self.cursor(name)
+            keys = [key for key in self.keys if key not in exhausted]
+            if not keys:
+                break
+
+            key = max(keys, key=self.remaining)
+            count = self.fit(self.remaining(key), len(channels) - start, how_many_videos, batched)
+            if not count:
+                print(f'The quota of every key is used up for {quota_day()} (Pacific Time). '
+                      f'{len(channels) - start} channel(s) of "{name}" are left for the next run.')
+                break
+
+            print(f'Scraping channels {start} to {start + count} of "{name}", estimated at '
+                  f'{estimate_quota(count, how_many_videos, batched)} of the {self.remaining(key)} units left.')
+
+            report = {}
+            chunk = channels[start:start + count]
+            try:
+                yield from scraping.iter_video_from_channels(key, chunk, how_many_videos, subscriber_threshold,
+                                                             batched=batched, report=report, **kwargs)
+            # Recorded even if the consumer stops early or the scraping fails, so that the next plan does not count on
+            # quota already spent. The cursor is then left where it was, and the slice is scraped again next time.
+            # Every attempt is one "list" request, which costs one unit whatever the resource, even if it failed
+            finally:
+                self.record(key, report.get('requests_attempted', 0) * scraping.QUOTA_COST['videos'])
+
+            if not report['unfinished']:
+                self.advance(name, start + count)
+                continue
+
+            # The channels from the first one not finished are scraped again, by this run or the next one
+            self.advance(name, start + chunk.index(report['unfinished'][0]))
+
+            # The API refused the key for its daily quota before the end of its slice, so it is not used again today
+            if report['quota_exceeded']:
+                exhausted.add(key)
+                self.exhaust(key)
+            # Any other error, e.g. a server error that outlasted the retries, is not a sign that the quota is used
+            # up, so only the requests sent are counted, and the key is kept for the next run
+            else:
+                print(f'The scraping of "{name}" was stopped by an error other than the quota. '
+                      f'{len(channels) - self.cursor(name)} channel(s) are left for the next run.')
+                break
+
+    def close(self):
+        self._db.close()
@@ -1,22 +1,74 @@
-from pandas import DataFrame
-from googleapiclient.discovery import build
+import numpy as np
+import pandas as pd
 from googleapiclient.errors import HttpError
-from selenium import webdriver
-from selenium.webdriver import ChromeOptions
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
-from time import sleep
+from functools import partial
+from itertools import islice
+from threading import Event, Lock, local
+from time import monotonic, sleep
+from typing import Iterable
 from tqdm import tqdm
 
+from fetchers import ChromeFetcher
+from channel_index import ChannelIndex
+from frontier import CrawlFrontier
+from instrumentation import Instrumentation, MemorySampler
 
-def scrape_channel_ids(initial_channelIds: list, depth: int, checkpoint_at: int = 0, write_to_file: bool = True):
+# Parts requested for every video from the YouTube API
+VIDEO_PARTS = ['id', 'snippet', 'statistics', 'contentDetails', 'topicDetails', 'recordingDetails',
+               'liveStreamingDetails', 'localizations']
+
+# The maximum number of IDs the YouTube API accepts in one "list" request
+MAX_IDS_PER_REQUEST = 50
+
+# Quota units charged by the YouTube API for each "list" request, by resource
+QUOTA_COST = {'channels': 1, 'playlistItems': 1, 'videos': 1}
+
+
+def build(serviceName: str, version: str, **kwargs):
+    """
+    "googleapiclient.discovery.build", which is only imported when the first client is built, as it is slow to import
+    and not needed to read or parse the videos.
+    """
+    from googleapiclient import discovery
+    return discovery.build(serviceName, version, **kwargs)
+
+
+def _chunks(items: list, size: int):
+    """
+    Yield successive slices of a list, each of them having at most the given size.
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def scrape_channel_ids(initial_channelIds: list, depth: int, checkpoint_at: int = 0, write_to_file: bool = True,
+                       frontier_path: str = ':memory:', exclude_existing: bool = False, workers: int = 1,
+                       fetcher_factory=ChromeFetcher, instrumentation: Instrumentation = None):
     """
     The function to scrape the ID of other channels for scraping. Utilises the "channels" page of each channel on
     YouTube.
 
+    The channels of each depth are processed in parallel by a pool of workers, each of them owning a page-fetch
+    backend, e.g. a browser.
+
     :param initial_channelIds: The channels to start with.
     :param depth: How many layers of "channels" to search for, starting from the initial channel.
     :param checkpoint_at: Default 0. If positive, record the intermediate results in the designated txt file.
     :param write_to_file: Default true. If true, directly write the results to the data folder
+    :param frontier_path: Default ":memory:". The SQLite database to persist the state of the crawl in. If it contains
+      an interrupted crawl, the crawl is resumed from where it stopped.
+    :param exclude_existing: Default false. If true, do not return the channels already in the channel lists of the
+      data folder.
+    :param workers: Default 1. How many channels to process in parallel.
+    :param fetcher_factory: Default "ChromeFetcher". The function creating the page-fetch backend of a worker, e.g.
+      "lambda: FileFetcher('fixtures')" to crawl HTML files on disk.
+    :param instrumentation: Default None. If given, record the crawl as the stage "scrape_channel_ids", and count the
+      pages fetched and the fetches that failed as "channel_page" calls.
     :return: A list of channel IDs.
 
     TODO:
@@ -24,53 +76,82 @@ def scrape_channel_ids(initial_channelIds: list, depth: int, checkpoint_at: int
       word "channel"
     """
 
-    options = ChromeOptions().add_experimental_option('prefs', {
-        'download.prompt_for_download': False,
-        'download.directory_upgrade': True,
-    })
-
-    initial_channels = ['https://www.youtube.com/channel/' + channelIds for channelIds in initial_channelIds]
+    if workers < 1:
+        raise ValueError('Number of workers should not be smaller than 1')
 
-    # Intermediate channels for processing in the loop
-    intermediate_channels = [] + initial_channels
+    # The channels of the lists are looked up in their memory-mapped index, instead of being read into a set
+    frontier = CrawlFrontier(frontier_path, known=ChannelIndex.from_lists() if exclude_existing else None)
+    frontier.add_initial(initial_channelIds)
 
-    # Processed channels to document the channels processed, to prevent duplicated retrieval
-    processed_channels = [] + initial_channels
+    # Each worker creates its own backend on its first page, as a browser cannot be shared across threads
+    backends = local()
+    created = []
 
-    # Result channels for function return
-    result_channels = [] + initial_channelIds
+    def fetch(channel: str) -> list:
+        if not hasattr(backends, 'fetcher'):
+            backends.fetcher = fetcher_factory()
+            created.append(backends.fetcher)
+        if instrumentation is None:
+            return backends.fetcher(channel)
 
-    driver = webdriver.Chrome('chromedriver.exe', chrome_options=options)
-    sleep(3)
+        fetch_start = monotonic()
+        try:
+            links = backends.fetcher(channel)
+        except Exception:
+            instrumentation.count('channel_page', calls=1, errors=1, seconds=monotonic() - fetch_start)
+            raise
+        instrumentation.count('channel_page', calls=1, seconds=monotonic() - fetch_start)
+        return links
 
     count = 0
+    processed = 0
+    sampler = MemorySampler().start() if instrumentation is not None else None
+    start = monotonic()
+    progress = tqdm(total=depth)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                level = frontier.next_level(depth)
+                if not level:
+                    break
 
-    for i in tqdm(range(depth)):
+                # Levels of a resumed crawl that were completed before are counted as done
+                level_depth = level[0][1]
+                progress.update(level_depth - progress.n)
+                print('Iteration ' + str(level_depth) + '...')
 
-        print('Iteration ' + str(i) + '...')
-        for channel in intermediate_channels.copy():
-            processed_channels += [channel]
+                # Pages are fetched in parallel but expanded in order, so the results do not depend on the workers
+                pages = executor.map(fetch, [channel for channel, _ in level])
 
-            # Navigate to the "channels" page of the YouTube channel
-            driver.get(channel + '/channels')
+                for (channel, channel_depth), links in zip(level, pages):
+                    frontier.expand(channel, channel_depth, links)
+                    processed += 1
 
-            # Identify all linked channels
-            elements = driver.find_elements_by_id('channel-info')
-            links = [elem.get_attribute('href') for elem in elements]
+                    count += 1
+                    if count == checkpoint_at:
+                        count = 0
+                        with open('data/channels/checkpoints/checkpoint_' + datetime.now().strftime('%Y%m%d_%H%M%S') +
+                                  '.txt', 'a') as file:
+                            file.write('\n'.join(frontier.results))
 
-            intermediate_channels += [x for x in links if x not in processed_channels]
+    finally:
+        for fetcher in created:
+            fetcher.close()
+        memory = sampler.stop() if sampler is not None else None
 
-            result_channels += [x[32:] for x in links if ('channel/UC' in x and x not in processed_channels)]
-            intermediate_channels.remove(channel)
+    progress.update(depth - progress.n)
+    progress.close()
 
-            count += 1
-            if count == checkpoint_at:
-                count = 0
-                with open('data/channels/checkpoints/checkpoint_' + datetime.now().strftime('%Y%m%d_%H%M%S') + '.txt',
-                          'a') as file:
-                    file.write('\n'.join(result_channels))
+    elapsed = monotonic() - start
+    print(f'Processed {processed} channels in {elapsed:.1f} seconds with {workers} worker(s) '
+          f'({processed / elapsed if elapsed else 0:.2f} channels per second).')
 
-    driver.close()
+    if instrumentation is not None:
+        instrumentation.add_stage('scrape_channel_ids', elapsed, processed, memory=memory)
+
+    result_channels = frontier.results
+    frontier.close()
 
     if write_to_file:
         with open('data/channels/channels_' + datetime.now().strftime('%Y%m%d_%H%M%S') + '.txt', 'a') as file:
@@ -79,97 +160,406 @@ def scrape_channel_ids(initial_channelIds: list, depth: int, checkpoint_at: int
     return result_channels
 
 
-def get_video_from_channels(api_key: str, channelIds: list, how_many_videos: int, subscriber_threshold: int = 1000):
+class TokenBucket:
+    """
+    A thread-safe token bucket that limits the rate of requests sent to an API. Tokens are refilled continuously at
+    the given rate, up to the given capacity, and every request takes one token.
     """
-    The function to get video det   ails from the channel. It contains the raw returns from Google API. Note that certain
-    limits on the maximum video scraped daily is imposed by Google, and the function automatically returns the scraped
-    videos if it is terminated by Google.
 
-    This function takes advantage of an automatic playlist generation by YouTube that, any channel IDs would have an
-    initial of "UC" and its playlist can be retrieved by changing the initial of "UU". Then the function requests
-    the video information from Google API.
+    def __init__(self, rate: float, capacity: float = None):
+        if rate <= 0:
+            raise ValueError('Rate of the token bucket should be positive')
 
-    :param api_key: The api key used for the Google API.
-    :param channelIds: The channel to scrape video from.
-    :param how_many_videos: The limit to the amount of videos to scrape from a channel.
-    :param subscriber_threshold: The minimum subscriber needed for a channel's video to be scraped.
-    :return: Tuple of: (1) A list of video contents from the given channels; (2) The time videos are scraped
+        self.rate = rate
+        self.capacity = capacity if capacity else max(rate, 1)
+        self._tokens = self.capacity
+        self._last = monotonic()
+        self._lock = Lock()
 
-    TODO: Fix the bug where the displayed errors overrides the tqdm function to cause multiple returned counts
+    def acquire(self):
+        """
+        Block until a token is available, then take it.
+        """
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            sleep(wait)
+
+
+class _Counter:
+    """
+    A count shared by the workers, e.g. of the requests sent to the API.
     """
 
-    scrape_time = datetime.now().replace(microsecond=0)
+    def __init__(self):
+        self.value = 0
+        self._lock = Lock()
 
-    if subscriber_threshold < 1:
-        raise ValueError('Subscriber threshold should not be smaller than 1')
+    def add(self, n: int = 1):
+        with self._lock:
+            self.value += n
 
-    if how_many_videos < 1:
-        raise ValueError('Video number per channel should not be smaller than 1')
 
-    youtube = build('youtube', 'v3', developerKey=api_key)
+class _CrawlStopped(Exception):
+    """
+    Raised in a worker when another worker has already stopped the crawl, e.g. because the API quota is exhausted.
+    """
 
-    video_details = []  # Variable for tracking videos in each channel
-    count = 0  # Variable for how many videos scraped
 
-    # Variables to track these situations and report at the end of the function:
-    not_exist = []  # Not existing channels
-    no_video = [] # No video
-    disabled_sub = [] # Disabled function to check the number of subscribers
-    video_id = ''
+def _is_quota_exceeded(error: HttpError) -> bool:
+    """
+    Whether the HttpError is caused by the daily quota of the API key being used up.
+    """
+    return b'quotaExceeded' in error.content or b'dailyLimitExceeded' in error.content
 
-    try:
-        for channel in tqdm(channelIds):
 
+def _is_transient(error: HttpError) -> bool:
+    """
+    Whether the HttpError is temporary, so that the same request may succeed if retried later.
+    """
+    status = getattr(error.resp, 'status', None)
+    return status in (429, 500, 502, 503, 504) or (status == 403 and b'ateLimitExceeded' in error.content)
+
+
+def _execute(request, bucket: TokenBucket = None, retries: int = 0, backoff: float = 1.0, stop: Event = None,
+             attempts: _Counter = None, instrumentation: Instrumentation = None):
+    """
+    Execute a request to the Google API, waiting for the rate limit and retrying with exponential backoff on
+    transient errors.
+
+    :param request: The request built by the API client.
+    :param bucket: Default None. If given, take a token from the bucket before every attempt.
+    :param retries: Default 0. How many times to retry a request that failed with a transient HttpError.
+    :param backoff: Default 1. The seconds to wait before the first retry, doubled after each retry.
+    :param stop: Default None. If given and set, stop the crawl instead of sending the request.
+    :param attempts: Default None. If given, count every attempt sent to the API, including the failed ones.
+    :param instrumentation: Default None. If given, count every attempt, its quota units, retries and errors under the
+      method of the request, e.g. "youtube.videos.list".
+    :return: The response of the request.
+    """
+    # The quota is charged for every attempt that reaches the API, including the failed ones
+    method = getattr(request, 'methodId', None) or 'youtube'
+    resource = method.split('.')[1] if method.count('.') == 2 else None
+    quota_units = QUOTA_COST.get(resource, 1)
+
+    for attempt in range(retries + 1):
+        if stop is not None and stop.is_set():
+            raise _CrawlStopped
+
+        if bucket is not None:
+            bucket.acquire()
+
+        if attempts is not None:
+            attempts.add()
+
+        start = monotonic()
+        try:
+            response = request.execute()
+        except HttpError as e:
+            retry = attempt < retries and not _is_quota_exceeded(e) and _is_transient(e)
+            if instrumentation is not None:
+                instrumentation.count(method, calls=1, quota_units=quota_units, retries=int(retry),
+                                      errors=int(not retry), seconds=monotonic() - start)
+            if not retry:
+                raise
+            sleep(backoff * 2 ** attempt)
+        else:
+            if instrumentation is not None:
+                instrumentation.count(method, calls=1, quota_units=quota_units, seconds=monotonic() - start)
+            return response
+
+
+def _scrape_channels(youtube, channels: list, how_many_videos: int, subscriber_threshold: int, batched: bool,
+                     execute, result: dict):
+    """
+    Scrape the videos of a group of channels, appending the video details and the reports into the result dictionary
+    as they arrive, so that partial results are kept if an HttpError stops the process.
+
+    :param youtube: The YouTube API client.
+    :param channels: The channels to scrape video from. At most 50 channels if batched.
+    :param how_many_videos: The limit to the amount of videos to scrape from a channel.
+    :param subscriber_threshold: The minimum subscriber needed for a channel's video to be scraped.
+    :param batched: If true, request the statistics of all channels, and the details of up to 50 videos, at once.
+    :param execute: The function executing each request.
+    :param result: The dictionary to record results in, as created by "_new_result".
+    """
+    if batched:
+        # Gather statistics of all channels in one request
+        channel_stat = execute(youtube.channels().list(id=','.join(channels), part=['statistics'],
+                                                       maxResults=MAX_IDS_PER_REQUEST))
+        result['requests_made'] += 1
+        result['requests_unbatched'] += len(channels)
+        stats = {item['id']: item['statistics'] for item in channel_stat.get('items', [])}
+    else:
+        stats = None
+
+    # Pairs of (video ID, subscriber count of its channel), in the order of the channels
+    pending = []
+
+    for channel in channels:
+
+        if batched:
+            if channel not in stats:
+                result['not_exist'] += [channel]
+                continue
+            statistics = stats[channel]
+        else:
             # Gather statistics of the channel
-            channel_stat = youtube.channels().list(id=channel, part=['statistics']).execute()
+            channel_stat = execute(youtube.channels().list(id=channel, part=['statistics']))
+            result['requests_made'] += 1
+            result['requests_unbatched'] += 1
 
             if not channel_stat['pageInfo']['totalResults']:
-                not_exist += [channel]
+                result['not_exist'] += [channel]
                 continue
+            statistics = channel_stat['items'][0]['statistics']
 
-            try:
-                sub = int(channel_stat['items'][0]['statistics']['subscriberCount'])
-            except KeyError as e:
-                print(e)
-                disabled_sub += [channel]
-                continue
+        try:
+            sub = int(statistics['subscriberCount'])
+        except KeyError as e:
+            print(e)
+            result['disabled_sub'] += [channel]
+            continue
 
-            # Skip the channel if it has subscriber count less than the threshold
-            if sub < subscriber_threshold:
-                continue
+        # Skip the channel if it has subscriber count less than the threshold
+        if sub < subscriber_threshold:
+            continue
 
-            # Use the channel id to retrieve the playlist id, which contains all uploads by that channel
-            playlist_id = channel[0] + 'U' + channel[2:]
+        # Use the channel id to retrieve the playlist id, which contains all uploads by that channel
+        playlist_id = channel[0] + 'U' + channel[2:]
 
-            # Retrieve the id of reach video
-            try:
-                channel_videos = youtube.playlistItems().list(playlistId=playlist_id,
-                                                              part=['snippet'],
-                                                              maxResults=how_many_videos).execute()
-            # Case where the channel does not have any videos, so the API returns HttpError "cannot be found"
-            except HttpError as e:
-                print(e)
-                no_video += [channel]
+        # Retrieve the id of reach video. Playlist items cannot be requested for multiple playlists at once
+        try:
+            channel_videos = execute(youtube.playlistItems().list(playlistId=playlist_id,
+                                                                  part=['snippet'],
+                                                                  maxResults=how_many_videos))
+        # Case where the channel does not have any videos, so the API returns HttpError "cannot be found"
+        except HttpError as e:
+            if _is_quota_exceeded(e):
+                raise
+            print(e)
+            result['no_video'] += [channel]
+            continue
+        finally:
+            result['requests_made'] += 1
+            result['requests_unbatched'] += 1
+
+        pending += [(video['snippet']['resourceId']['videoId'], sub) for video in channel_videos['items']]
+
+    # Retrieve the detailed information of each video, or of 50 videos at a time if batched
+    for video_chunk in _chunks(pending, MAX_IDS_PER_REQUEST if batched else 1):
+        result['video_id'] = video_chunk[0][0]
+        details = execute(youtube.videos().list(id=','.join(v for v, _ in video_chunk),
+                                                part=VIDEO_PARTS,
+                                                maxResults=len(video_chunk)))
+        result['requests_made'] += 1
+        result['requests_unbatched'] += len(video_chunk)
+
+        # Spread the results back in the requested order, skipping videos that are no longer available
+        details = {detail['id']: detail for detail in details.get('items', [])}
+        for video_id, sub in video_chunk:
+            if video_id not in details:
                 continue
+            detail = details[video_id]
+            detail['channel_subscribers'] = sub
+            result['video_details'] += [detail]
 
-            video_ids = [video['snippet']['resourceId']['videoId'] for video in channel_videos['items']]
-
-            # Retrieve the detailed information of each video
-            for video_id in video_ids:
-                detail = youtube.videos().list(id=video_id,
-                                               part=['id', 'snippet', 'statistics', 'contentDetails', 'topicDetails',
-                                                     'recordingDetails', 'liveStreamingDetails', 'localizations'],
-                                               maxResults=1).execute()['items'][0]
-                detail['channel_subscribers'] = sub
-                video_details += [detail]
-                count += 1
-
-    # Stop the process and return the existing results when API limit is reached
-    except HttpError as e:
-        print(e)
-        print(f'YouTube API blocked the request upon request information for video with ID {video_id}.\n' +
-              'Possibly API Request limit exceeded.\n' +
-              f'Returning requested data for the scraped {count} videos.')
+
+def _submit_in_order(executor: ThreadPoolExecutor, function, arguments: Iterable, window: int):
+    """
+    Submit the calls to the executor with at most a window of them submitted and not handed over yet, and hand over
+    their futures in the order of submission. When the generator is closed, e.g. because its consumer stopped, the
+    calls not started yet are cancelled instead of being run.
+
+    :param executor: The executor.
+    :param function: The function to call.
+    :param arguments: The tuples of the arguments of each call.
+    :param window: The most calls submitted ahead of the one handed over.
+    :return: A generator of the futures of the calls.
+    """
+    arguments = iter(arguments)
+    pending = deque(executor.submit(function, *args) for args in islice(arguments, window))
+
+    try:
+        while pending:
+            future = pending.popleft()
+            # The next call is submitted before the consumer waits, so that the workers are kept busy
+            for args in islice(arguments, 1):
+                pending.append(executor.submit(function, *args))
+            yield future
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _new_result() -> dict:
+    """
+    Create an empty dictionary for "_scrape_channels" to record results in.
+    """
+    return {
+        'video_details': [],  # Details of the scraped videos
+        'not_exist': [],  # Not existing channels
+        'no_video': [],  # No video
+        'disabled_sub': [],  # Disabled function to check the number of subscribers
+        'requests_made': 0,  # Requests sent to the API
+        'requests_unbatched': 0,  # Requests that would have been sent without batching
+        'video_id': '',  # The last video requested
+    }
+
+
+def iter_video_from_channels(api_key: str, channelIds: list, how_many_videos: int, subscriber_threshold: int = 1000,
+                             batched: bool = False, youtube=None, workers: int = 1, requests_per_second: float = 0,
+                             retries: int = 0, backoff: float = 1.0, jsonl_path: str = None, report: dict = None,
+                             instrumentation: Instrumentation = None):
+    """
+    The streaming version of "get_video_from_channels". The details of each video are yielded as soon as they arrive,
+    in the order of the given channels, so the videos scraped do not have to be held in memory.
+
+    :param api_key: The api key used for the Google API.
+    :param channelIds: The channel to scrape video from.
+    :param how_many_videos: The limit to the amount of videos to scrape from a channel.
+    :param subscriber_threshold: The minimum subscriber needed for a channel's video to be scraped.
+    :param batched: Default false. If true, request the statistics of up to 50 channels and the details of up to 50
+      videos in one request, and report the requests and quota units saved.
+    :param youtube: Default None. A built YouTube API client to use instead of building one from the api key. It is
+      shared by all workers, so it must be thread-safe if workers is larger than 1.
+    :param workers: Default 1. How many channels, or groups of 50 channels if batched, to scrape concurrently.
+    :param requests_per_second: Default 0. If positive, the maximum rate of requests sent by all workers together.
+    :param retries: Default 0. How many times to retry a request that failed with a transient HttpError.
+    :param backoff: Default 1. The seconds to wait before the first retry, doubled after each retry.
+    :param jsonl_path: Default None. If given, append the details of each video to this file as one line of JSON as
+      soon as they arrive, so an interrupted run keeps everything fetched so far.
+    :param report: Default None. If given, the dictionary is filled with the lists "not_exist", "no_video",
+      "disabled_sub" and "unfinished" of channels, the number of "videos", "requests_made" and "requests_unbatched",
+      and "quota_exceeded", whether the scraping was stopped by the daily quota of the key rather than by another
+      error, when the scraping ends. "requests_attempted", every attempt sent to the API including the
+      failed ones and the retries, is filled even if the scraping is stopped early or fails.
+    :param instrumentation: Default None. If given, count the requests, their quota units, retries and errors by
+      method, e.g. "youtube.videos.list".
+    :return: A generator of the video details.
+    """
+
+    if subscriber_threshold < 1:
+        raise ValueError('Subscriber threshold should not be smaller than 1')
+
+    if how_many_videos < 1:
+        raise ValueError('Video number per channel should not be smaller than 1')
+
+    if workers < 1:
+        raise ValueError('Number of workers should not be smaller than 1')
+
+    bucket = TokenBucket(requests_per_second) if requests_per_second > 0 else None
+    stop = Event()
+    attempts = _Counter()
+    execute = partial(_execute, bucket=bucket, retries=retries, backoff=backoff, stop=stop, attempts=attempts,
+                      instrumentation=instrumentation)
+
+    # The API client of googleapiclient is not thread-safe, so each worker builds its own unless one is given
+    clients = local()
+
+    def scrape(chunk: list, result: dict):
+        if youtube is not None:
+            client = youtube
+        else:
+            if not hasattr(clients, 'youtube'):
+                clients.youtube = build('youtube', 'v3', developerKey=api_key)
+            client = clients.youtube
+
+        try:
+            _scrape_channels(client, chunk, how_many_videos, subscriber_threshold, batched, execute, result)
+        # Stop the other workers as soon as the API limit is reached
+        except HttpError:
+            stop.set()
+            raise
+
+    chunks = list(_chunks(channelIds, MAX_IDS_PER_REQUEST if batched else 1))
+    results = [_new_result() for _ in chunks]
+    unfinished = []  # Channels not scraped because the process was stopped
+    quota_exceeded = False  # Whether the process was stopped by the daily quota rather than another error
+    count = 0  # Variable for how many videos scraped
+
+    file = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+
+    def emit(result: dict):
+        # Hand over the videos of a finished group of channels, and release them from the results
+        if file:
+            for detail in result['video_details']:
+                file.write(json.dumps(detail) + '\n')
+            file.flush()
+        yield from result['video_details']
+        result['video_details'] = []
+
+    try:
+        if workers == 1:
+            for i, (chunk, result) in enumerate(zip(tqdm(chunks), results)):
+                try:
+                    scrape(chunk, result)
+
+                # Stop the process and return the existing results when API limit is reached
+                except HttpError as e:
+                    print(e)
+                    print(f'YouTube API blocked the request upon request information for video with ID '
+                          f'{result["video_id"]}.\nPossibly API Request limit exceeded.\n'
+                          f'Returning requested data for the scraped {count + len(result["video_details"])} videos.')
+                    unfinished = [channel for chunk in chunks[i:] for channel in chunk]
+                    quota_exceeded = _is_quota_exceeded(e)
+
+                count += len(result['video_details'])
+                yield from emit(result)
+
+                if unfinished:
+                    break
+
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = _submit_in_order(executor, scrape, zip(chunks, results), 2 * workers)
+
+                # Wait for the groups of channels in order, so the videos are yielded in the order of the channels.
+                # If the consumer stops early, the workers are stopped and the groups not started are cancelled, so
+                # that no quota is spent on videos nobody reads
+                try:
+                    for chunk, result, future in zip(chunks, results, tqdm(futures, total=len(chunks))):
+                        e = future.exception()
+
+                        if isinstance(e, HttpError) and not unfinished:
+                            print(e)
+                            print('YouTube API blocked a request. Possibly API Request limit exceeded.\n'
+                                  'Stopped the workers and returning the requested data.')
+                        elif e is not None and not isinstance(e, (HttpError, _CrawlStopped)):
+                            raise e
+
+                        if e is not None:
+                            unfinished += chunk
+                        if isinstance(e, HttpError):
+                            quota_exceeded = quota_exceeded or _is_quota_exceeded(e)
+
+                        count += len(result['video_details'])
+                        yield from emit(result)
+                finally:
+                    stop.set()
+                    futures.close()
+
+    finally:
+        if file:
+            file.close()
+        # Every attempt is charged quota, so it is reported however the scraping ends
+        if report is not None:
+            report['requests_attempted'] = attempts.value
+
+    not_exist = [channel for result in results for channel in result['not_exist']]
+    no_video = [channel for result in results for channel in result['no_video']]
+    disabled_sub = [channel for result in results for channel in result['disabled_sub']]
+    requests_made = sum(result['requests_made'] for result in results)
+    requests_unbatched = sum(result['requests_unbatched'] for result in results)
 
     # Notify the user on non-existing channels
     if not_exist:
@@ -182,78 +572,319 @@ def get_video_from_channels(api_key: str, channelIds: list, how_many_videos: int
         for channel in no_video:
             print(channel)
 
+    if disabled_sub:
+        print('Channel(s) with the following id have hidden subscriber counts:')
+        for channel in disabled_sub:
+            print(channel)
+
+    if unfinished:
+        print(f'{len(unfinished)} channel(s) were not completely scraped before the process stopped.')
+
+    if batched:
+        # Every "list" request costs the same quota regardless of the number of IDs in it
+        saved = requests_unbatched - requests_made
+        print(f'Batching made {requests_made} requests instead of {requests_unbatched}, '
+              f'saving {saved} requests and {saved * QUOTA_COST["videos"]} quota units.')
+
     print(f'Scraped the details of {count} videos.')
 
+    if report is not None:
+        report.update({
+            'not_exist': not_exist,
+            'no_video': no_video,
+            'disabled_sub': disabled_sub,
+            'unfinished': unfinished,
+            'quota_exceeded': quota_exceeded,
+            'videos': count,
+            'requests_made': requests_made,
+            'requests_unbatched': requests_unbatched,
+        })
+
+
+def iter_video_statistics(api_key: str, videoIds: list, youtube=None, workers: int = 1, requests_per_second: float = 0,
+                          retries: int = 0, backoff: float = 1.0, report: dict = None,
+                          instrumentation: Instrumentation = None):
+    """
+    Refresh the statistics of known videos. Only the "statistics" part of up to 50 videos is requested at a time, and
+    the response is trimmed to the IDs and the statistics, so a refresh costs one quota unit for every 50 videos and a
+    fraction of the bandwidth of "iter_video_from_channels".
+
+    :param api_key: The api key used for the Google API.
+    :param videoIds: The videos to refresh.
+    :param youtube: Default None. A built YouTube API client to use instead of building one from the api key. It is
+      shared by all workers, so it must be thread-safe if workers is larger than 1.
+    :param workers: Default 1. How many groups of 50 videos to request concurrently.
+    :param requests_per_second: Default 0. If positive, the maximum rate of requests sent by all workers together.
+    :param retries: Default 0. How many times to retry a request that failed with a transient HttpError.
+    :param backoff: Default 1. The seconds to wait before the first retry, doubled after each retry.
+    :param report: Default None. If given, the dictionary is filled with the lists "unavailable" and "unfinished" of
+      videos, the number of "videos" and "requests_made", and "quota_exceeded", whether the refresh was stopped by
+      the daily quota of the key rather than by another error, when the refresh ends. "requests_attempted", every
+      attempt sent to the API including the failed ones and the retries, is filled even if the refresh is stopped
+      early or fails.
+    :param instrumentation: Default None. If given, count the requests, their quota units, retries and errors.
+    :return: A generator of dictionaries of "id" and "statistics", in the order of the given videos.
+    """
+    if workers < 1:
+        raise ValueError('Number of workers should not be smaller than 1')
+
+    bucket = TokenBucket(requests_per_second) if requests_per_second > 0 else None
+    stop = Event()
+    attempts = _Counter()
+    execute = partial(_execute, bucket=bucket, retries=retries, backoff=backoff, stop=stop, attempts=attempts,
+                      instrumentation=instrumentation)
+    clients = local()
+
+    def fetch(chunk: list) -> dict:
+        if youtube is not None:
+            client = youtube
+        else:
+            if not hasattr(clients, 'youtube'):
+                clients.youtube = build('youtube', 'v3', developerKey=api_key)
+            client = clients.youtube
+
+        try:
+            return execute(client.videos().list(id=','.join(chunk), part=['statistics'],
+                                                fields='items(id,statistics)', maxResults=len(chunk)))
+        # Stop the other workers as soon as the API limit is reached
+        except HttpError:
+            stop.set()
+            raise
+
+    chunks = list(_chunks(list(videoIds), MAX_IDS_PER_REQUEST))
+    unavailable = []  # Videos no longer available, e.g. deleted or made private
+    unfinished = []  # Videos not refreshed because the process was stopped
+    quota_exceeded = False  # Whether the process was stopped by the daily quota rather than another error
+    requests_made = 0
+    count = 0
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = _submit_in_order(executor, fetch, ((chunk,) for chunk in chunks), 2 * workers)
+
+            # Wait for the groups of videos in order, so the statistics are yielded in the order of the videos. If the
+            # consumer stops early, the workers are stopped and the groups not started are cancelled
+            try:
+                for chunk, future in zip(chunks, tqdm(futures, total=len(chunks))):
+                    e = future.exception()
+
+                    if isinstance(e, HttpError) and not unfinished:
+                        print(e)
+                        print('YouTube API blocked a request. Possibly API Request limit exceeded.\n'
+                              'Stopped the workers and returning the refreshed statistics.')
+                    elif e is not None and not isinstance(e, (HttpError, _CrawlStopped)):
+                        raise e
+
+                    if isinstance(e, HttpError):
+                        quota_exceeded = quota_exceeded or _is_quota_exceeded(e)
+                    if e is not None:
+                        unfinished += chunk
+                        continue
+
+                    requests_made += 1
+                    items = {item['id']: item for item in future.result().get('items', [])}
+                    for video_id in chunk:
+                        if video_id in items:
+                            count += 1
+                            yield {'id': video_id, 'statistics': items[video_id].get('statistics') or {}}
+                        else:
+                            unavailable.append(video_id)
+            finally:
+                stop.set()
+                futures.close()
+    finally:
+        # Every attempt is charged quota, so it is reported however the refresh ends, once the workers are done
+        if report is not None:
+            report['requests_attempted'] = attempts.value
+
+    if unavailable:
+        print(f'{len(unavailable)} video(s) are no longer available.')
+
+    if unfinished:
+        print(f'{len(unfinished)} video(s) were not refreshed before the process stopped.')
+
+    print(f'Refreshed the statistics of {count} videos with {requests_made} requests.')
+
+    if report is not None:
+        report.update({
+            'unavailable': unavailable,
+            'unfinished': unfinished,
+            'quota_exceeded': quota_exceeded,
+            'videos': count,
+            'requests_made': requests_made,
+        })
+
+
+def get_video_from_channels(api_key: str, channelIds: list, how_many_videos: int, subscriber_threshold: int = 1000,
+                            **kwargs):
+    """
+    The function to get video details from the channel. It contains the raw returns from Google API. Note that certain
+    limits on the maximum video scraped daily is imposed by Google, and the function automatically returns the scraped
+    videos if it is terminated by Google.
+
+    This function takes advantage of an automatic playlist generation by YouTube that, any channel IDs would have an
+    initial of "UC" and its playlist can be retrieved by changing the initial of "UU". Then the function requests
+    the video information from Google API.
+
+    :param api_key: The api key used for the Google API.
+    :param channelIds: The channel to scrape video from.
+    :param how_many_videos: The limit to the amount of videos to scrape from a channel.
+    :param subscriber_threshold: The minimum subscriber needed for a channel's video to be scraped.
+    :param kwargs: The options of "iter_video_from_channels", e.g. batched, workers, requests_per_second, retries and
+      instrumentation, which also records the scraping as the stage "get_video_from_channels".
+    :return: Tuple of: (1) A list of video contents from the given channels; (2) The time videos are scraped, in UTC+0
+
+    TODO: Fix the bug where the displayed errors overrides the tqdm function to cause multiple returned counts
+    """
+
+    # In UTC+0, the same as the publishing times of the videos
+    scrape_time = datetime.utcnow().replace(microsecond=0)
+
+    instrumentation = kwargs.get('instrumentation')
+    with instrumentation.stage('get_video_from_channels') if instrumentation is not None else nullcontext({}) as stage:
+        video_details = list(iter_video_from_channels(api_key, channelIds, how_many_videos, subscriber_threshold,
+                                                      **kwargs))
+        stage['rows'] = len(video_details)
+
     return video_details, scrape_time
 
 
-def parse_video_details(video_details: dict, scrape_time: datetime):
+def read_jsonl(path: str):
+    """
+    Read the video details written by "iter_video_from_channels" one line at a time.
+
+    :param path: The JSONL file.
+    :return: A generator of the video details.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _to_int(value):
+    """
+    Convert a count returned by the YouTube API, which is a string, into an integer. Missing counts are kept as None.
+    """
+    return None if value is None else int(value)
+
+
+def parse_video_details(video_details: Iterable, scrape_time: datetime):
     """
     This function parses the details of the video as retrieved from YouTube API, in the format of dictionary,
-    into a simplified, cherry-picked and less layered version of dictionary.
-    :param scrape_time: The time videos are scraped.
-    :param video_details: The video details retrieved from YouTube API, by the function "get_video_from_channels".
-    :return: Dictionary with key of video ID, and a dictionary value of key-value pairs of video details.
+    into a simplified, cherry-picked and less layered table.
+
+    The values are collected column by column in one pass, and the DataFrame is built directly from the columns with
+    their proper dtypes: int64 for views and subscribers, nullable Int64 for the counts that can be hidden, UTC datetime
+    for the publishing time, and categorical for the repetitive fields.
+    :param scrape_time: The time videos are scraped, in UTC+0.
+    :param video_details: The video details retrieved from YouTube API, by the function "get_video_from_channels". Any
+      iterable is accepted and consumed one video at a time, e.g. "iter_video_from_channels" or "read_jsonl".
+    :return: DataFrame indexed by video ID, with a column for each of the video details, and "scrape_time", so that
+      every video keeps its scrape time when DataFrames of different scrapes are concatenated.
     """
-    df = {}
+    columns = {column: [] for column in ['id', 'title', 'view', 'channel_sub', 'like', 'dislike', 'comment', 'length',
+                                         'description', 'dimension', 'definition', 'caption', 'published_at', 'tags',
+                                         'category', 'thumbnail', 'localizations', 'topic_categories',
+                                         'default_language', 'live']}
 
     for d in video_details:
+        statistics = d.get('statistics') or {}
 
         # Skip videos without view counts (Previous YouTube Originals videos)
-        if not d.get('statistics').get('viewCount'):
+        if not statistics.get('viewCount'):
             continue
 
-        video_id = d['id']
-        sub = d.get('channel_subscribers')
-        view = int(d.get('statistics').get('viewCount'))
-
-        # Choose certain useful information and append into a list
-        df[video_id] = ({
-            'title': d.get('snippet').get('title'),
-            'view': view,
-            'channel_sub': sub,
-            'view_to_sub': view / sub,
-            'like': d.get('statistics').get('likeCount'),
-            'dislike': d.get('statistics').get('dislikeCount'),
-            'comment': d.get('statistics').get('commentCount'),
-            'length': d.get('contentDetails').get('duration'),
-            'description': d.get('snippet').get('description'),
-            'dimension': d.get('contentDetails').get('dimension'),
-            'definition': d.get('contentDetails').get('definition'),
-            'caption': d.get('contentDetails').get('caption'),
-            'published_at': d.get('snippet').get('publishedAt'),
-            'tags': d.get('snippet').get('tags'),
-            'category': d.get('snippet').get('categoryId'),
-        })
+        snippet = d.get('snippet') or {}
+        content_details = d.get('contentDetails') or {}
+        thumbnails = snippet.get('thumbnails') or {}
+        thumbnail = thumbnails.get('maxres') or thumbnails.get('standard') or thumbnails.get('high') or {}
+
+        # Choose certain useful information and append into the columns
+        columns['id'].append(d['id'])
+        columns['title'].append(snippet.get('title'))
+        columns['view'].append(int(statistics['viewCount']))
+        columns['channel_sub'].append(d.get('channel_subscribers'))
+        columns['like'].append(_to_int(statistics.get('likeCount')))
+        columns['dislike'].append(_to_int(statistics.get('dislikeCount')))
+        columns['comment'].append(_to_int(statistics.get('commentCount')))
+        columns['length'].append(content_details.get('duration'))
+        columns['description'].append(snippet.get('description'))
+        columns['dimension'].append(content_details.get('dimension'))
+        columns['definition'].append(content_details.get('definition'))
+        columns['caption'].append(content_details.get('caption'))
+        columns['published_at'].append(snippet.get('publishedAt'))
+        columns['tags'].append(snippet.get('tags'))
+        columns['category'].append(snippet.get('categoryId'))
+        columns['thumbnail'].append(thumbnail.get('url'))
+        columns['localizations'].append(list(d['localizations']) if d.get('localizations') else None)
+        columns['topic_categories'].append((d.get('topicDetails') or {}).get('topicCategories'))
+        columns['default_language'].append(snippet.get('defaultLanguage'))
+        columns['live'].append(1 if 'liveStreamingDetails' in d else 0)
+
+    view = np.array(columns['view'], dtype='int64')
+    channel_sub = np.array(columns['channel_sub'], dtype='int64')
+
+    df = pd.DataFrame({
+        'title': columns['title'],
+        'view': view,
+        'channel_sub': channel_sub,
+        'view_to_sub': view / channel_sub,
+        'like': pd.array(columns['like'], dtype='Int64'),
+        'dislike': pd.array(columns['dislike'], dtype='Int64'),
+        'comment': pd.array(columns['comment'], dtype='Int64'),
+        'length': columns['length'],
+        'description': columns['description'],
+        'dimension': pd.Categorical(columns['dimension']),
+        'definition': pd.Categorical(columns['definition']),
+        'caption': pd.Categorical(columns['caption']),
+        'published_at': pd.to_datetime(columns['published_at'], utc=True),
+        'tags': columns['tags'],
+        'category': columns['category'],
+        'thumbnail': columns['thumbnail'],
+        'localizations': columns['localizations'],
+        'topic_categories': columns['topic_categories'],
+        'default_language': columns['default_language'],
+        'live': np.array(columns['live'], dtype='int64'),
+        'scrape_time': pd.Timestamp(scrape_time),
+    }, index=columns['id'])
+
+    # A video scraped twice keeps its latest details
+    df = df[~df.index.duplicated(keep='last')]
 
-        if d.get('snippet').get('thumbnails').get('maxres'):
-            df[video_id]['thumbnail'] = d.get('snippet').get('thumbnails').get('maxres').get('url')
-        elif d.get('snippet').get('thumbnails').get('standard'):
-            df[video_id]['thumbnail'] = d.get('snippet').get('thumbnails').get('standard').get('url')
-        else:
-            df[video_id]['thumbnail'] = d.get('snippet').get('thumbnails').get('high').get('url')
+    return df
 
-        try:
-            df[video_id]['localizations'] = d.get('localizations').keys()
-        except AttributeError:
-            df[video_id]['localizations'] = ''
 
-        try:
-            df[video_id]['topic_categories'] = d.get('topicDetails').get('topicCategories')
-        except AttributeError:
-            df[video_id]['topic_categories'] = ''
+def parse_video_statistics(video_statistics: Iterable, scrape_time: datetime) -> pd.DataFrame:
+    """
+    Parse the statistics refreshed by "iter_video_statistics" into a snapshot of the videos, with the same columns and
+    dtypes as in "parse_video_details".
 
-        try:
-            df[video_id]['default_language'] = d.get('snippet').get('defaultLanguage')
-        except AttributeError:
-            df[video_id]['default_language'] = ''
+    :param video_statistics: The statistics of the videos, e.g. as yielded by "iter_video_statistics".
+    :param scrape_time: The time the statistics are refreshed, in UTC+0.
+    :return: DataFrame indexed by video ID, with the columns "view", "like", "dislike", "comment" and "scrape_time".
+    """
+    columns = {column: [] for column in ['id', 'view', 'like', 'dislike', 'comment']}
 
-        if 'liveStreamingDetails' in d:
-            df[video_id]['live'] = 1
-        else:
-            df[video_id]['live'] = 0
+    for d in video_statistics:
+        statistics = d.get('statistics') or {}
 
-    df = DataFrame(df).transpose()
-    df.scrape_time = scrape_time
+        # Skip videos without view counts, the same as in "parse_video_details"
+        if not statistics.get('viewCount'):
+            continue
 
-    return df
+        columns['id'].append(d['id'])
+        columns['view'].append(int(statistics['viewCount']))
+        columns['like'].append(_to_int(statistics.get('likeCount')))
+        columns['dislike'].append(_to_int(statistics.get('dislikeCount')))
+        columns['comment'].append(_to_int(statistics.get('commentCount')))
+
+    df = pd.DataFrame({
+        'view': np.array(columns['view'], dtype='int64'),
+        'like': pd.array(columns['like'], dtype='Int64'),
+        'dislike': pd.array(columns['dislike'], dtype='Int64'),
+        'comment': pd.array(columns['comment'], dtype='Int64'),
+        'scrape_time': pd.Timestamp(scrape_time),
+    }, index=columns['id'])
+
+    return df[~df.index.duplicated(keep='last')]
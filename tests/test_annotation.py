@@ -0,0 +1,194 @@
+import hashlib
+import random
+from glob import glob
+
+import pandas as pd
+import pytest
+
+import annotation
+import benchmarks
+import fakes
+import thumbnails
+
+
+class RecordingVisionClient(fakes.FakeVisionClient):
+    """
+    Keeps the images of every request.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    def batch_annotate_images(self, requests: list):
+        with self._lock:
+            self.batches.append([request['image']['content'] for request in requests])
+        return super().batch_annotate_images(requests)
+
+
+@pytest.fixture(scope='module')
+def contents(tmp_path_factory) -> list:
+    directory = tmp_path_factory.mktemp('images')
+    benchmarks.make_image_fixtures(str(directory), n=40)
+    return [open(path, 'rb').read() for path in sorted(glob(str(directory / '*.jpg')))]
+
+
+def _cached(directory, contents: list, n: int) -> tuple:
+    """
+    Cache n thumbnails made of the images in turn, so that no thumbnail is downloaded.
+    """
+    cache = thumbnails.ThumbnailCache(str(directory / 'thumbnails'))
+    urls = [f'https://i.ytimg.com/vi/{i}/hqdefault.jpg' for i in range(n)]
+    for i, url in enumerate(urls):
+        cache.put(url, contents[i % len(contents)])
+    return urls, cache
+
+
+def test_the_same_image_is_requested_once(tmp_path, contents):
+    urls, thumbnail_cache = _cached(tmp_path, contents[:6], 50)
+    client = RecordingVisionClient()
+
+    # The chunks are smaller than the thumbnails, so the images are also shared across the chunks
+    annotations = annotation.annotate_thumbnails(urls, client, thumbnail_cache=thumbnail_cache, chunk_size=20)
+
+    requested = [content for batch in client.batches for content in batch]
+    assert sorted(requested) == sorted(contents[:6])
+    assert annotations == [annotations[i % 6] for i in range(50)]
+    thumbnail_cache.close()
+
+
+def test_at_most_16_images_per_request(tmp_path, contents):
+    urls, thumbnail_cache = _cached(tmp_path, contents, 40)
+    client = RecordingVisionClient()
+
+    annotations = annotation.annotate_thumbnails(urls, client, thumbnail_cache=thumbnail_cache)
+
+    assert sorted(len(batch) for batch in client.batches) == [8, 16, 16]
+    assert len(annotations) == 40 and not any(annotation_['error'] for annotation_ in annotations)
+    # The annotations are in the order of the URLs, whatever the order the requests are answered in
+    assert annotations == annotation.annotate_thumbnails(urls, fakes.FakeVisionClient(),
+                                                         thumbnail_cache=thumbnail_cache, batch_size=1, concurrency=1)
+    thumbnail_cache.close()
+
+
+def test_cached_annotations_are_not_requested(tmp_path, contents):
+    urls, thumbnail_cache = _cached(tmp_path, contents, 40)
+    cache = annotation.AnnotationCache(str(tmp_path / 'annotations.db'))
+    annotations = annotation.annotate_thumbnails(urls[:25], fakes.FakeVisionClient(), cache, thumbnail_cache)
+
+    client = RecordingVisionClient()
+    assert annotation.annotate_thumbnails(urls, client, cache, thumbnail_cache)[:25] == annotations
+    # Only the images not cached yet are requested
+    assert sorted(content for batch in client.batches for content in batch) == sorted(contents[25:])
+
+    client = RecordingVisionClient()
+    annotation.annotate_thumbnails(urls, client, cache, thumbnail_cache)
+    assert client.requests == 0
+    cache.close()
+    thumbnail_cache.close()
+
+
+def test_an_image_error_does_not_fail_the_others(tmp_path, contents):
+    urls, thumbnail_cache = _cached(tmp_path, contents[:20], 20)
+    cache = annotation.AnnotationCache(str(tmp_path / 'annotations.db'))
+    failed = hashlib.sha256(contents[3]).hexdigest()
+
+    annotations = annotation.annotate_thumbnails(urls, fakes.FakeVisionClient(errors={failed}), cache,
+                                                 thumbnail_cache)
+
+    assert annotations[3] == {'objects': [], 'text': None, 'error': 'Bad image data.'}
+    assert all(annotation_['error'] is None for i, annotation_ in enumerate(annotations) if i != 3)
+    assert annotations[:3] + annotations[4:] == \
+        annotation.annotate_thumbnails(urls[:3] + urls[4:], fakes.FakeVisionClient(), thumbnail_cache=thumbnail_cache)
+
+    # The error is not cached, so the image is requested again by the next run
+    assert cache.get(failed) is None
+    client = RecordingVisionClient()
+    annotations = annotation.annotate_thumbnails(urls, client, cache, thumbnail_cache)
+    assert client.batches == [[contents[3]]] and annotations[3]['error'] is None
+    cache.close()
+    thumbnail_cache.close()
+
+
+def _annotations(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    labels = ['Person', 'Top', 'Car', 'Wheel', 'Tire', 'Animal', 'Food', 'Musical instrument', 'Hat']
+    return [{'objects': [{'name': rng.choice(labels), 'score': rng.random()} for _ in range(rng.randrange(6))],
+             'text': ''.join(f'LINE {j}\n' for j in range(rng.randrange(5))) or None,
+             'error': None} for _ in range(n)]
+
+
+def _row_by_row(annotations: list, index) -> pd.DataFrame:
+    """
+    The features as they were built before, one cell at a time, adding a column for every new label or text line.
+    """
+    df = pd.DataFrame(index=index)
+    df['thumbnail_objects'] = 0
+    df['thumbnail_text_length'] = 0
+    df['thumbnail_text_content'] = None
+    max_text_length = 0
+
+    for i, annotated in enumerate(annotations):
+        df.iloc[i, df.columns.get_loc('thumbnail_objects')] = len(annotated['objects'])
+        for object_ in annotated['objects']:
+            column_name = 'thumbnail_' + object_['name'].replace(' ', '').lower()
+            if column_name not in df.columns:
+                df[column_name] = 0
+            if object_['score'] > 0.5:
+                df.iloc[i, df.columns.get_loc(column_name)] += 1
+
+        if annotated['text']:
+            text_lines = annotated['text'].split('\n')[:-1]
+            for x in range(max_text_length, len(text_lines)):
+                df['thumbnail_text_' + str(x)] = None
+            max_text_length = max(max_text_length, len(text_lines))
+            for x, text in enumerate(text_lines):
+                df.iloc[i, df.columns.get_loc('thumbnail_text_' + str(x))] = text
+            df.iloc[i, df.columns.get_loc('thumbnail_text_length')] = len(text_lines)
+    return df
+
+
+def test_thumbnail_features_are_those_built_row_by_row():
+    annotations = _annotations(300)
+    index = pd.Index([f'video{i}' for i in range(300)])
+
+    features = annotation.thumbnail_features(annotations, index)
+    expected = _row_by_row(annotations, index)
+
+    # The label columns come first in the order they are seen, then the text columns
+    labels = [column for column in expected if column not in features.columns[:3] and '_text_' not in column]
+    assert list(features.columns) == list(expected.columns[:3]) + labels + \
+        [f'thumbnail_text_{x}' for x in range(4)]
+    pd.testing.assert_frame_equal(features, expected[features.columns])
+
+
+def test_sparse_thumbnail_features():
+    annotations = _annotations(100, seed=1)
+
+    dense = annotation.thumbnail_features(annotations)
+    sparse = annotation.thumbnail_features(annotations, sparse=True)
+
+    labels = [column for column in dense.columns[3:] if not column.startswith('thumbnail_text_')]
+    assert labels and all(isinstance(sparse[column].dtype, pd.SparseDtype) for column in labels)
+    for column in labels:
+        sparse[column] = sparse[column].sparse.to_dense()
+    pd.testing.assert_frame_equal(sparse, dense)
+
+
+def test_thumbnail_features_of_edge_cases():
+    annotations = [{'objects': [], 'text': None, 'error': 'Bad image data.'},
+                   {'objects': [{'name': 'Person', 'score': 0.5}, {'name': 'Person', 'score': 0.9},
+                                {'name': 'person', 'score': 0.8}], 'text': 'ONE LINE\n', 'error': None}]
+
+    features = annotation.thumbnail_features(annotations, score_threshold=0.5)
+
+    # The names are lower-cased into the same column, and the objects at the threshold are not counted
+    assert list(features.columns) == ['thumbnail_objects', 'thumbnail_text_length', 'thumbnail_text_content',
+                                      'thumbnail_person', 'thumbnail_text_0']
+    assert list(features['thumbnail_objects']) == [0, 3]
+    assert list(features['thumbnail_person']) == [0, 2]
+    assert list(features['thumbnail_text_0']) == [None, 'ONE LINE']
+
+    empty = annotation.thumbnail_features([])
+    assert list(empty.columns) == ['thumbnail_objects', 'thumbnail_text_length', 'thumbnail_text_content']
+    assert empty.empty
@@ -0,0 +1,136 @@
+import os
+import random
+import string
+from bisect import bisect_left
+
+import pytest
+
+from channel_index import ChannelIndex
+
+
+def _channels(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + '-_'
+    return ['UC' + ''.join(rng.choice(alphabet) for _ in range(22)) for _ in range(n)]
+
+
+@pytest.fixture(scope='module')
+def channel_list(tmp_path_factory) -> tuple:
+    """
+    A channel list of 36131 lines and 20815 unique IDs, as the list of S22 written by "scrape_channel_ids", which
+    appends the channels of every checkpoint again.
+    """
+    channels = _channels(20_815)
+    rng = random.Random(1)
+    lines = channels + [rng.choice(channels) for _ in range(36_131 - 20_815)]
+    rng.shuffle(lines)
+
+    path = tmp_path_factory.mktemp('channels') / 'channels_S22.txt'
+    path.write_text(''.join(line + '\n' for line in lines))
+    return str(path), channels
+
+
+def test_build_deduplicates_and_sorts(channel_list, tmp_path):
+    text_path, channels = channel_list
+
+    index = ChannelIndex.from_text(text_path)
+
+    assert sum(1 for _ in open(text_path)) == 36_131
+    assert len(index) == 20_815
+    assert list(index) == sorted(channels)
+    assert os.path.getsize(index.path) == 20_815 * 22
+    assert index.path == os.path.join(os.path.dirname(text_path), 'index', 'channels_S22.idx')
+
+
+def test_lines_that_are_not_ids_are_skipped(tmp_path):
+    channels = _channels(3)
+    index = ChannelIndex.build(['NamedChannel', channels[0] + '\n', '', 'UC' + 'é' * 22, channels[1], 'UCshort',
+                                channels[0]], str(tmp_path / 'index.idx'))
+    assert list(index) == sorted(channels[:2])
+
+    empty = ChannelIndex.build([], str(tmp_path / 'empty.idx'))
+    assert len(empty) == 0 and list(empty) == [] and channels[0] not in empty
+    assert list(empty.contains(channels)) == [False] * 3
+
+
+def test_membership(channel_list):
+    text_path, channels = channel_list
+    index = ChannelIndex.from_text(text_path)
+    others = _channels(1000, seed=2)
+
+    assert all(channel in index for channel in channels[:1000])
+    assert not any(channel in index for channel in others)
+    assert 'NamedChannel' not in index and None not in index and channels[0][2:] not in index
+
+    queries = channels[:500] + others[:500] + ['', 'NamedChannel']
+    assert list(index.contains(queries)) == [True] * 500 + [False] * 502
+    # The first and the last IDs, at the bounds of the binary search
+    assert list(index.contains([index[0], index[-1], 'UC' + '0' * 22, 'UC' + 'z' * 22])) == [True, True, False, False]
+
+
+def test_positions_and_slices(channel_list):
+    index = ChannelIndex.from_text(channel_list[0])
+    channels = sorted(channel_list[1])
+
+    assert index[0] == channels[0] and index[-1] == channels[-1] and index[12_345] == channels[12_345]
+    assert index[100:110] == channels[100:110]
+    assert index[20_000:] == channels[20_000:]
+    assert index[::1000] == channels[::1000]
+    assert index.position(channels[500]) == 500
+    # The position of a channel not in the index is where it would be inserted
+    assert [index.position(channel) for channel in _channels(100, seed=4)] == \
+        [bisect_left(channels, channel) for channel in _channels(100, seed=4)]
+
+
+def test_set_operations_round_trip(channel_list, tmp_path):
+    index = ChannelIndex.from_text(channel_list[0])
+    channels = channel_list[1]
+    # The first 5000 lines are "scraped", and the other list overlaps with them and adds new channels
+    scraped = ChannelIndex.from_text(channel_list[0], lines=5000)
+    new = ChannelIndex.build(channels[:3000] + _channels(2000, seed=3), str(tmp_path / 'new.idx'))
+
+    union = index.union(new, str(tmp_path / 'union.idx'))
+    assert list(union) == sorted(set(index) | set(new))
+    assert len(union) == 20_815 + 2000
+
+    remaining = index.difference(scraped, str(tmp_path / 'remaining.idx'))
+    assert list(remaining) == sorted(set(index) - set(scraped))
+    assert list(remaining.union(scraped, str(tmp_path / 'all.idx'))) == list(index)
+    assert len(remaining.intersection(scraped, str(tmp_path / 'none.idx'))) == 0
+
+    assert list(index.intersection(new, str(tmp_path / 'both.idx'))) == sorted(channels[:3000])
+    assert list(union.difference(index, str(tmp_path / 'added.idx'))) == sorted(_channels(2000, seed=3))
+
+
+def test_from_lists(channel_list, tmp_path):
+    text_path, channels = channel_list
+    directory = tmp_path / 'channels'
+    os.makedirs(directory / 'checkpoints')
+    (directory / 'first.txt').write_text('\n'.join(channels[:100]) + '\n')
+    (directory / 'second.txt').write_text('\n'.join(channels[50:150]) + '\n')
+    # The checkpoints are not included
+    (directory / 'checkpoints' / 'first_checkpoint.txt').write_text('\n'.join(channels[1000:1100]) + '\n')
+
+    assert list(ChannelIndex.from_lists(str(directory))) == sorted(channels[:150])
+    assert list(ChannelIndex.from_lists(str(tmp_path / 'missing'))) == []
+
+
+def test_index_is_only_rebuilt_when_the_list_is_newer(tmp_path):
+    channels = _channels(10)
+    text_path = tmp_path / 'channels.txt'
+    text_path.write_text('\n'.join(channels[:5]) + '\n')
+    index = ChannelIndex.from_text(str(text_path))
+    os.utime(index.path, (0, os.path.getmtime(text_path) + 10))
+
+    text_path.write_text('\n'.join(channels) + '\n')
+    os.utime(text_path, (0, os.path.getmtime(index.path) - 5))
+    assert len(ChannelIndex.from_text(str(text_path))) == 5
+
+    os.utime(text_path, (0, os.path.getmtime(index.path) + 5))
+    assert len(ChannelIndex.from_text(str(text_path))) == 10
+
+
+def test_not_an_index(tmp_path):
+    (tmp_path / 'broken.idx').write_bytes(b'x' * 23)
+    with pytest.raises(ValueError):
+        ChannelIndex(str(tmp_path / 'broken.idx'))
@@ -0,0 +1,148 @@
+import os
+from datetime import datetime
+from glob import glob
+
+import pandas as pd
+import pytest
+
+import benchmarks
+import cleaning
+import columnar
+import dataset
+import fakes
+import scraping
+import thumbnails
+
+
+@pytest.fixture(scope='module')
+def videos(tmp_path_factory) -> str:
+    """
+    A master dataset of 300 synthetic videos, with their thumbnails cached.
+    """
+    directory = tmp_path_factory.mktemp('videos')
+    benchmarks.make_image_fixtures(str(directory / 'images'), n=8)
+    contents = [open(path, 'rb').read() for path in sorted(glob(str(directory / 'images' / '*.jpg')))]
+
+    channels = [f'UC{i:022d}' for i in range(30)]
+    parsed = scraping.parse_video_details(
+        scraping.iter_video_from_channels('offline', channels, how_many_videos=10, subscriber_threshold=1, batched=True,
+                                          youtube=fakes.FakeYouTube()), datetime(2021, 1, 1))
+    store = dataset.DatasetStore(str(directory / 'videos.db'))
+    store.upsert(parsed)
+    store.close()
+
+    cache = thumbnails.ThumbnailCache(str(directory / 'thumbnails'))
+    for i, url in enumerate(parsed['thumbnail']):
+        cache.put(url, contents[i % len(contents)])
+    cache.close()
+    return str(directory)
+
+
+def _options(directory: str, cache: str) -> dict:
+    return {'cache_directory': os.path.join(directory, cache), 'language_cache': None, 'annotation_cache': None,
+            'thumbnail_cache': os.path.join(directory, 'thumbnails'),
+            'scrape_runs': os.path.join(directory, 'scrape_runs.csv'), 'processes': 1}
+
+
+def _whole(videos: str, target: str = 'cleaned') -> pd.DataFrame:
+    pipeline = cleaning.build_pipeline(os.path.join(videos, 'videos.db'), fakes.FakeTranslateClient(),
+                                       fakes.FakeVisionClient(), fakes.CATEGORIES, **_options(videos, 'whole'))
+    return pipeline.run([target])[target]
+
+
+@pytest.mark.parametrize('chunk_size, chunk_workers', [(37, 1), (1000, 1), (64, 2)])
+def test_chunks_give_the_output_of_the_whole_dataset(videos, chunk_size, chunk_workers):
+    paths = cleaning.clean_in_chunks(os.path.join(videos, 'videos.db'), fakes.FakeTranslateClient(),
+                                     fakes.FakeVisionClient(), fakes.CATEGORIES, chunk_size=chunk_size,
+                                     chunk_workers=chunk_workers, **_options(videos, f'chunks_{chunk_size}'))
+
+    assert len(paths) == -(-300 // chunk_size)
+    pd.testing.assert_frame_equal(cleaning.concat_chunks(paths), _whole(videos))
+
+
+def test_chunks_of_an_intermediate_stage(videos):
+    paths = cleaning.clean_in_chunks(os.path.join(videos, 'videos.db'), fakes.FakeTranslateClient(),
+                                     fakes.FakeVisionClient(), fakes.CATEGORIES, chunk_size=50, target='parsed',
+                                     chunk_workers=1, **_options(videos, 'parsed'))
+    pd.testing.assert_frame_equal(cleaning.concat_chunks(paths), _whole(videos, 'parsed'))
+
+
+def test_chunks_are_cached(videos):
+    options = _options(videos, 'cached')
+    arguments = (os.path.join(videos, 'videos.db'), fakes.FakeTranslateClient(), fakes.FakeVisionClient(),
+                 fakes.CATEGORIES)
+    paths = cleaning.clean_in_chunks(*arguments, chunk_size=100, chunk_workers=1, **options)
+    modified = [os.path.getmtime(path) for path in paths]
+
+    vision_client = fakes.FakeVisionClient()
+    assert cleaning.clean_in_chunks(*arguments[:2], vision_client, fakes.CATEGORIES, chunk_size=100, chunk_workers=1,
+                                    **options) == paths
+    assert [os.path.getmtime(path) for path in paths] == modified
+    assert vision_client.requests == 0
+
+
+def test_write_chunks(videos, tmp_path):
+    paths = cleaning.clean_in_chunks(os.path.join(videos, 'videos.db'), fakes.FakeTranslateClient(),
+                                     fakes.FakeVisionClient(), fakes.CATEGORIES, chunk_size=37, chunk_workers=1,
+                                     **_options(videos, 'written'))
+
+    assert cleaning.write_chunks(paths, str(tmp_path / 'chunks.parquet')) == len(_whole(videos))
+    columnar.write_table(_whole(videos), str(tmp_path / 'whole.parquet'))
+    pd.testing.assert_frame_equal(columnar.read_table(str(tmp_path / 'chunks.parquet')),
+                                  columnar.read_table(str(tmp_path / 'whole.parquet')))
+
+
+def test_read_chunks(videos, tmp_path):
+    path = os.path.join(videos, 'videos.db')
+    whole = cleaning.read_videos(path)
+    pd.testing.assert_frame_equal(pd.concat(cleaning.read_chunks(path, 70)), whole)
+
+    columnar.write_table(whole, str(tmp_path / 'videos.parquet'), row_group_size=100)
+    chunks = list(cleaning.read_chunks(str(tmp_path / 'videos.parquet'), 70))
+    # A chunk does not span two row groups
+    assert [len(chunk) for chunk in chunks] == [70, 30, 70, 30, 70, 30]
+    pd.testing.assert_frame_equal(pd.concat(chunks), columnar.read_table(str(tmp_path / 'videos.parquet')))
+
+    whole.to_csv(tmp_path / 'videos.csv')
+    pd.testing.assert_frame_equal(pd.concat(cleaning.read_chunks(str(tmp_path / 'videos.csv'), 70)),
+                                  columnar.read_csv(str(tmp_path / 'videos.csv')))
+
+
+def test_published_at_and_length():
+    df = pd.DataFrame({'published_at': ['2021-01-01T10:00:00Z', '2021-01-01T10:00:00+09:00', '2020-12-31T23:59:59Z'],
+                       'scrape_time': datetime(2021, 1, 9), 'length': ['PT5M', 'PT1H3S', 'P0D']},
+                      index=['a', 'b', 'c'])
+
+    df = cleaning.parse_columns(df)
+
+    # The times with an offset are converted into UTC+0, and the timezone is dropped
+    assert str(df['published_at'].dtype) == 'datetime64[ns]'
+    assert list(df['published_at']) == [pd.Timestamp('2021-01-01 10:00'), pd.Timestamp('2021-01-01 01:00'),
+                                        pd.Timestamp('2020-12-31 23:59:59')]
+    assert list(df['hour_published']) == ['9', '0', '21']
+    assert list(df['hour_published'].cat.categories) == ['0', '3', '6', '9', '12', '15', '18', '21']
+    assert list(df['length']) == [300, 3603, 0]
+
+
+def test_videos_are_kept_by_their_own_scrape_time():
+    df = pd.DataFrame({'published_at': ['2021-01-01T00:00:00Z', '2021-01-05T12:00:00Z', '2021-01-07T12:00:00Z',
+                                        '2021-01-07T12:00:00Z', '2021-01-07T12:00:00+02:00'],
+                       'scrape_time': [datetime(2021, 1, 6), datetime(2021, 1, 6), datetime(2021, 1, 9, 11),
+                                       datetime(2021, 1, 9, 12), datetime(2021, 1, 9, 11)],
+                       'length': 'PT5M'}, index=['old', 'recent', 'edge', 'mature', 'offset'])
+
+    # Only the videos published 47 hours or more before their own scrape were scraped after their views settled
+    assert list(cleaning.parse_columns(df).index) == ['old', 'mature', 'offset']
+
+
+def test_scrape_times_of_the_old_csvs(tmp_path):
+    pd.DataFrame({'first_row': [0, 3], 'scrape_time': ['2021-01-03 00:00:00', '2021-01-10 00:00:00']}).to_csv(
+        tmp_path / 'scrape_runs.csv', index=False)
+    # Rows 0 to 2 were scraped on January 3rd and the others on January 10th, and row 1 was filtered out before
+    df = pd.DataFrame({'published_at': '2021-01-02T00:00:00Z', 'length': 'PT5M'}, index=[0, 2, 3, 4])
+    df.loc[4, 'published_at'] = '2021-01-09T00:00:00Z'
+
+    df = cleaning.parse_columns(df, str(tmp_path / 'scrape_runs.csv'))
+
+    assert list(df.index) == [3]
+    assert df.loc[3, 'scrape_time'] == pd.Timestamp('2021-01-10')
@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+import cli
+import dataset
+import fakes
+import scraping
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The slow imports that only the subcommands needing them should pay for
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'scipy', 'PIL', 'spacy', 'selenium', 'google.cloud',
+                 'googleapiclient.discovery', 'requests', 'tqdm']
+
+
+def _imported(code: str, cwd: str = ROOT) -> set:
+    """
+    Run the code in a new interpreter, and return the heavy modules it imported.
+    """
+    code += '\nimport sys\nprint(json.dumps([name for name in sys.modules]))'
+    output = subprocess.run([sys.executable, '-c', 'import json\n' + code], cwd=cwd, check=True, capture_output=True,
+                            text=True, env={**os.environ, 'PYTHONPATH': ROOT}).stdout
+    modules = set(json.loads(output.splitlines()[-1]))
+    return {name for name in HEAVY_MODULES if name in modules}
+
+
+def test_nothing_heavy_is_imported_to_parse_the_arguments():
+    code = 'import cli\n'
+    for argv in [['crawl'], ['collect', '--plan'], ['parse', 'data/raw/20201231_133112.jsonl'], ['refresh'],
+                 ['clean', '--stage', 'parsed']]:
+        code += f'cli.parser().parse_args({argv!r})\n'
+
+    assert _imported(code) == set()
+
+
+def test_parse_only_imports_what_it_needs(tmp_path):
+    channels = [f'UC{i:022d}' for i in range(3)]
+    videos = scraping.iter_video_from_channels('offline', channels, how_many_videos=10, subscriber_threshold=1,
+                                               batched=True, youtube=fakes.FakeYouTube())
+    with open(tmp_path / '20201231_133112.jsonl', 'w', encoding='utf-8') as file:
+        file.writelines(json.dumps(video) + '\n' for video in videos)
+
+    imported = _imported("import cli\ncli.main(['parse', '20201231_133112.jsonl', '--database', 'videos.db', "
+                         "'--scrape-time', '2020-12-31T05:31:12'])", cwd=str(tmp_path))
+
+    # The dataset needs pandas, but neither the clients of the APIs nor the modules of the cleaning are loaded
+    assert 'pandas' in imported
+    assert not imported & {'scipy', 'PIL', 'spacy', 'selenium', 'google.cloud', 'googleapiclient.discovery', 'requests'}
+    store = dataset.DatasetStore(str(tmp_path / 'videos.db'))
+    assert len(store.read()) == 30 and store.scrape_times() == [datetime(2020, 12, 31, 5, 31, 12)]
+    store.close()
+    assert len(os.listdir(tmp_path / 'data' / 'reports')) == 1
+
+
+def test_defaults_and_options():
+    args = cli.parser().parse_args(['clean'])
+    assert (args.stage, args.chunk_size, args.workers, args.since, args.output) == ('cleaned', 50_000, 2, None, None)
+    assert args.function is cli.clean and args.keys == 'api-key.txt'
+
+    args = cli.parser().parse_args(['collect', '--channel-list', 'channels_x', '--requests-per-second', '2.5',
+                                    '--plan', '--database', 'other.db'])
+    assert (args.channel_list, args.requests_per_second, args.plan, args.database) == ('channels_x', 2.5, True,
+                                                                                        'other.db')
+    assert cli.parser().parse_args(['clean', '--chunk-size', '0']).chunk_size == 0
+
+
+@pytest.mark.parametrize('argv', [[], ['clean', '--stage', 'unknown'], ['parse'], ['collect', '--videos', 'ten'],
+                                  ['refresh', '--database']])
+def test_invalid_arguments(argv):
+    with pytest.raises(SystemExit) as error:
+        cli.parser().parse_args(argv)
+    assert error.value.code == 2
+
+
+def test_scrape_time():
+    assert cli._scrape_time('data/raw/20201231_133112.jsonl', '2020-12-31T05:31:12') == \
+        datetime(2020, 12, 31, 5, 31, 12)
+
+    # The name of the file is the local time the scrape started
+    expected = datetime(2020, 12, 31, 13, 31, 12).astimezone(timezone.utc).replace(tzinfo=None)
+    assert cli._scrape_time('data/raw/20201231_133112.jsonl') == expected
+
+    with pytest.raises(ValueError):
+        cli._scrape_time('data/raw/videos.jsonl')
@@ -0,0 +1,37 @@
+from glob import glob
+from io import BytesIO
+
+import pytest
+
+import benchmarks
+import colors
+
+
+@pytest.fixture(scope='module')
+def contents(tmp_path_factory) -> list:
+    directory = tmp_path_factory.mktemp('images')
+    benchmarks.make_image_fixtures(str(directory), n=12)
+    return [open(path, 'rb').read() for path in sorted(glob(str(directory / '*.jpg')))]
+
+
+@pytest.mark.parametrize('quality', [1, 10, 125])
+def test_same_colours_as_colorthief(contents, quality):
+    colorthief = pytest.importorskip('colorthief')
+    expected = [colorthief.ColorThief(BytesIO(content)).get_color(quality=quality) for content in contents]
+
+    assert colors.dominant_colors(contents, quality, processes=1) == expected
+
+
+def test_missing_images(contents):
+    assert colors.dominant_colors_batch([None, b'not an image', contents[0]]) == \
+        [(), (), colors.dominant_colors_batch([contents[0]])[0]]
+
+
+def test_batches_across_processes(contents):
+    expected = colors.dominant_colors(contents, processes=1)
+
+    assert colors.dominant_colors(contents, processes=2, batch_size=5) == expected
+    with colors.make_executor(2) as executor:
+        # The pool is left open for the next calls
+        assert colors.dominant_colors(contents, batch_size=5, executor=executor) == expected
+        assert colors.dominant_colors(contents[::-1], batch_size=5, executor=executor) == expected[::-1]
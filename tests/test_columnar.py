@@ -0,0 +1,31 @@
+import pandas as pd
+
+import columnar
+
+# A row in the format of the CSVs of the earlier scripts, whose localizations were written as "dict_keys"
+BASELINE_CSV = '''\
+,title,view,like,published_at,tags,localizations,topic_categories,thumbnail_dominant_color
+abc,A title,100,5,2020-12-01T10:00:00Z,"['a', 'b']","dict_keys(['en', 'zh-TW'])",\
+['https://en.wikipedia.org/wiki/Music'],"(1, 2, 3)"
+def,Another,200,,2020-12-02T10:00:00Z,,,,
+'''
+
+
+def test_read_csv_baseline(tmp_path):
+    path = tmp_path / 'data.csv'
+    path.write_text(BASELINE_CSV)
+
+    df = columnar.read_csv(str(path))
+
+    assert df.loc['abc', 'tags'] == ['a', 'b']
+    assert df.loc['abc', 'localizations'] == ['en', 'zh-TW']
+    assert df.loc['abc', 'topic_categories'] == ['https://en.wikipedia.org/wiki/Music']
+    assert df.loc['abc', 'thumbnail_dominant_color'] == (1, 2, 3)
+    assert df.loc['def', 'localizations'] is None
+    assert pd.isna(df.loc['def', 'like'])
+    assert str(df['published_at'].dtype).startswith('datetime64')
+
+
+def test_literal_keeps_unparsable_strings():
+    assert columnar._literal('not a literal') == 'not a literal'
+    assert columnar._literal('dict_keys([])') == []
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+import fetchers
+import scraping
+from instrumentation import Instrumentation
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'channels')
+
+
+def _channel(i: int) -> str:
+    return f'UCfixture{i:015d}'
+
+
+def _crawl(depth: int, workers: int = 1, **kwargs) -> list:
+    return scraping.scrape_channel_ids([_channel(1)], depth, write_to_file=False, workers=workers,
+                                       fetcher_factory=lambda: fetchers.FileFetcher(FIXTURES), **kwargs)
+
+
+def test_extract_channel_links():
+    with open(os.path.join(FIXTURES, _channel(1) + '.html'), 'r', encoding='utf-8') as file:
+        links = fetchers.extract_channel_links(file.read())
+
+    # Relative links are resolved, and the links without the ID "channel-info" are left out
+    assert links == [fetchers.YOUTUBE_URL + '/channel/' + _channel(2), fetchers.YOUTUBE_URL + '/channel/' + _channel(3),
+                     fetchers.YOUTUBE_URL + '/c/NamedChannel', fetchers.YOUTUBE_URL + '/channel/' + _channel(1)]
+
+
+@pytest.mark.parametrize('depth, expected', [(0, [1]), (1, [1, 2, 3]), (2, [1, 2, 3, 4, 5, 6]),
+                                             (3, [1, 2, 3, 4, 5, 6, 7, 8]), (5, [1, 2, 3, 4, 5, 6, 7, 8])])
+def test_crawl_depths(depth, expected):
+    # The named channel is crawled through but not returned, and the channel without a page links no channels
+    assert _crawl(depth) == [_channel(i) for i in expected]
+
+
+@pytest.mark.parametrize('workers', [2, 8])
+def test_crawl_does_not_depend_on_the_workers(workers):
+    assert _crawl(3, workers=workers) == _crawl(3)
+
+
+def test_crawl_resumes(tmp_path):
+    frontier_path = str(tmp_path / 'frontier.db')
+    _crawl(1, frontier_path=frontier_path)
+
+    instrumentation = Instrumentation()
+    assert _crawl(3, frontier_path=frontier_path, instrumentation=instrumentation) == _crawl(3)
+    # The channel of depth 0 was processed by the first crawl, so only the channels of depths 1 and 2 are fetched
+    assert instrumentation.calls['channel_page']['calls'] == 6
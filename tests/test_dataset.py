@@ -0,0 +1,185 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import dataset
+import fakes
+import scraping
+
+FIRST = datetime(2021, 1, 1, 12)
+SECOND = datetime(2021, 1, 8, 12)
+REFRESH = datetime(2021, 1, 10, 12)
+
+
+def _videos(video_ids: list, views: list, **columns) -> pd.DataFrame:
+    df = pd.DataFrame({'title': [f'Video {video_id}' for video_id in video_ids], 'view': views, 'channel_sub': 100,
+                       'like': 10, 'dislike': 1, 'comment': 5, 'published_at': '2020-12-25T10:00:00Z',
+                       'tags': [['a', 'b']] * len(video_ids), 'dimension': '2d', 'definition': 'hd',
+                       'caption': 'false', 'category': 'Music', 'live': 0}, index=video_ids)
+    for column, value in columns.items():
+        df[column] = value
+    df['view_to_sub'] = df['view'] / df['channel_sub']
+    return df
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = dataset.DatasetStore(str(tmp_path / 'videos.db'))
+    # "b" is only scraped once, and "a" is scraped again a week later with a new title and more views
+    store.upsert(_videos(['a', 'b'], [1000, 2000]), FIRST)
+    store.upsert(_videos(['a'], [5000], title='Video a (edited)'), SECOND)
+    yield store
+    store.close()
+
+
+def test_latest_records(store):
+    df = store.read()
+
+    assert list(df.index) == ['b', 'a']
+    assert list(df['view']) == [2000, 5000]
+    assert list(df['scrape_time']) == [FIRST, SECOND]
+    assert df.loc['a', 'title'] == 'Video a (edited)'
+
+
+def test_every_record(store):
+    df = store.read(latest=False)
+
+    assert list(df.index) == ['a', 'b', 'a']
+    assert list(df['view']) == [1000, 2000, 5000]
+    assert store.video_ids() == ['a', 'b']
+    assert store.scrape_times() == [FIRST, SECOND]
+
+
+@pytest.mark.parametrize('since, until, latest, expected', [
+    (None, SECOND, True, {'a': 1000, 'b': 2000}),
+    (SECOND, None, True, {'a': 5000}),
+    (FIRST, SECOND, False, {'a': 1000, 'b': 2000}),
+    (datetime(2021, 1, 2), SECOND, True, {}),
+    # The latest record before "until" is that of the first scrape, even though "a" has a later one
+    (FIRST, datetime(2021, 1, 5), True, {'a': 1000, 'b': 2000}),
+])
+def test_since_and_until(store, since, until, latest, expected):
+    df = store.read(['view'], since=since, until=until, latest=latest)
+
+    assert dict(zip(df.index, df['view'])) == expected
+    pd.testing.assert_frame_equal(pd.concat(store.read_chunks(1, ['view'], since, until, latest)), df)
+
+
+def test_refreshed_statistics_keep_the_other_columns(store):
+    snapshots = pd.DataFrame({'view': [8000, 3000], 'like': [20, 15], 'dislike': [2, 1], 'comment': [9, 6]},
+                             index=['a', 'b'])
+    assert store.upsert_snapshots(snapshots, REFRESH) == 2
+
+    df = store.read(refreshed=True)
+
+    assert list(df['view']) == [3000, 8000]
+    assert list(df['scrape_time']) == [REFRESH, REFRESH]
+    assert list(df['view_to_sub']) == [30, 80]
+    # The fields that do not change between scrapes are those of the latest full scrape
+    assert list(df['title']) == ['Video b', 'Video a (edited)']
+    assert df.loc['a', 'tags'] == ['a', 'b'] and df.loc['a', 'category'] == 'Music'
+    assert str(df['dimension'].dtype) == 'category' and str(df['like'].dtype) == 'Int64'
+
+    # The refresh is not applied before it happened
+    df = store.read(until=REFRESH, refreshed=True)
+    assert list(df['view']) == [2000, 5000]
+    assert list(df['scrape_time']) == [FIRST, SECOND]
+
+
+def test_snapshots_time_series(store):
+    store.upsert_snapshots(pd.DataFrame({'view': [8000], 'like': [20], 'dislike': [2], 'comment': [9]}, index=['a']),
+                           REFRESH)
+    # A refresh of the same video at the same time replaces its snapshot
+    store.upsert_snapshots(pd.DataFrame({'view': [9000], 'like': [21], 'dislike': [2], 'comment': [9]}, index=['a']),
+                           REFRESH)
+
+    snapshots = store.read_snapshots()
+    assert list(snapshots.index) == ['a', 'a', 'a', 'b']
+    assert list(snapshots['view']) == [1000, 5000, 9000, 2000]
+    assert list(snapshots['scrape_time']) == [FIRST, SECOND, REFRESH, FIRST]
+
+    assert list(store.read_snapshots(['a'], since=SECOND)['view']) == [5000, 9000]
+    assert list(store.read_snapshots(until=SECOND)['view']) == [1000, 2000]
+
+
+def test_apply_snapshots_to_every_record():
+    df = _videos(['a', 'a', 'b'], [1000, 5000, 2000])
+    df['scrape_time'] = [FIRST, SECOND, FIRST]
+    snapshots = pd.DataFrame({'scrape_time': [datetime(2021, 1, 5), REFRESH], 'view': [3000, 8000], 'like': [11, 12],
+                              'dislike': [1, 1], 'comment': [5, 6]}, index=['a', 'a'])
+
+    refreshed = dataset.apply_snapshots(df, snapshots)
+
+    # Only the records older than the latest snapshot are replaced, and the input is not modified
+    assert list(refreshed['view']) == [8000, 8000, 2000]
+    assert list(refreshed['scrape_time']) == [REFRESH, REFRESH, FIRST]
+    assert list(refreshed['like']) == [12, 12, 10] and list(refreshed['title']) == list(df['title'])
+    assert list(df['view']) == [1000, 5000, 2000]
+
+
+def test_upsert_replaces_the_same_scrape(tmp_path):
+    store = dataset.DatasetStore(str(tmp_path / 'videos.db'))
+
+    assert store.upsert(_videos(['a', 'b'], [1000, 2000]), FIRST) == 2
+    # The same videos scraped again in the same run replace their records, and a new video is appended
+    assert store.upsert(_videos(['b', 'c'], [2500, 3000]), FIRST) == 2
+
+    df = store.read(latest=False)
+    assert sorted(df.index) == ['a', 'b', 'c']
+    assert dict(zip(df.index, df['view'])) == {'a': 1000, 'b': 2500, 'c': 3000}
+    store.close()
+
+    # The records are kept in the database across runs
+    store = dataset.DatasetStore(str(tmp_path / 'videos.db'))
+    store.upsert(_videos(['a'], [4000]), SECOND)
+    assert len(store.read(latest=False)) == 4 and len(store.read()) == 3
+    store.close()
+
+
+def test_upsert_with_the_scrape_time_of_each_video(tmp_path):
+    store = dataset.DatasetStore(str(tmp_path / 'videos.db'))
+    df = _videos(['a', 'b', 'a'], [1000, 2000, 5000])
+    df['scrape_time'] = [FIRST, FIRST, SECOND]
+
+    assert store.upsert(df) == 3
+
+    assert store.scrape_times() == [FIRST, SECOND]
+    assert list(store.read(latest=False)['view']) == [1000, 2000, 5000]
+    store.close()
+
+
+def test_parsed_videos_round_trip(tmp_path):
+    channels = [f'UC{i:022d}' for i in range(5)]
+    parsed = scraping.parse_video_details(
+        scraping.iter_video_from_channels('offline', channels, how_many_videos=10, subscriber_threshold=1,
+                                          batched=True, youtube=fakes.FakeYouTube()), FIRST)
+    parsed['like'] = parsed['like'].mask(parsed.index == parsed.index[0])
+    parsed.at[parsed.index[1], 'tags'] = None
+    store = dataset.DatasetStore(str(tmp_path / 'videos.db'))
+
+    store.upsert(parsed)
+    df = store.read()
+
+    # The lists, the missing counts, the categories and the times come back as they were parsed
+    pd.testing.assert_frame_equal(df.drop(columns='scrape_time'), parsed[list(dataset.COLUMNS)],
+                                  check_names=False)
+    assert df['like'].iloc[0] is pd.NA and df['tags'].iloc[1] is None
+    assert (df['scrape_time'] == FIRST).all()
+    assert store.video_ids() == list(parsed.index)
+    store.close()
+
+
+def test_scrape_times_by_row():
+    runs = pd.DataFrame({'first_row': [5131, 100, 10753], 'scrape_time': ['2021-01-06 16:00:13', '2020-12-31 05:31:12',
+                                                                          '2021-01-07 10:02:38']})
+    # The rows left after filtering, not in order, with the last row of a run and the first row of the next one
+    rows = [5131, 0, 5130, 99, 100, 20000, 10752, 10753]
+
+    scrape_times = dataset.scrape_times_by_row(rows, runs)
+
+    first, second, third = pd.to_datetime(['2020-12-31 05:31:12', '2021-01-06 16:00:13', '2021-01-07 10:02:38'])
+    assert list(scrape_times.index) == rows
+    assert scrape_times.tolist() == [second, pd.NaT, first, pd.NaT, first, third, second, third]
+    # The rows before the first run have no scrape time
+    assert scrape_times.isna().tolist() == [False, True, False, True, False, False, False, False]
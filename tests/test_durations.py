@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import durations
+
+
+@pytest.mark.parametrize('length, seconds', [
+    ('PT5M', 300),
+    ('PT1H3S', 3603),
+    ('P0D', 0),
+    ('PT1H2M3S', 3723),
+    ('PT45S', 45),
+    ('PT10H', 36000),
+    ('P1DT2H', 93600),
+    ('P2W', 1_209_600),
+    ('P1W2DT3H4M5S', 788_645),
+    ('PT0S', 0),
+])
+def test_parse_durations(length, seconds):
+    assert durations.parse_durations(pd.Series([length]))[0] == seconds
+
+
+@pytest.mark.parametrize('length', ['', 'P', 'PT', '5M', 'PT5', 'PT1.5S', 'pt5m', 'PT5M ', 'PT3S5M', 'live'])
+def test_strings_that_are_not_durations(length):
+    assert durations.parse_durations(pd.Series([length]))[0] is pd.NA
+
+
+def test_column_keeps_its_index_and_missing_values():
+    lengths = pd.Series(['PT5M', None, 'PT1H3S', 'PT5M', np.nan, 'P0D'], index=[10, 3, 7, 1, 4, 9], name='length')
+
+    seconds = durations.parse_durations(lengths)
+
+    assert str(seconds.dtype) == 'Int64' and seconds.name == 'length'
+    assert list(seconds.index) == [10, 3, 7, 1, 4, 9]
+    assert seconds.tolist() == [300, pd.NA, 3603, 300, pd.NA, 0]
+
+    assert durations.parse_durations(pd.Series([], dtype=object)).empty
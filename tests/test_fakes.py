@@ -0,0 +1,40 @@
+import benchmarks
+import fakes
+
+
+def test_translate_client():
+    client = fakes.FakeTranslateClient()
+
+    single = client.detect_language('A video about cooking pasta')
+    batch = client.detect_language(['A video about cooking pasta', 'Another video'])
+
+    assert single['input'] == 'A video about cooking pasta' and single['language']
+    assert [result['input'] for result in batch] == ['A video about cooking pasta', 'Another video']
+    assert client.requests == 2
+
+
+def test_vision_client():
+    client = fakes.FakeVisionClient()
+    requests = [{'image': {'content': b'first'}}, {'image': {'content': b'second'}},
+                {'image': {'source': {'image_uri': 'https://i.ytimg.com/vi/missing/hqdefault.jpg'}}}]
+
+    responses = client.batch_annotate_images(requests).responses
+    again = client.batch_annotate_images(requests).responses
+
+    assert len(responses) == 3 and client.requests == 2
+    # The annotations are derived from the images, so they are the same for the same images
+    assert [[object_.name for object_ in response.localized_object_annotations] for response in responses] == \
+        [[object_.name for object_ in response.localized_object_annotations] for response in again]
+    assert all(response.error.message == '' for response in responses)
+
+
+def test_benchmark_pipeline(tmp_path):
+    images = str(tmp_path / 'images')
+    benchmarks.make_image_fixtures(images, n=5)
+
+    result, = benchmarks.benchmark_pipeline(sizes=(100,), directory=str(tmp_path / 'pipeline'), images=images,
+                                            processes=1)
+
+    assert 0 < result['rows'] <= 100
+    assert result['youtube_requests'] > 0 and result['translate_requests'] > 0 and result['vision_requests'] > 0
+    assert result['cached_seconds'] < result['clean_seconds']
@@ -0,0 +1,51 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import instrumentation
+from instrumentation import Instrumentation
+
+pytestmark = pytest.mark.skipif(instrumentation.current_rss() is None, reason='The memory cannot be measured here')
+
+
+def test_stages_record_their_own_memory():
+    instruments = Instrumentation()
+
+    with instruments.stage('allocate'):
+        data = np.ones(200 * 2 ** 20 // 8)
+    del data
+
+    # The process peaked in the previous stage, which should not count in this one
+    with instruments.stage('idle'):
+        pass
+
+    allocate, idle = instruments.stages
+    assert allocate['peak_rss_delta_mb'] > 150
+    assert allocate['peak_rss_mb'] >= allocate['start_rss_mb'] + allocate['peak_rss_delta_mb'] - 1e-9
+    assert idle['peak_rss_delta_mb'] < 50
+    assert idle['peak_rss_mb'] < allocate['peak_rss_mb'] - 100
+
+
+def test_stages_record_their_children():
+    instruments = Instrumentation()
+
+    with instruments.stage('child'):
+        subprocess.run([sys.executable, '-c', 'import numpy; data = numpy.ones(300 * 2 ** 20 // 8)'], check=True)
+
+    assert instruments.stages[0]['children_peak_rss_mb'] > 250
+    # The memory of the child is not counted as the memory of the process
+    assert instruments.stages[0]['peak_rss_delta_mb'] < 100
+
+
+def test_report_columns():
+    instruments = Instrumentation('run')
+    instruments.add_stage('startup', 1.0)
+    with instruments.stage('stage', rows=10):
+        pass
+
+    startup, stage = instruments.report()
+    assert list(stage) == instrumentation.REPORT_COLUMNS
+    assert startup['peak_rss_mb'] is not None and startup['start_rss_mb'] is None
+    assert stage['rows'] == 10 and stage['start_rss_mb'] is not None
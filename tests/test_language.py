@@ -0,0 +1,103 @@
+import pytest
+
+import fakes
+import language
+from instrumentation import Instrumentation
+
+
+class RecordingTranslateClient(fakes.FakeTranslateClient):
+    """
+    Keeps the texts of every request.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    def detect_language(self, values):
+        self.batches.append(list(values))
+        return super().detect_language(values)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('How to make the best pasta in the world', 'en'),
+    ('東京の夜景をドローンで撮影してみた', 'ja'),
+    ('今日は東京へ行きます', 'ja'),
+    ('오늘의 브이로그', 'ko'),
+    ('สวัสดีครับ ทุกคน', 'th'),
+    ('Видео про котов', None),
+    ('我们的旅行视频', 'zh'),
+    ('Receta de pasta casera', None),
+    ('BTS', None),
+    ('12345 !!!', None),
+    ('', None),
+])
+def test_offline_detector(text, expected):
+    result = language.detect_language_offline(text)
+    assert (result and result['language']) == expected
+
+
+def test_batches_fit_the_limits_of_a_request():
+    texts = [f'Texte numéro {i}' for i in range(300)]
+    client = RecordingTranslateClient()
+
+    language.detect_languages(texts, client)
+    assert [len(batch) for batch in client.batches] == [128, 128, 44]
+
+    client = RecordingTranslateClient()
+    language.detect_languages(texts, client, max_bytes=1000)
+    assert all(sum(len(text.encode('utf-8')) for text in batch) <= 1000 for batch in client.batches)
+    assert [text for batch in client.batches for text in batch] == texts
+
+    # A text larger than the limit is still sent, alone
+    client = RecordingTranslateClient()
+    language.detect_languages(['x' * 50, 'y' * 2000, 'z' * 50], client, max_bytes=1000)
+    assert client.batches == [['x' * 50], ['y' * 2000], ['z' * 50]]
+
+
+def test_each_text_is_requested_once():
+    texts = ['Receta de pasta', 'Receta de pasta', 'Pasta al forno', 'Receta de pasta', '', '  ']
+    client = RecordingTranslateClient()
+
+    results = language.detect_languages(texts, client)
+
+    assert client.batches == [['Receta de pasta', 'Pasta al forno']]
+    assert results[0] == results[1] == results[3]
+    assert results[4] == results[5] == {'language': 'und', 'confidence': 0}
+
+
+def test_cache_and_offline_detector(tmp_path):
+    texts = ['Receta de pasta', 'How to make the best pasta in the world', 'パスタの作り方', 'Pasta al forno']
+    cache = language.LanguageCache(str(tmp_path / 'languages.db'))
+    instrumentation = Instrumentation()
+
+    client = RecordingTranslateClient()
+    results = language.detect_languages(texts, client, cache, offline=language.detect_language_offline,
+                                        instrumentation=instrumentation)
+
+    # Only the texts the offline detector is unsure of are sent, and charged by character
+    assert client.batches == [['Receta de pasta', 'Pasta al forno']]
+    assert [result['language'] for result in results[1:3]] == ['en', 'ja']
+    assert instrumentation.calls['translate.detect_language']['quota_units'] == len('Receta de pasta') + \
+        len('Pasta al forno')
+    # Only the results of the API are cached
+    assert set(cache.get(texts)) == {'Receta de pasta', 'Pasta al forno'}
+
+    client = RecordingTranslateClient()
+    assert language.detect_languages(texts, client, cache, offline=language.detect_language_offline) == results
+    assert client.batches == []
+
+    client = RecordingTranslateClient()
+    assert language.detect_languages(texts + ['Gnocchi'], client, cache)[:4] == results
+    assert client.batches == [['How to make the best pasta in the world', 'パスタの作り方', 'Gnocchi']]
+    cache.close()
+
+
+def test_cache_lookups_of_many_texts(tmp_path):
+    cache = language.LanguageCache(str(tmp_path / 'languages.db'))
+    texts = [f'text {i}' for i in range(1200)]
+    cache.put({text: {'language': 'fr', 'confidence': 0.5} for text in texts[::2]})
+
+    # More texts than the parameters of one SQLite query
+    assert set(cache.get(texts)) == set(texts[::2])
+    cache.close()
@@ -0,0 +1,34 @@
+import types
+
+import pandas as pd
+
+import pipeline
+
+
+def _double(df: pd.DataFrame, helpers) -> pd.DataFrame:
+    return helpers.transform(df)
+
+
+def _helpers(path, factor: int) -> types.ModuleType:
+    path.write_text(f'def transform(df):\n    return df * {factor}\n')
+    module = types.ModuleType('helpers')
+    module.__file__ = str(path)
+    exec(compile(path.read_text(), str(path), 'exec'), module.__dict__)
+    return module
+
+
+def test_key_changes_with_the_modules_of_the_stage(tmp_path):
+    helpers = _helpers(tmp_path / 'helpers.py', 2)
+    cleaning = pipeline.Pipeline(str(tmp_path / 'cache'))
+    cleaning.add('input', lambda: pd.DataFrame({'x': [1, 2]}))
+    cleaning.add('doubled', _double, inputs=['input'], modules=[helpers], resources={'helpers': helpers})
+
+    key = cleaning.keys()['doubled']
+    assert cleaning.run(['doubled'])['doubled']['x'].tolist() == [2, 4]
+    assert cleaning.keys()['doubled'] == key
+
+    # Only the helper changes, not the code of the stage
+    helpers = _helpers(tmp_path / 'helpers.py', 3)
+    cleaning.stages['doubled'].resources['helpers'] = helpers
+    assert cleaning.keys()['doubled'] != key
+    assert cleaning.run(['doubled'])['doubled']['x'].tolist() == [3, 6]
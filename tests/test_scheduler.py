@@ -0,0 +1,104 @@
+import pytest
+
+import fakes
+import scheduler
+import scraping
+
+CHANNELS = [f'UC{i:022d}' for i in range(120)]
+
+
+@pytest.fixture
+def schedule(tmp_path):
+    schedule = scheduler.QuotaScheduler(['a', 'b'], str(tmp_path / 'schedule.db'), daily_quota=100)
+    yield schedule
+    schedule.close()
+
+
+def _full_ids() -> list:
+    videos = scraping.iter_video_from_channels('offline', CHANNELS, how_many_videos=10, subscriber_threshold=1,
+                                               batched=True, youtube=fakes.FakeYouTube())
+    return [video['id'] for video in videos]
+
+
+def _run(schedule, **kwargs) -> list:
+    videos = schedule.run(CHANNELS, 'channels', how_many_videos=10, subscriber_threshold=1, **kwargs)
+    return [video['id'] for video in videos]
+
+
+def test_estimate_quota():
+    # One "channels.list" per 50 channels, one "playlistItems.list" per channel, and one "videos.list" per 50 videos
+    assert scheduler.estimate_quota(120, 10) == 3 + 120 + 24
+    assert scheduler.estimate_quota(120, 10, batched=False) == 120 * 12
+    assert scheduler.QuotaScheduler.fit(100, 120, 10) == 81
+
+
+def test_plan_follows_the_cursor_and_the_quota_left(schedule):
+    assert schedule.plan(CHANNELS, 'channels', 10) == [('a', 0, 81, 100), ('b', 81, 120, 48)]
+
+    schedule.record('a', 90)
+    schedule.advance('channels', 20)
+    assert schedule.plan(CHANNELS, 'channels', 10) == [('b', 20, 101, 100), ('a', 101, 108, 10)]
+    # The cursors of the other lists are not moved
+    assert schedule.cursor('other') == 0
+
+
+def test_run_splits_the_list_across_the_keys(schedule):
+    youtube = fakes.FakeYouTube()
+
+    assert _run(schedule, batched=True, youtube=youtube) == _full_ids()
+    assert schedule.cursor('channels') == len(CHANNELS)
+    # The quota recorded is the requests sent, not the estimates
+    assert schedule.used('a') + schedule.used('b') == youtube.requests
+    assert schedule.plan(CHANNELS, 'channels', 10) == []
+
+
+def test_run_moves_to_the_next_key_when_the_quota_is_exceeded(tmp_path, monkeypatch):
+    youtubes = {'a': fakes.FakeYouTube(quota=60), 'b': fakes.FakeYouTube()}
+    monkeypatch.setattr(scraping, 'build', lambda serviceName, version, developerKey: youtubes[developerKey])
+    schedule = scheduler.QuotaScheduler(['a', 'b'], str(tmp_path / 'schedule.db'))
+
+    ids = _run(schedule, batched=True)
+
+    assert set(ids) == set(_full_ids())
+    assert schedule.cursor('channels') == len(CHANNELS)
+    # The key refused by the API is used up for the day, and the other key only paid for what it sent
+    assert schedule.remaining('a') == 0
+    assert schedule.used('b') == youtubes['b'].requests
+    schedule.close()
+
+
+def test_run_keeps_the_key_after_a_transient_error(schedule):
+    schedule.daily_quota = scheduler.DAILY_QUOTA
+    # The first 51 requests are the channels and playlists of the first 50 channels, then their videos are requested
+    youtube = fakes.FakeYouTube(errors={53: 503})
+
+    _run(schedule, batched=True, youtube=youtube)
+
+    # Only the requests sent are recorded, the run stops at the group of channels that failed, and the other key is
+    # not touched
+    assert schedule.used('a') == youtube.requests == 53
+    assert schedule.used('b') == 0
+    assert schedule.cursor('channels') == 0
+
+    # The key is not used up, and the next run scrapes the whole list again
+    assert schedule.remaining('a') == scheduler.DAILY_QUOTA - 53
+    assert _run(schedule, batched=True, youtube=youtube) == _full_ids()
+    assert schedule.cursor('channels') == len(CHANNELS)
+    assert schedule.used('a') + schedule.used('b') == youtube.requests
+
+
+def test_report_tells_the_quota_from_other_errors():
+    report = {}
+    list(scraping.iter_video_from_channels('offline', CHANNELS, 10, 1, batched=True, report=report,
+                                           youtube=fakes.FakeYouTube(quota=60)))
+    assert report['unfinished'] and report['quota_exceeded']
+
+    report = {}
+    list(scraping.iter_video_from_channels('offline', CHANNELS, 10, 1, batched=True, report=report,
+                                           youtube=fakes.FakeYouTube(errors={53: 503})))
+    assert report['unfinished'] and not report['quota_exceeded']
+
+    report = {}
+    list(scraping.iter_video_statistics('offline', [f'video{i:06d}' for i in range(200)], report=report, workers=2,
+                                        youtube=fakes.FakeYouTube(quota=2)))
+    assert report['unfinished'] and report['quota_exceeded']
@@ -0,0 +1,257 @@
+from datetime import datetime
+from threading import Event, Thread
+from time import monotonic
+
+import pandas as pd
+import pytest
+
+import fakes
+import scheduler
+import scraping
+from instrumentation import Instrumentation
+
+CHANNELS = [f'UC{i:022d}' for i in range(120)]
+
+
+def _scrape(youtube, batched: bool, workers: int = 1, channels: list = CHANNELS) -> tuple:
+    report = {}
+    videos = list(scraping.iter_video_from_channels('offline', channels, how_many_videos=10, subscriber_threshold=1,
+                                                    batched=batched, youtube=youtube, workers=workers, report=report))
+    return [video['id'] for video in videos], report
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_batched_and_unbatched_return_the_same_videos(workers):
+    batched_ids, batched_report = _scrape(fakes.FakeYouTube(), batched=True, workers=workers)
+    unbatched_ids, unbatched_report = _scrape(fakes.FakeYouTube(), batched=False, workers=workers)
+
+    assert len(batched_ids) == len(CHANNELS) * 10
+    assert batched_ids == unbatched_ids
+    assert batched_report['videos'] == unbatched_report['videos'] == len(batched_ids)
+    assert not batched_report['unfinished'] and not unbatched_report['unfinished']
+
+
+def test_batched_requests():
+    youtube = fakes.FakeYouTube()
+    _, report = _scrape(youtube, batched=True)
+
+    # One "channels.list" per 50 channels, one "playlistItems.list" per channel, and one "videos.list" per 50 videos
+    assert youtube.requests == report['requests_made'] == report['requests_attempted'] == 3 + 120 + 24
+    assert report['requests_made'] == scheduler.estimate_quota(len(CHANNELS), 10, batched=True)
+
+    unbatched = fakes.FakeYouTube()
+    _, report = _scrape(unbatched, batched=False)
+    assert unbatched.requests == report['requests_made'] == report['requests_unbatched'] == 120 + 120 + 1200
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_partial_result_when_the_quota_runs_out(workers):
+    full_ids, _ = _scrape(fakes.FakeYouTube(), batched=True)
+
+    youtube = fakes.FakeYouTube(quota=60)
+    ids, report = _scrape(youtube, batched=True, workers=workers)
+
+    # The videos of the groups of channels finished before the quota ran out are kept, in order
+    assert 0 < len(ids) < len(full_ids)
+    assert ids == full_ids[:len(ids)]
+    assert report['unfinished']
+    assert set(report['unfinished']) <= set(CHANNELS)
+    # Every request sent is reported, including the one refused
+    assert report['requests_attempted'] == youtube.requests > 60
+
+
+class _Clock:
+    """
+    The "monotonic" and "sleep" of "scraping", with the time only moved by the sleeps.
+    """
+
+    def __init__(self, monkeypatch):
+        self.now = 0.0
+        self.sleeps = []
+        monkeypatch.setattr(scraping, 'monotonic', lambda: self.now)
+        monkeypatch.setattr(scraping, 'sleep', self.sleep)
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class _Request:
+    """
+    A request whose attempts raise the given errors in turn, then succeed.
+    """
+
+    methodId = 'youtube.videos.list'
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def execute(self):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {'items': []}
+
+
+def test_token_bucket_allows_a_burst_then_the_rate(monkeypatch):
+    clock = _Clock(monkeypatch)
+    # A rate whose waits are exact in binary, so that the fake clock adds up the sleeps exactly
+    bucket = scraping.TokenBucket(rate=8, capacity=4)
+
+    for _ in range(20):
+        bucket.acquire()
+
+    # The 4 tokens of the full bucket are taken at once, then one token every 1/8 second
+    assert clock.sleeps == [0.125] * 16
+    assert clock.now == 2
+
+    # The bucket refills while idle, but not beyond its capacity
+    clock.now += 64
+    for _ in range(4):
+        bucket.acquire()
+    assert clock.now == 66
+    bucket.acquire()
+    assert clock.now == 66.125
+
+
+def test_token_bucket_capacity_and_rate():
+    assert scraping.TokenBucket(rate=0.5).capacity == 1
+    assert scraping.TokenBucket(rate=20).capacity == 20
+    with pytest.raises(ValueError):
+        scraping.TokenBucket(rate=0)
+
+
+def test_token_bucket_is_shared_by_threads():
+    bucket = scraping.TokenBucket(rate=100, capacity=1)
+    start = monotonic()
+
+    threads = [Thread(target=lambda: [bucket.acquire() for _ in range(10)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 40 tokens at 100 per second, after the first one of the full bucket
+    assert monotonic() - start >= 0.39 - 0.01
+
+
+@pytest.mark.parametrize('status, reason, transient', [
+    (500, 'backendError', True), (503, 'backendError', True), (429, 'rateLimitExceeded', True),
+    (403, 'rateLimitExceeded', True), (403, 'userRateLimitExceeded', True), (403, 'quotaExceeded', False),
+    (403, 'forbidden', False), (404, 'channelNotFound', False), (400, 'badRequest', False),
+])
+def test_is_transient(status, reason, transient):
+    error = fakes._http_error(status, reason, 'Error')
+    assert scraping._is_transient(error) == transient
+    assert scraping._is_quota_exceeded(error) == (reason == 'quotaExceeded')
+
+
+def test_execute_retries_transient_errors_with_backoff(monkeypatch):
+    clock = _Clock(monkeypatch)
+    request = _Request(fakes._http_error(503, 'backendError', 'Backend Error'),
+                       fakes._http_error(403, 'userRateLimitExceeded', 'Rate Limit Exceeded'))
+    attempts = scraping._Counter()
+    instrumentation = Instrumentation()
+
+    response = scraping._execute(request, retries=3, backoff=0.5, attempts=attempts, instrumentation=instrumentation)
+
+    assert response == {'items': []}
+    assert clock.sleeps == [0.5, 1.0]
+    # Every attempt is charged to the quota
+    assert request.attempts == attempts.value == 3
+    assert instrumentation.calls['youtube.videos.list'] == {'calls': 3, 'quota_units': 3, 'retries': 2, 'errors': 0,
+                                                           'seconds': 0}
+
+
+def test_execute_gives_up(monkeypatch):
+    clock = _Clock(monkeypatch)
+    instrumentation = Instrumentation()
+
+    # A transient error is raised once the retries are used up
+    request = _Request(*[fakes._http_error(500, 'backendError', 'Backend Error')] * 3)
+    with pytest.raises(scraping.HttpError):
+        scraping._execute(request, retries=2, backoff=1, instrumentation=instrumentation)
+    assert request.attempts == 3 and clock.sleeps == [1, 2]
+    assert instrumentation.calls['youtube.videos.list']['errors'] == 1
+
+    # The quota and the other errors are not retried
+    for error in [fakes._http_error(403, 'quotaExceeded', 'Quota Exceeded'),
+                  fakes._http_error(404, 'videoNotFound', 'Not Found')]:
+        request = _Request(error)
+        with pytest.raises(scraping.HttpError):
+            scraping._execute(request, retries=5)
+        assert request.attempts == 1
+    assert clock.sleeps == [1, 2]
+
+
+def test_execute_stops_before_sending(monkeypatch):
+    _Clock(monkeypatch)
+    stop = Event()
+    stop.set()
+    request = _Request()
+
+    with pytest.raises(scraping._CrawlStopped):
+        scraping._execute(request, bucket=scraping.TokenBucket(rate=1), stop=stop)
+    assert request.attempts == 0
+
+
+def _details(video_id: str, views: str = '1000', **statistics) -> dict:
+    return {
+        'id': video_id,
+        'channel_subscribers': 500,
+        'statistics': {'viewCount': views, 'likeCount': '10', 'dislikeCount': '2', 'commentCount': '3', **statistics},
+        'snippet': {'title': f'Video {video_id}', 'description': '', 'publishedAt': '2020-12-25T10:00:00Z',
+                    'categoryId': '10', 'tags': ['music'],
+                    'thumbnails': {'high': {'url': f'https://i.ytimg.com/vi/{video_id}/hqdefault.jpg'}}},
+        'contentDetails': {'duration': 'PT3M20S', 'dimension': '2d', 'definition': 'hd', 'caption': 'false'},
+    }
+
+
+def test_parse_video_details_dtypes():
+    hidden = _details('hidden')
+    del hidden['statistics']['likeCount'], hidden['statistics']['dislikeCount']
+    live = _details('live', views='12345678901')
+    live['liveStreamingDetails'] = {}
+    live['localizations'] = {'fr': {}, 'de': {}}
+    live['snippet']['thumbnails']['maxres'] = {'url': 'https://i.ytimg.com/vi/live/maxresdefault.jpg'}
+    original = _details('original', views=None)
+    del original['statistics']['viewCount']
+
+    df = scraping.parse_video_details([_details('a'), hidden, live, original, _details('a', views='2000')],
+                                      datetime(2021, 1, 9, 21, 30, 12))
+
+    # The videos without views are skipped, and a video seen twice keeps its latest details
+    assert list(df.index) == ['hidden', 'live', 'a']
+    assert df.dtypes.to_dict() == {
+        'title': 'object', 'view': 'int64', 'channel_sub': 'int64', 'view_to_sub': 'float64', 'like': 'Int64',
+        'dislike': 'Int64', 'comment': 'Int64', 'length': 'object', 'description': 'object',
+        'dimension': 'category', 'definition': 'category', 'caption': 'category',
+        'published_at': 'datetime64[ns, UTC]', 'tags': 'object', 'category': 'object', 'thumbnail': 'object',
+        'localizations': 'object', 'topic_categories': 'object', 'default_language': 'object', 'live': 'int64',
+        'scrape_time': 'datetime64[ns]'}
+
+    assert list(df['view']) == [1000, 12_345_678_901, 2000]
+    assert df.loc['a', 'view_to_sub'] == 4
+    assert df.loc['hidden', 'like'] is pd.NA and df.loc['hidden', 'dislike'] is pd.NA
+    assert df.loc['hidden', 'comment'] == 3
+    assert list(df['live']) == [0, 1, 0]
+    assert df.loc['live', 'localizations'] == ['fr', 'de'] and df.loc['a', 'localizations'] is None
+    assert df.loc['live', 'thumbnail'] == 'https://i.ytimg.com/vi/live/maxresdefault.jpg'
+    assert df.loc['a', 'published_at'] == pd.Timestamp('2020-12-25T10:00:00Z')
+    assert (df['scrape_time'] == pd.Timestamp('2021-01-09 21:30:12')).all()
+
+
+def test_parse_video_details_without_videos():
+    df = scraping.parse_video_details(iter([]), datetime(2021, 1, 1))
+
+    assert df.empty
+    assert list(df.columns) == list(scraping.parse_video_details([_details('a')], datetime(2021, 1, 1)).columns)
+    assert str(df['view'].dtype) == 'int64' and str(df['like'].dtype) == 'Int64'
+
+
+def test_parse_video_statistics_has_the_dtypes_of_the_details():
+    details = scraping.parse_video_details([_details('a'), _details('b', likeCount=None)], datetime(2021, 1, 1))
+    statistics = scraping.parse_video_statistics([_details('a'), _details('b', likeCount=None)], datetime(2021, 1, 1))
+
+    pd.testing.assert_frame_equal(statistics, details[list(statistics.columns)])
@@ -0,0 +1,47 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+import benchmarks
+import colors
+import thumbnails
+
+
+def test_concurrent_puts_of_the_same_image(tmp_path):
+    cache = thumbnails.ThumbnailCache(str(tmp_path))
+    contents = [bytes([i]) * 50_000 for i in range(3)]
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        futures = [executor.submit(cache.put, f'https://i.ytimg.com/vi/{i}/maxresdefault.jpg', contents[i % 3])
+                   for i in range(480)]
+    assert all(future.exception() is None for future in futures)
+
+    assert cache.get('https://i.ytimg.com/vi/4/maxresdefault.jpg') == contents[1]
+    assert not list(tmp_path.glob('*/*.tmp'))
+    cache.close()
+
+
+def test_dominant_colors_open_the_session_and_the_processes_once(tmp_path, monkeypatch):
+    benchmarks.make_image_fixtures(str(tmp_path / 'images'), n=10)
+    contents = [open(path, 'rb').read() for path in sorted(glob(str(tmp_path / 'images' / '*.jpg')))]
+    cache = thumbnails.ThumbnailCache(str(tmp_path / 'thumbnails'))
+    urls = [f'https://i.ytimg.com/vi/{i}/hqdefault.jpg' for i in range(200)]
+    for i, url in enumerate(urls):
+        cache.put(url, contents[i % len(contents)])
+
+    calls = Counter()
+
+    def counted(function):
+        def wrapper(*args, **kwargs):
+            calls[function.__name__] += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(thumbnails, 'make_session', counted(thumbnails.make_session))
+    monkeypatch.setattr(colors, 'make_executor', counted(colors.make_executor))
+
+    result = thumbnails.dominant_colors(urls, cache, processes=2, chunk_size=70)
+
+    assert result == colors.dominant_colors([contents[i % len(contents)] for i in range(200)], processes=1)
+    assert calls == {'make_session': 1, 'make_executor': 1}
+    cache.close()
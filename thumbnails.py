@@ -0,0 +1,195 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import perf_counter
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from urllib3.util.retry import Retry
+
+import colors
+from instrumentation import Instrumentation
+
+
+class ThumbnailCache:
+    """
+    A content-addressed cache of the thumbnails on disk. Each image is stored once under the SHA-256 of its bytes, and
+    a SQLite index maps the URLs to the hashes, so that repeated runs and the different stages of the pipeline reuse the
+    same bytes. The cache can be used by several threads.
+    """
+
+    def __init__(self, directory: str = 'data/thumbnails'):
+        """
+        :param directory: Default "data/thumbnails". The directory of the cached images and their index.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = Lock()
+        self._db = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS thumbnails (url TEXT PRIMARY KEY, hash TEXT NOT NULL)')
+        self._db.commit()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest + '.jpg')
+
+    def get(self, url: str):
+        """
+        :param url: The URL of the thumbnail.
+        :return: The bytes of the image, or None if it is not cached.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT hash FROM thumbnails WHERE url = ?', (url,)).fetchone()
+        if row is None or not os.path.exists(self._path(row[0])):
+            return None
+
+        with open(self._path(row[0]), 'rb') as file:
+            return file.read()
+
+    def put(self, url: str, content: bytes) -> str:
+        """
+        :param url: The URL of the thumbnail.
+        :param content: The bytes of the image.
+        :return: The SHA-256 of the image.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._path(digest)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # Write to a temporary name first so that an interrupted write never leaves a broken image in the cache.
+            # The name is unique to the write, as several threads can put the same image at once
+            descriptor, temporary = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(content)
+            os.replace(temporary, path)
+
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO thumbnails VALUES (?, ?)', (url, digest))
+            self._db.commit()
+        return digest
+
+    def close(self):
+        self._db.close()
+
+
+def make_session(pool_size: int = 16, retries: int = 3) -> requests.Session:
+    """
+    Create a session that keeps its connections to the image server open across requests, and retries failed
+    requests with backoff.
+
+    :param pool_size: Default 16. The number of connections to keep, which should be the number of workers.
+    :param retries: Default 3. How many times to retry a failed request.
+    :return: The session.
+    """
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def download_thumbnail(url: str, session: requests.Session, cache: ThumbnailCache = None, timeout: float = 10,
+                       instrumentation: Instrumentation = None):
+    """
+    Download a thumbnail into memory, from the cache if it is cached.
+
+    :param url: The URL of the thumbnail.
+    :param session: The session to download with.
+    :param cache: Default None. If given, look up the thumbnail in the cache first, and cache the download.
+    :param timeout: Default 10. The seconds to wait for the server.
+    :param instrumentation: Default None. If given, count the downloads that are not cached as "thumbnail.download"
+      calls, with the retries of the session and the downloads that failed.
+    :return: The bytes of the image, or None if it cannot be downloaded.
+    """
+    if cache is not None:
+        content = cache.get(url)
+        if content is not None:
+            return content
+
+    start = perf_counter()
+    try:
+        response = session.get(url, timeout=timeout)
+    except requests.RequestException:
+        response = None
+
+    failed = response is None or not response.ok or not response.content
+    if instrumentation is not None:
+        retries = getattr(getattr(response, 'raw', None), 'retries', None)
+        instrumentation.count('thumbnail.download', calls=1, retries=len(retries.history) if retries else 0,
+                              errors=int(failed), seconds=perf_counter() - start)
+
+    if failed:
+        return None
+
+    if cache is not None:
+        cache.put(url, response.content)
+    return response.content
+
+
+def download_thumbnails(urls: list, cache: ThumbnailCache = None, workers: int = 16,
+                        instrumentation: Instrumentation = None, session: requests.Session = None) -> list:
+    """
+    Download the thumbnails concurrently into memory with a pooled session.
+
+    :param urls: The URLs of the thumbnails.
+    :param cache: Default None. If given, reuse and fill the thumbnail cache.
+    :param workers: Default 16. How many thumbnails to download concurrently.
+    :param instrumentation: Default None. If given, count the downloads, as in "download_thumbnail".
+    :param session: Default None. A session from "make_session" to download with, which is left open. If None, a
+      session is opened for this call.
+    :return: A list of the bytes of the images, or None for the thumbnails that failed, in the order of the URLs.
+    """
+    own_session = session is None
+    if own_session:
+        session = make_session(pool_size=workers)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        contents = list(executor.map(lambda url: download_thumbnail(url, session, cache,
+                                                                    instrumentation=instrumentation), urls))
+
+    if own_session:
+        session.close()
+    return contents
+
+
+def dominant_colors(urls: list, cache: ThumbnailCache = None, workers: int = 16, quality: int = 125,
+                    processes: int = None, chunk_size: int = 1024, instrumentation: Instrumentation = None) -> list:
+    """
+    Download the thumbnails and find their dominant colours with the NumPy engine of "colors", without writing anything
+    but the cache to disk. The thumbnails are processed in chunks so that only one chunk of images is held in memory.
+
+    :param urls: The URLs of the thumbnails.
+    :param cache: Default None. If given, reuse and fill the thumbnail cache.
+    :param workers: Default 16. How many thumbnails to download concurrently.
+    :param quality: Default 125. Only one of every this many pixels is sampled, as the "quality" of ColorThief.
+    :param processes: Default None. The number of processes finding the colours, the number of CPUs if None.
+    :param chunk_size: Default 1024. The number of thumbnails in each chunk.
+    :param instrumentation: Default None. If given, count the downloads, as in "download_thumbnail".
+    :return: A list of RGB tuples, or empty tuples for the thumbnails that failed, in the order of the URLs.
+    """
+    result = []
+
+    # The connections and the processes are kept across the chunks, rather than opened again for each one
+    session = make_session(pool_size=workers)
+    executor = None
+    # A single batch is found in this process, so no processes are started for it
+    if processes != 1 and len(urls) > colors.BATCH_SIZE:
+        executor = colors.make_executor(processes)
+
+    try:
+        for i in tqdm(range(0, len(urls), chunk_size), desc='Detecting thumbnail colour...'):
+            contents = download_thumbnails(urls[i:i + chunk_size], cache, workers, instrumentation, session=session)
+            result += colors.dominant_colors(contents, quality, processes, executor=executor)
+    finally:
+        session.close()
+        if executor is not None:
+            executor.shutdown()
+
+    return result
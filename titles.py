@@ -0,0 +1,69 @@
+import pandas as pd
+
+# The pipeline components needed for part-of-speech tags. "attribute_ruler" maps the tags to POS from spaCy 3.
+POS_COMPONENTS = ['tok2vec', 'tagger', 'attribute_ruler']
+
+
+def load_pos_tagger(model: str = 'en_core_web_sm'):
+    """
+    Load a spaCy pipeline for part-of-speech tagging.
+
+    :param model: Default "en_core_web_sm". The spaCy model.
+    :return: The spaCy pipeline.
+    """
+    # Imported here so that the other title features can be computed without spaCy
+    import spacy
+    return spacy.load(model)
+
+
+def first_word_pos(first_words: pd.Series, nlp, batch_size: int = 1000, n_process: int = 1) -> pd.Series:
+    """
+    Find the part of speech of the first token of each word. Each distinct word is only tagged once, in batches, with
+    the components not needed for tagging disabled.
+
+    :param first_words: The words, with NaN for the missing ones.
+    :param nlp: The spaCy pipeline, as returned by "load_pos_tagger".
+    :param batch_size: Default 1000. The number of words in each batch.
+    :param n_process: Default 1. The number of processes tagging the words.
+    :return: The POS of the words, with NaN for the missing ones.
+    """
+    words = list(first_words.dropna().unique())
+    unused = [name for name in nlp.pipe_names if name not in POS_COMPONENTS]
+
+    with nlp.select_pipes(disable=unused):
+        pos = {word: doc[0].pos_ if len(doc) else None
+               for word, doc in zip(words, nlp.pipe(words, batch_size=batch_size, n_process=n_process))}
+
+    return first_words.map(pos)
+
+
+def title_features(titles: pd.Series, nlp=None, batch_size: int = 1000, n_process: int = 1) -> pd.DataFrame:
+    """
+    Compute the features of the titles with vectorized string operations.
+
+    :param titles: The titles of the videos.
+    :param nlp: Default None. The spaCy pipeline for "title_first_pos", as returned by "load_pos_tagger". The column
+      is left out if None.
+    :param batch_size: Default 1000. The number of words in each batch of the POS tagging.
+    :param n_process: Default 1. The number of processes of the POS tagging.
+    :return: DataFrame with the same index as the titles, of the columns "title_length", "any_capitalized_word",
+      "all_capitalized_word" and "title_first_pos".
+    """
+    features = pd.DataFrame(index=titles.index)
+
+    ## 5a. Length
+    features['title_length'] = titles.str.len()
+
+    ## 5b. Are there any all-capital words?
+    # The words are grouped back by position, so the index of the titles does not need to be unique
+    words = titles.reset_index(drop=True).str.split().explode()
+    features['any_capitalized_word'] = (words == words.str.upper()).groupby(level=0).any().astype(int).to_numpy()
+
+    ## 5c. Is the whole title capitalized?
+    features['all_capitalized_word'] = (titles == titles.str.upper()).astype(int)
+
+    ## 5e. What word does the title start with?
+    if nlp is not None:
+        features['title_first_pos'] = first_word_pos(titles.str.split().str[0], nlp, batch_size, n_process)
+
+    return features